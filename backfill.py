@@ -0,0 +1,296 @@
+# backfill.py
+"""
+Fill in missing fact_player_season_snapshot days from Yahoo's date-scoped stats.
+
+    python backfill.py --from 2025-10-21 --to 2026-04-12 [--workers 8] [--rps 8]
+
+Yahoo can't return season totals as of a past date, only a day's box
+score (players;player_keys=.../stats;type=date;date=YYYY-MM-DD, 25
+players per request). A missing day is therefore rebuilt as the previous
+snapshot's totals plus the daily lines up to that day:
+
+    missing days are grouped into runs of consecutive days; each run
+    starts from the existing snapshot the day before it (or from zero
+    at the start of a season) and adds one day at a time
+
+A run at the start of the range is extended back to the last existing
+snapshot of the same season, since those days' lines are needed anyway
+(and they're missing too). Without any earlier snapshot in the season,
+totals count from --from, which should then be the season's first day.
+Days already in data/snapshots or in the compacted dataset are never
+fetched or overwritten; rebuilt days are written in the folder's layout
+(snapshot_schema.DAILY_SCHEMA).
+
+Every (date, batch) request goes through one fetch_engine.iter_fetch
+pool, so all dates are fetched concurrently under a single rate limit.
+Each completed day's lines are kept under CHECKPOINT_DIR/backfill until
+the day's snapshot is written, and written snapshots become the starting
+points of a rerun, so an interrupted or partly failed backfill resumes
+where it stopped. A season is ~170 days x 29 requests; at FETCH_RPS=8
+that is about 11 minutes.
+
+Percentages and A/T are recomputed from the summed made/attempted (or
+AST/TO) totals, never summed. Backfilled rows carry a snapshot_ts of
+23:59:59 UTC on their day.
+"""
+
+import os
+import sys
+import argparse
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from fetch_engine import iter_fetch
+from fetch_player_season_snapshot import PLAYERS_CSV, BATCH_SIZE, load_players
+from http_helpers import API_ROOT, RUN_STATS, yahoo_session
+from metrics import instrumented
+from scoring import RATIO_STATS, AST, TO
+from snapshot_query import cdc_days, load_series
+from snapshot_schema import SCHEMA_V2, to_v2, read_snapshot, write_snapshot, write_daily
+from snapshot_store import SNAPSHOT_DIR, daily_files, daily_path, load_manifest, season_of
+from stream_writer import CHECKPOINT_DIR
+from yahoo_utils import player_stat_pairs, players_by_key
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+BACKFILL_DIR = os.path.join(CHECKPOINT_DIR, "backfill")
+
+# Stats recomputed from two summed totals instead of being summed
+AST_TO = 20
+DERIVED = {**RATIO_STATS, AST_TO: (AST, TO)}
+
+VALUE_COLUMNS = ["stat_value", "stat_made", "stat_attempted"]
+
+
+def existing_days(snapshot_dir: str = SNAPSHOT_DIR) -> Set[str]:
+    """Days with a hot daily file, already compacted into the dataset, or in the CDC store."""
+    days = set(daily_files(snapshot_dir)) | set(load_manifest().get("sources", {}))
+    return days | set(cdc_days(snapshot_dir))
+
+
+def plan_runs(existing: Set[str], date_from: date, date_to: date) -> List[Tuple[Optional[str], List[str]]]:
+    """
+    Missing days in [date_from, date_to] as (anchor, days) runs of
+    consecutive days; anchor is the existing day just before the run, or
+    None when the run's totals start from zero.
+    """
+    earlier = [d for d in existing if d < date_from.isoformat() and season_of(d) == season_of(date_from)]
+    anchor = max(earlier) if earlier else None
+    start = date.fromisoformat(anchor) + timedelta(days=1) if anchor else date_from
+
+    runs: List[Tuple[Optional[str], List[str]]] = []
+    run = None
+    d = start
+    while d <= date_to:
+        day = d.isoformat()
+        if d > start and season_of(d) != season_of(d - timedelta(days=1)):
+            anchor, run = None, None       # a new season starts from zero
+        if day in existing:
+            anchor, run = day, None
+        elif run is None:
+            run = [day]
+            runs.append((anchor, run))
+        else:
+            run.append(day)
+        d += timedelta(days=1)
+    return runs
+
+
+def daily_url(player_keys: List[str], day: str) -> str:
+    return f"{API_ROOT}/players;player_keys={','.join(player_keys)}/stats;type=date;date={day}?format=json"
+
+
+def checkpoint_path(day: str) -> str:
+    return os.path.join(BACKFILL_DIR, f"daily_{day}.parquet")
+
+
+def snapshot_ts_of(day: str) -> datetime:
+    return datetime.combine(date.fromisoformat(day), time(23, 59, 59), tzinfo=timezone.utc)
+
+
+# ---------------- Accumulation ----------------
+def _dense(table: pa.Table, players: pd.Index, stats: pd.Index) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """[player, stat] float64 arrays of the value columns (NaN = no value) and a presence mask."""
+    shape = (len(players), len(stats))
+    present = np.zeros(shape, dtype=bool)
+    out = {c: np.full(shape, np.nan) for c in VALUE_COLUMNS}
+    if table is None or table.num_rows == 0:
+        return out, present
+    rows = players.get_indexer(table.column("player_key").cast(pa.string()).to_numpy(zero_copy_only=False))
+    cols = stats.get_indexer(table.column("stat_id").to_numpy())
+    present[rows, cols] = True
+    for c in VALUE_COLUMNS:
+        out[c][rows, cols] = table.column(c).cast(pa.float64()).to_numpy(zero_copy_only=False)
+    return out, present
+
+
+def add_day(totals: Optional[pa.Table], daily: pa.Table, day: str) -> pa.Table:
+    """
+    Season totals after `day`: totals (v2, or None for zero) plus the
+    day's lines (v2), as a v2 snapshot table for `day`. Missing values
+    add as zero; a stat stays empty only if both sides are empty.
+    """
+    tables = [t for t in (totals, daily) if t is not None]
+    players = pd.Index(sorted(set().union(*(t.column("player_key").cast(pa.string()).to_pylist() for t in tables))))
+    stats = pd.Index(sorted(set().union(*(t.column("stat_id").to_pylist() for t in tables))))
+
+    a, a_present = _dense(totals, players, stats)
+    b, b_present = _dense(daily, players, stats)
+    present = a_present | b_present
+    summed = {}
+    for c in VALUE_COLUMNS:
+        both_empty = np.isnan(a[c]) & np.isnan(b[c])
+        summed[c] = np.where(both_empty, np.nan, np.nan_to_num(a[c]) + np.nan_to_num(b[c]))
+
+    value = summed["stat_value"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for stat_id, (num, den) in DERIVED.items():
+            if stat_id in stats and num in stats and den in stats:
+                n, d = value[:, stats.get_loc(num)], value[:, stats.get_loc(den)]
+                value[:, stats.get_loc(stat_id)] = np.where(d > 0, np.round(n / d, 3), np.nan)
+
+    rows, cols = np.nonzero(present)
+    n = len(rows)
+    ints = {c: pa.array(summed[c][rows, cols], pa.float64(), from_pandas=True).cast(pa.int32())
+            for c in ("stat_made", "stat_attempted")}
+    return pa.table({
+        "snapshot_ts": pa.array([snapshot_ts_of(day)] * n, SCHEMA_V2.field("snapshot_ts").type),
+        "snapshot_date": pa.array([date.fromisoformat(day)] * n, pa.date32()),
+        "player_key": pa.DictionaryArray.from_arrays(pa.array(rows, pa.int32()), pa.array(list(players), pa.string())),
+        "stat_id": pa.array(stats.to_numpy()[cols], pa.int32()),
+        "stat_value": pa.array(value[rows, cols], pa.float64(), from_pandas=True).cast(pa.float32()),
+        **ints,
+    }, schema=SCHEMA_V2)
+
+
+def load_day(day: str, snapshot_dir: str = SNAPSHOT_DIR) -> pa.Table:
+    """An existing snapshot day, hot, compacted or rebuilt from the CDC store, as v2."""
+    path = daily_path(day, snapshot_dir)
+    if os.path.exists(path):
+        return read_snapshot(path)
+    return to_v2(load_series(date_from=day, date_to=day, columns=[f.name for f in SCHEMA_V2],
+                             snapshot_dir=snapshot_dir))
+
+
+class RunBuilder:
+    """Turns runs of fetched daily lines into snapshot files, in date order, as the lines arrive."""
+
+    def __init__(self, runs: List[Tuple[Optional[str], List[str]]], snapshot_dir: str = SNAPSHOT_DIR):
+        self.runs = runs
+        self.snapshot_dir = snapshot_dir
+        self.next = [0] * len(runs)
+        self.totals: Dict[int, Optional[pa.Table]] = {}
+        self.written: List[str] = []
+
+    def advance(self):
+        """Write every day whose lines and previous totals are both available."""
+        for i, (anchor, days) in enumerate(self.runs):
+            while self.next[i] < len(days) and os.path.exists(checkpoint_path(days[self.next[i]])):
+                if i not in self.totals:
+                    self.totals[i] = load_day(anchor, self.snapshot_dir) if anchor else None
+                day = days[self.next[i]]
+                table = add_day(self.totals[i], read_snapshot(checkpoint_path(day)), day)
+                out = daily_path(day, self.snapshot_dir)
+                if os.path.exists(out):
+                    # Written by a regular run meanwhile; real data wins
+                    logging.warning("%s appeared during the backfill, left as is", out)
+                else:
+                    write_daily(table, out)
+                    self.written.append(day)
+                os.remove(checkpoint_path(day))
+                self.totals[i] = table
+                self.next[i] += 1
+            if self.next[i] == len(days):
+                self.totals.pop(i, None)
+
+    def stuck(self) -> List[str]:
+        """First unwritten day of every unfinished run."""
+        return [days[self.next[i]] for i, (_, days) in enumerate(self.runs) if self.next[i] < len(days)]
+
+
+def backfill(session, date_from: date, date_to: date, players: List[Dict], workers: Optional[int] = None,
+             rps: Optional[float] = None, snapshot_dir: str = SNAPSHOT_DIR) -> Dict:
+    """Fetch and write the missing days; returns {"days", "written", "requests", "failed"}."""
+    runs = plan_runs(existing_days(snapshot_dir), date_from, date_to)
+    days = [d for _, run in runs for d in run]
+    if not days:
+        logging.info("No missing days between %s and %s", date_from, date_to)
+        return {"days": 0, "written": 0, "requests": 0, "failed": []}
+    for anchor, run in runs:
+        logging.info("Backfilling %s..%s (%d days) from %s", run[0], run[-1], len(run),
+                     anchor or "zero totals")
+
+    os.makedirs(BACKFILL_DIR, exist_ok=True)
+    os.makedirs(snapshot_dir, exist_ok=True)
+    player_keys = [p["player_key"] for p in players]
+    batches = [player_keys[i:i + BATCH_SIZE] for i in range(0, len(player_keys), BATCH_SIZE)]
+    jobs = [(d, batch) for d in days if not os.path.exists(checkpoint_path(d)) for batch in batches]
+
+    builder = RunBuilder(runs, snapshot_dir)
+    builder.advance()      # days fetched by an interrupted run
+    logging.info("Fetching %d days x %d players in %d requests",
+                 len(jobs) // max(1, len(batches)), len(player_keys), len(jobs))
+
+    remaining = defaultdict(int)
+    for d, _ in jobs:
+        remaining[d] += 1
+    rows: Dict[str, List[Dict]] = defaultdict(list)
+    failed: Set[str] = set()
+    urls = [daily_url(batch, d) for d, batch in jobs]
+    keys = [f"{d}/{batch[0]}" for d, batch in jobs]
+
+    for (d, batch), res in zip(jobs, iter_fetch(session, urls, workers=workers, rps=rps, keys=keys)):
+        if not res.ok:
+            logging.error("Failed to fetch %s for batch %s..", d, batch[0])
+            failed.add(d)
+        elif d not in failed:
+            found = players_by_key(res.data.get("fantasy_content", {}).get("players"))
+            for pk in batch:
+                for stat_id, value in player_stat_pairs(found.get(pk, [])):
+                    rows[d].append({"snapshot_ts": snapshot_ts_of(d), "snapshot_date": d, "player_key": pk,
+                                    "stat_id": stat_id, "stat_value": value})
+        remaining[d] -= 1
+        if remaining[d] == 0:
+            day_rows = rows.pop(d, [])
+            if d not in failed:
+                write_snapshot(to_v2(pa.Table.from_pylist(day_rows)) if day_rows else SCHEMA_V2.empty_table(),
+                               checkpoint_path(d), sort=False)
+                builder.advance()
+
+    for day in builder.stuck():
+        logging.error("Stopped at %s; rerun to resume from there", day)
+    logging.info("Wrote %d of %d missing days", len(builder.written), len(days))
+    return {"days": len(days), "written": len(builder.written), "requests": len(jobs), "failed": sorted(failed)}
+
+
+@instrumented("backfill")
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Backfill missing season snapshot days from date-scoped stats")
+    ap.add_argument("--from", dest="date_from", required=True, type=date.fromisoformat)
+    ap.add_argument("--to", dest="date_to", type=date.fromisoformat,
+                    default=datetime.now(timezone.utc).date() - timedelta(days=1))
+    ap.add_argument("--workers", type=int, help="concurrent requests (default FETCH_WORKERS)")
+    ap.add_argument("--rps", type=float, help="global request rate (default FETCH_RPS)")
+    args = ap.parse_args(argv)
+
+    if not os.environ.get("LEAGUE_KEY"):
+        logging.error("LEAGUE_KEY env var not set")
+        return 2
+    players = load_players()
+    if players is None:
+        logging.error("%s not found, run fetch_players.py first", PLAYERS_CSV)
+        return 1
+
+    result = backfill(yahoo_session(), args.date_from, args.date_to, players, args.workers, args.rps)
+    RUN_STATS.log_summary()
+    return 1 if result["written"] < result["days"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# bench_extract.py
+"""
+Benchmark: yahoo_extract.Extractor vs the recursive find_all parsing.
+
+    python bench_extract.py [--rounds 7] [--min-time 0.2]
+    python bench_extract.py --archive data/raw/2026-01-17/fetch_player_season_snapshot_101500Z_4242.zst
+
+Payloads are the responses the fetch scripts parse: a league players page
+(fetch_players.parse_page) and a players;player_keys=...;out=stats batch
+(yahoo_utils.players_by_key + player_stat_pairs). By default they come
+from yahoo_stub.py's fixtures, which are in Yahoo's own shape; with
+--archive they are the bodies recorded in raw archives (raw_archive.py),
+i.e. real API responses. Both parsers must return the same values on
+every payload; then each is timed (best of several interleaved rounds).
+"""
+
+import sys
+import json
+import time
+import argparse
+from typing import Dict, List
+
+from yahoo_utils import as_list, first_dict, find_all
+from yahoo_extract import Extractor, find_records
+
+PLAYER_FIELDS = Extractor({
+    "player_key": "player_key",
+    "player_id": "player_id",
+    "editorial_player_key": "editorial_player_key",
+    "player_name": "name.full",
+})
+PLAYER_STATS = Extractor({"stats": "player_stats.stats.stat[*]"})
+PLAYER_KEY = Extractor({"player_key": "player_key"})
+
+
+# ---------------- League players page ----------------
+def page_find_all(data):
+    league_list = as_list(data.get("fantasy_content", {}).get("league"))
+    rows = []
+    for cand in find_all(league_list[1:2], "player"):
+        for wrapper in (cand if isinstance(cand, list) else [cand]):
+            row = dict.fromkeys(("player_key", "player_id", "editorial_player_key", "player_name"))
+            for frag in (wrapper if isinstance(wrapper, list) else [wrapper]):
+                if not isinstance(frag, dict):
+                    continue
+                for f in ("player_key", "player_id", "editorial_player_key"):
+                    row[f] = frag.get(f) or row[f]
+                if "name" in frag:
+                    row["player_name"] = first_dict(frag.get("name")).get("full") or row["player_name"]
+            if row["player_key"]:
+                rows.append(row)
+    return rows
+
+
+def page_extract(data):
+    league_list = as_list(data.get("fantasy_content", {}).get("league"))
+    return [p for p in PLAYER_FIELDS.each(league_list[1:2], "player") if p["player_key"]]
+
+
+# ---------------- players;out=stats batch ----------------
+def stats_find_all(data):
+    out = []
+    for player_nodes in find_all(data.get("fantasy_content", {}).get("players"), "player"):
+        player_nodes = as_list(player_nodes)
+        keys = find_all(player_nodes[:1], "player_key")
+        if not keys or len(player_nodes) < 2:
+            continue
+        pairs = []
+        for sl in find_all(first_dict(player_nodes[1]).get("player_stats"), "stat"):
+            for item in (sl if isinstance(sl, list) else [sl]):
+                s = first_dict(item)
+                if s.get("stat_id") is not None:
+                    pairs.append((int(s["stat_id"]), s.get("value")))
+        out.append((keys[0], pairs))
+    return out
+
+
+def stats_extract(data):
+    out = []
+    for player_nodes in find_records(data.get("fantasy_content", {}).get("players"), "player"):
+        player_nodes = as_list(player_nodes)
+        key = PLAYER_KEY.extract(player_nodes[:1])["player_key"]
+        if key is None or len(player_nodes) < 2:
+            continue
+        pairs = []
+        for item in PLAYER_STATS.extract(first_dict(player_nodes[1]))["stats"]:
+            s = first_dict(item)
+            if s.get("stat_id") is not None:
+                pairs.append((int(s["stat_id"]), s.get("value")))
+        out.append((key, pairs))
+    return out
+
+
+KINDS = {
+    "players page": (page_find_all, page_extract),
+    "out=stats batch": (stats_find_all, stats_extract),
+}
+
+
+def kind_of(url: str):
+    if "/players;" in url and "/league/" in url:
+        return "players page"
+    if "/players;player_keys=" in url and "stats" in url:
+        return "out=stats batch"
+    return None
+
+
+def stub_payloads() -> Dict[str, List]:
+    from yahoo_stub import YahooStub, load_fixtures
+    stub = YahooStub(load_fixtures())
+    league = stub.league["league_key"]
+    keys = list(stub.meta)
+    out = {"players page": [], "out=stats batch": []}
+    for start in range(0, len(keys), 25):
+        out["players page"].append(stub.respond(f"/league/{league}/players;status=ALL;start={start};count=25"))
+        out["out=stats batch"].append(stub.respond(f"/players;player_keys={','.join(keys[start:start + 25])};out=stats"))
+    return out
+
+
+def archive_payloads(archives: List[str]) -> Dict[str, List]:
+    from raw_archive import ArchiveReader, read_index
+    out = {k: [] for k in KINDS}
+    for archive in archives:
+        reader = ArchiveReader(archive)
+        _, entries = read_index(archive)
+        for e in entries:
+            kind = kind_of(e["url"])
+            if kind:
+                out[kind].append(json.loads(reader.body(e["url"])))
+    return out
+
+
+def bench(fns, payloads, rounds: int, min_time: float):
+    """Best of `rounds` interleaved rounds per function, in seconds per payload."""
+    n = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            for p in payloads:
+                fns[0](p)
+        if time.perf_counter() - t0 >= min_time:
+            break
+        n *= 2
+    best = [float("inf")] * len(fns)
+    for _ in range(rounds):
+        for j, fn in enumerate(fns):
+            t0 = time.perf_counter()
+            for _ in range(n):
+                for p in payloads:
+                    fn(p)
+            best[j] = min(best[j], (time.perf_counter() - t0) / (n * len(payloads)))
+    return best
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--archive", nargs="*", help="raw archives to take payloads from (default: stub fixtures)")
+    ap.add_argument("--rounds", type=int, default=7)
+    ap.add_argument("--min-time", type=float, default=0.2, help="seconds per round, roughly")
+    args = ap.parse_args(argv)
+
+    payloads = archive_payloads(args.archive) if args.archive else stub_payloads()
+    status = 0
+    print(f"{'payload':<18}{'n':>5}{'find_all ms':>13}{'Extractor ms':>14}{'speedup':>9}")
+    for kind, (old_fn, new_fn) in KINDS.items():
+        pages = payloads.get(kind) or []
+        if not pages:
+            continue
+        if any(old_fn(p) != new_fn(p) for p in pages):
+            print(f"{kind}: MISMATCH between find_all and Extractor output")
+            status = 1
+            continue
+        old, new = bench([old_fn, new_fn], pages, args.rounds, args.min_time)
+        print(f"{kind:<18}{len(pages):>5}{old * 1e3:>13.3f}{new * 1e3:>14.3f}{old / new:>8.2f}x")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# bench_fetch.py
+"""
+End-to-end benchmark of the fetch_*.py scripts against yahoo_stub.py.
+
+    python bench_fetch.py [--latency-ms 40] [--rate-429 0.02] [--out bench_fetch.json]
+                          [--baseline old.json] [--threshold 0.2] [--env FETCH_RPS=8]
+
+Starts the stub on a free port from fixtures/yahoo, then runs every script
+in SCRIPTS in order in one scratch directory (later scripts read the
+CSVs earlier ones wrote), each in its own interpreter under cProfile,
+with YAHOO_API_ROOT pointed at the stub and YAHOO_OFFLINE=1. Per script:
+
+    requests, throttled   counted by the stub
+    wall_s                time inside the script (cProfile overhead included)
+    parse_s               JSON decoding plus the yahoo_* / parse* functions
+    write_s               write* functions, CSV writers and Parquet/IPC writers
+    peak_rss_mb           the script process's maximum resident set size
+
+Every thread is profiled (the fetch engine decodes JSON on its workers),
+so parse_s/write_s are CPU-ish sums across threads and can exceed wall_s.
+Results are written as JSON; with --baseline, metrics that got worse by
+more than --threshold are listed and the exit status is 1. FETCH_RPS
+defaults to 0 (no client-side rate limit) so the numbers measure the
+code rather than the limiter.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import logging
+import tempfile
+import platform
+import threading
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+REPO = os.path.dirname(os.path.abspath(__file__))
+
+# (script, extra env); fetch_players_and_stats.py goes first because
+# fetch_players.py rewrites league_players.csv with the full league
+SCRIPTS = [
+    ("fetch_players_and_stats.py", {"PLAYERS_MODE": "full"}),
+    ("fetch_players.py", {"PLAYERS_MODE": "full"}),
+    ("fetch_rosters_and_standings.py", {}),
+    ("fetch_team_roster_snapshot.py", {}),
+    ("fetch_player_season_snapshot.py", {}),
+    ("fetch_full_player_stats.py", {}),
+]
+
+METRICS = ["requests", "wall_s", "parse_s", "write_s", "peak_rss_mb"]
+NOISE_S = 0.1
+
+PARSE_MODULES = {"yahoo_utils.py", "yahoo_helpers.py", "yahoo_normalize.py"}
+WRITE_MODULES = {"safe_io.py", "stream_writer.py", "snapshot_upsert.py", "snapshot_delta.py",
+                 "roster_history.py", "latest_state.py"}
+
+
+# ---------------- Child: run one script under cProfile ----------------
+def _is_parse(func) -> bool:
+    filename, _, name = func
+    base = os.path.basename(filename)
+    in_repo = filename.startswith(REPO)
+    return (base in PARSE_MODULES and in_repo) or (in_repo and name.startswith("parse")) \
+        or (filename.endswith(os.path.join("requests", "models.py")) and name == "json") \
+        or (filename.endswith(os.path.join("json", "__init__.py")) and name == "loads")
+
+
+def _is_write(func) -> bool:
+    filename, _, name = func
+    base = os.path.basename(filename)
+    in_repo = filename.startswith(REPO)
+    return (base in WRITE_MODULES and in_repo) or (in_repo and name.startswith("write")) \
+        or (base == "csv.py" and name.startswith("write")) or "_csv.writer" in name \
+        or (filename.endswith(os.path.join("pyarrow", "parquet", "core.py")) and name.startswith("write")) \
+        or "RecordBatchFileWriter" in name
+
+
+def group_seconds(stats: Dict, pred) -> float:
+    """
+    Time spent inside functions matching pred, counted where the call
+    enters the group from outside it, so nested calls aren't double counted.
+    """
+    total = 0.0
+    for func, (_, _, _, cumtime, callers) in stats.items():
+        if not pred(func):
+            continue
+        if not callers:
+            total += cumtime
+        for caller, edge in callers.items():
+            if not pred(caller):
+                total += edge[3]
+    return total
+
+
+def run_child(script: str, result_path: str) -> int:
+    import cProfile
+    import pstats
+    import resource
+    import runpy
+
+    profiles: List = []
+    lock = threading.Lock()
+
+    def start_thread_profile(*_):
+        # Runs once per new thread, then hands over to the C profiler
+        prof = cProfile.Profile()
+        with lock:
+            profiles.append(prof)
+        prof.enable()
+
+    main_prof = cProfile.Profile()
+    threading.setprofile(start_thread_profile)
+    sys.argv = [script]
+    code = 0
+    t0 = time.perf_counter()
+    main_prof.enable()
+    try:
+        runpy.run_path(os.path.join(REPO, script), run_name="__main__")
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        main_prof.disable()
+        threading.setprofile(None)
+    wall = time.perf_counter() - t0
+
+    merged = pstats.Stats(main_prof)
+    for prof in profiles:
+        merged.add(prof)
+    result = {
+        "exit_code": code,
+        "wall_s": round(wall, 3),
+        "parse_s": round(group_seconds(merged.stats, _is_parse), 3),
+        "write_s": round(group_seconds(merged.stats, _is_write), 3),
+        # ru_maxrss is KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    return 0
+
+
+# ---------------- Parent ----------------
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Human-readable regressions of results against baseline."""
+    out = []
+    for script, new in results["scripts"].items():
+        old = baseline.get("scripts", {}).get(script)
+        if not old:
+            continue
+        for m in METRICS:
+            a, b = old.get(m), new.get(m)
+            if a is None or b is None:
+                continue
+            # Timing differences under NOISE_S are run-to-run jitter
+            if b > a * (1 + threshold) and b - a > (NOISE_S if m.endswith("_s") else 0):
+                out.append(f"{script}: {m} {a} -> {b} (+{(b / a - 1) * 100 if a else float('inf'):.0f}%)")
+    return out
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the fetch scripts against the local API stub")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--result", help=argparse.SUPPRESS)
+    ap.add_argument("--scripts", help="comma-separated subset of the scripts to run")
+    ap.add_argument("--fixtures", default=os.path.join(REPO, "fixtures", "yahoo"))
+    ap.add_argument("--latency-ms", type=float, default=40.0)
+    ap.add_argument("--jitter-ms", type=float, default=10.0)
+    ap.add_argument("--rate-429", type=float, default=0.02)
+    ap.add_argument("--retry-after", type=float, default=0.5)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--env", action="append", default=[], help="KEY=VALUE passed to every script")
+    ap.add_argument("--out", default="bench_fetch.json")
+    ap.add_argument("--baseline", help="earlier results JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown")
+    ap.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    args = ap.parse_args(argv)
+
+    if args.child:
+        return run_child(args.child, args.result)
+
+    from yahoo_stub import load_fixtures, serve
+
+    scripts = SCRIPTS
+    if args.scripts:
+        wanted = set(args.scripts.split(","))
+        scripts = [s for s in SCRIPTS if s[0] in wanted]
+    fixtures = load_fixtures(args.fixtures)
+    server = serve(fixtures, port=0, latency=args.latency_ms / 1e3, jitter=args.jitter_ms / 1e3,
+                   rate_429=args.rate_429, retry_after=args.retry_after, seed=args.seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    workdir = tempfile.mkdtemp(prefix="bench_fetch_")
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [REPO, os.environ.get("PYTHONPATH")])),
+        "YAHOO_API_ROOT": server.api_root,
+        "YAHOO_OFFLINE": "1",
+        "LEAGUE_KEY": fixtures["league"]["league_key"],
+        "FETCH_RPS": "0",
+    }
+    env.pop("HTTP_CACHE_DIR", None)
+    env.update(kv.split("=", 1) for kv in args.env)
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git": _git_rev(),
+        "python": platform.python_version(),
+        "stub": {"latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "rate_429": args.rate_429,
+                 "retry_after": args.retry_after, "seed": args.seed},
+        "env": dict(kv.split("=", 1) for kv in args.env),
+        "scripts": {},
+    }
+    failed = []
+    try:
+        for script, extra in scripts:
+            before = server.stats.snapshot()
+            result_path = os.path.join(workdir, f".{script}.json")
+            log_path = os.path.join(workdir, f"{script}.log")
+            with open(log_path, "w", encoding="utf-8") as log:
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", script, "--result", result_path],
+                    cwd=workdir, env={**env, **extra}, stdout=log, stderr=subprocess.STDOUT,
+                )
+            after = server.stats.snapshot()
+            if proc.returncode != 0 or not os.path.exists(result_path):
+                logging.error("%s crashed (exit %s), see %s", script, proc.returncode, log_path)
+                failed.append(script)
+                continue
+            with open(result_path, encoding="utf-8") as f:
+                r = json.load(f)
+            r["requests"] = after["requests"] - before["requests"]
+            r["throttled"] = after["throttled"] - before["throttled"]
+            results["scripts"][script] = r
+            if r["exit_code"] != 0:
+                failed.append(script)
+            logging.info("%s: %d requests (%d throttled), %.2fs wall, %.2fs parse, %.2fs write, %.0f MB peak",
+                         script, r["requests"], r["throttled"], r["wall_s"], r["parse_s"], r["write_s"],
+                         r["peak_rss_mb"])
+    finally:
+        server.shutdown()
+        if not args.keep and not failed:
+            shutil.rmtree(workdir, ignore_errors=True)
+        elif failed:
+            logging.info("Scratch directory kept: %s", workdir)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n{'script':34s} {'req':>5s} {'429':>4s} {'wall s':>7s} {'parse s':>8s} {'write s':>8s} {'peak MB':>8s}")
+    for script, r in results["scripts"].items():
+        print(f"{script:34s} {r['requests']:5d} {r['throttled']:4d} {r['wall_s']:7.2f} "
+              f"{r['parse_s']:8.2f} {r['write_s']:8.2f} {r['peak_rss_mb']:8.0f}")
+    print(f"Results written to {args.out}")
+
+    status = 1 if failed else 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            status = 1
+        else:
+            print(f"No regressions against {args.baseline} (threshold {args.threshold:.0%})")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# bench_query_service.py
+"""
+Load test for query_service.py: concurrent clients, p50/p99 per endpoint.
+
+    python bench_query_service.py [--clients 16] [--requests 200] [--url http://127.0.0.1:8765]
+
+Without --url the service is started as a subprocess on a free port
+against the local data (in-process it would share the GIL with the
+clients and skew the numbers). Each client thread keeps one HTTP/1.1
+connection and cycles through a mix of leaderboard, trend, team totals
+and free-agent requests; latency is measured per request on the client
+side.
+"""
+
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+from collections import defaultdict
+from http.client import HTTPConnection
+from urllib.parse import urlparse
+
+import numpy as np
+
+
+def request_mix(health: dict, players: list, teams: list) -> list:
+    """(endpoint label, path) pairs to cycle through."""
+    latest = health["latest"]
+    mix = [
+        ("leaderboard", "/leaderboard?stat=12&limit=20"),
+        ("leaderboard", "/leaderboard?stat=5&limit=20"),
+        ("leaderboard", f"/leaderboard?stat=15&per_game=1&date={latest}"),
+        ("free_agents", "/free-agents?stat=16&limit=20"),
+        ("teams_totals", "/teams/totals"),
+    ]
+    mix += [("trend", f"/players/{p}/trend?stat=12,15,16") for p in players[:20]]
+    mix += [("team_totals", f"/teams/{t}/totals") for t in teams[:5]]
+    return mix
+
+
+def client(host: str, port: int, mix: list, n: int, seed: int, out: dict, lock: threading.Lock):
+    rng = random.Random(seed)
+    conn = HTTPConnection(host, port, timeout=30)
+    local = defaultdict(list)
+    for _ in range(n):
+        label, path = rng.choice(mix)
+        t0 = time.perf_counter()
+        conn.request("GET", path)
+        resp = conn.getresponse()
+        resp.read()
+        local[label].append((time.perf_counter() - t0) * 1e3)
+        if resp.status != 200:
+            local["errors"].append(0.0)
+    conn.close()
+    with lock:
+        for k, v in local.items():
+            out[k].extend(v)
+
+
+def start_service() -> tuple:
+    """Launch query_service.py on a free port; returns (process, port) once /health answers."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, "query_service.py", "--port", str(port)])
+    for _ in range(600):
+        try:
+            get_json("127.0.0.1", port, "/health")
+            return proc, port
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError("query_service.py exited during startup")
+            time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("query_service.py did not come up")
+
+
+def get_json(host: str, port: int, path: str):
+    conn = HTTPConnection(host, port, timeout=30)
+    conn.request("GET", path)
+    body = json.loads(conn.getresponse().read())
+    conn.close()
+    return body
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load-test the local query service")
+    ap.add_argument("--url", help="running service (default: start one as a subprocess)")
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--requests", type=int, default=200, help="requests per client")
+    args = ap.parse_args(argv)
+
+    proc = None
+    if args.url:
+        u = urlparse(args.url)
+        host, port = u.hostname, u.port or 80
+    else:
+        proc, port = start_service()
+        host = "127.0.0.1"
+
+    health = get_json(host, port, "/health")
+    players = [r["player_key"] for r in get_json(host, port, "/leaderboard?stat=12&limit=40")["rows"]]
+    teams = [t["team_key"] for t in get_json(host, port, "/teams/totals")["teams"]]
+    mix = request_mix(health, players, teams)
+
+    latencies = defaultdict(list)
+    lock = threading.Lock()
+    threads = [threading.Thread(target=client, args=(host, port, mix, args.requests, i, latencies, lock))
+               for i in range(args.clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    errors = len(latencies.pop("errors", []))
+    everything = [x for v in latencies.values() for x in v]
+    print(f"{health['dates']} dates x {health['players']} players; "
+          f"{args.clients} clients x {args.requests} requests in {wall:.2f}s "
+          f"({len(everything) / wall:.0f} req/s, {errors} errors)")
+    print(f"{'endpoint':14s} {'n':>6s} {'p50 ms':>8s} {'p99 ms':>8s}")
+    for label, v in sorted(latencies.items()) + [("all", everything)]:
+        print(f"{label:14s} {len(v):6d} {np.percentile(v, 50):8.2f} {np.percentile(v, 99):8.2f}")
+
+    if proc is not None:
+        proc.terminate()
+        proc.wait()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,301 @@
+# bi_export.py
+"""
+Star-schema export for the Power BI model.
+
+    python bi_export.py [--out data/bi] [--full]
+
+Writes a small, pre-joined model under data/bi so the .pbix refresh reads
+a handful of files instead of every daily snapshot and CSV:
+
+    dim_player.parquet   dim_team.parquet   dim_stat.parquet   dim_date.parquet
+    fact_player_stat_daily/month=YYYY-MM/part-0.parquet
+        one row per (snapshot_date, player_key): a column per stat (season
+        to date), plus z_total and fantasy_points from scoring.py
+    fact_player_stat_weekly/season=YYYY-YY/part-0.parquet
+        per (week_start, player_key) increments of the additive stats, with
+        FG%/FT%/3PT% rebuilt from the weekly made/attempted
+    fact_team_stat_weekly/season=YYYY-YY/part-0.parquet
+        the weekly player rows summed by the team each player was on at the
+        end of the week (roster_history.py)
+
+Daily partitions are rebuilt only when the snapshot files behind their
+month change (sizes/mtimes from snapshot_query's index plus the CDC files
+behind days only data/snapshot_deltas holds, kept in _manifest.json); weekly rollups only for seasons with a rebuilt month.
+Dimensions are tiny and rewritten every run.
+"""
+
+import os
+import sys
+import json
+import argparse
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from snapshot_store import season_of
+from snapshot_query import build_index, cdc_days, load_series
+from scoring import STAT_NAMES, RATIO_STATS, NINE_CAT, build_cube, zscores, points
+from daily_delta import NON_ADDITIVE_STATS
+import roster_history
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+BI_DIR = "data/bi"
+MANIFEST_NAME = "_manifest.json"
+PART_FILE = "part-0.parquet"
+PLAYERS_CSV = "league_players.csv"
+STANDINGS_CSV = "team_standings.csv"
+DIM_PATH = "data/dim_player.parquet"        # fetch_players.py's player dimension
+
+DAILY = "fact_player_stat_daily"
+WEEKLY = "fact_player_stat_weekly"
+TEAM_WEEKLY = "fact_team_stat_weekly"
+
+
+def stat_column(stat_id: int) -> str:
+    """Wide-table column name for a stat id (FG% -> FG_PCT, unknown -> STAT_<id>)."""
+    name = STAT_NAMES.get(int(stat_id))
+    return name.replace("%", "_PCT") if name else f"STAT_{int(stat_id)}"
+
+
+def _write(table: pa.Table, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression="snappy")
+    os.replace(tmp, path)
+
+
+def _partition(out: str, fact: str, key: str, value: str) -> str:
+    return os.path.join(out, fact, f"{key}={value}", PART_FILE)
+
+
+# ---------------- Manifest ----------------
+def month_fingerprints(index: Dict, cdc: Optional[Dict[str, List[str]]] = None) -> Dict[str, Dict]:
+    """
+    month -> {source path: [size, mtime_ns]} for every snapshot file
+    overlapping it, plus the checkpoint/delta files behind its CDC-only
+    days (`cdc`, from snapshot_query.cdc_days).
+    """
+    months: Dict[str, Dict] = {}
+    for path, entry in index["files"].items():
+        if not entry["min_date"]:
+            continue
+        d = date.fromisoformat(entry["min_date"]).replace(day=1)
+        end = date.fromisoformat(entry["max_date"])
+        while d <= end:
+            months.setdefault(d.strftime("%Y-%m"), {})[path] = [entry["size"], entry["mtime_ns"]]
+            d = (d + timedelta(days=32)).replace(day=1)
+    for day, paths in (cdc or {}).items():
+        for path in paths:
+            st = os.stat(path)
+            months.setdefault(day[:7], {})[path] = [st.st_size, st.st_mtime_ns]
+    return months
+
+
+def load_manifest(out: str) -> Dict:
+    try:
+        with open(os.path.join(out, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"months": {}}
+
+
+def save_manifest(manifest: Dict, out: str):
+    path = os.path.join(out, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# ---------------- Facts ----------------
+def daily_month(month: str):
+    """Wide daily fact for one YYYY-MM month, and the stat ids it holds."""
+    first = date.fromisoformat(f"{month}-01")
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    cube = build_cube(load_series(date_from=first.isoformat(), date_to=last.isoformat(), sort=False))
+    if not cube.players:
+        return pa.table({}), []
+
+    # Rows: every (date, player) with at least one stat value
+    d_idx, p_idx = np.nonzero(~np.isnan(cube.values).all(axis=2))
+    _, z_total = zscores(cube, NINE_CAT)
+    fp = points(cube)
+
+    cols = {
+        "snapshot_date": pa.array(cube.dates[d_idx], pa.date32()),
+        "player_key": pa.array(cube.players, pa.string()).take(pa.array(p_idx)),
+    }
+    for s, stat_id in enumerate(cube.stat_ids):
+        cols[stat_column(stat_id)] = pa.array(cube.values[d_idx, p_idx, s], from_pandas=True)
+    cols["z_total"] = pa.array(z_total[d_idx, p_idx], from_pandas=True)
+    cols["fantasy_points"] = pa.array(fp[d_idx, p_idx].astype(np.float32))
+    return pa.table(cols), [int(s) for s in cube.stat_ids]
+
+
+def _with_ratios(df: pd.DataFrame) -> pd.DataFrame:
+    for pct, (made, att) in RATIO_STATS.items():
+        m, a = stat_column(made), stat_column(att)
+        if m in df and a in df:
+            df[stat_column(pct)] = (df[m] / df[a].where(df[a] > 0)).astype("float32")
+    return df
+
+
+def weekly_season(daily: pd.DataFrame) -> pd.DataFrame:
+    """
+    Weekly increments from one season's wide daily rows: the last totals
+    in each week minus the player's last totals before it (zero at the
+    start of the season), so missing days don't lose anything.
+    """
+    additive = [stat_column(s) for s in sorted(STAT_NAMES) if s not in NON_ADDITIVE_STATS]
+    additive = [c for c in additive if c in daily]
+    df = daily[["snapshot_date", "player_key"] + additive].copy()
+    dates = pd.to_datetime(df["snapshot_date"])
+    df["week_start"] = (dates - pd.to_timedelta(dates.dt.weekday, unit="D")).dt.date
+
+    last = (df.sort_values("snapshot_date")
+              .groupby(["player_key", "week_start"], sort=True)[additive].last())
+    inc = last - last.groupby(level="player_key").shift(1).fillna(0)
+    inc = inc.reset_index()
+    inc = inc[(inc[additive].fillna(0) != 0).any(axis=1)]
+    return _with_ratios(inc)
+
+
+def team_weekly(weekly: pd.DataFrame, history_dir: str = roster_history.HISTORY_DIR) -> Optional[pd.DataFrame]:
+    """Weekly player increments summed by each player's team at the end of the week."""
+    if not os.path.exists(os.path.join(history_dir, roster_history.CURRENT_NAME)):
+        return None
+    frames = []
+    for week_start, rows in weekly.groupby("week_start"):
+        week_end = datetime.combine(week_start + timedelta(days=7), time(), timezone.utc)
+        roster = roster_history.roster_as_of(week_end, history_dir).select(["team_key", "player_key"]).to_pandas()
+        if roster.empty:
+            continue
+        frames.append(rows.merge(roster, on="player_key"))
+    if not frames:
+        return None
+    df = pd.concat(frames)
+    additive = [c for c in weekly.columns
+                if c not in ("player_key", "week_start") and c not in {stat_column(s) for s in RATIO_STATS}]
+    out = df.groupby(["team_key", "week_start"], as_index=False)[additive].sum()
+    return _with_ratios(out)
+
+
+# ---------------- Dimensions ----------------
+def dim_player() -> pa.Table:
+    if os.path.exists(DIM_PATH):
+        t = pq.read_table(DIM_PATH)
+    else:
+        t = pa.Table.from_pandas(pd.read_csv(PLAYERS_CSV, dtype=str), preserve_index=False)
+    current, _ = roster_history.load_current()
+    team = {r["player_key"]: r["team_key"] for r in current}
+    keys = t["player_key"].to_pylist()
+    return t.append_column("team_key", pa.array([team.get(k) for k in keys], pa.string()))
+
+
+def dim_team() -> pa.Table:
+    teams: Dict[str, Dict] = {}
+    for r in roster_history.load_current()[0]:
+        teams[r["team_key"]] = {"team_key": r["team_key"], "team_name": r["team_name"]}
+    if os.path.exists(STANDINGS_CSV):
+        for r in pd.read_csv(STANDINGS_CSV, dtype=str).to_dict("records"):
+            teams.setdefault(r["team_key"], {}).update(r)
+    cols = ["team_key", "team_name", "rank", "wins", "losses", "ties", "percentage", "games_back"]
+    return pa.Table.from_pylist([{c: t.get(c) for c in cols} for t in teams.values()],
+                                schema=pa.schema([(c, pa.string()) for c in cols]))
+
+
+def dim_stat(stat_ids: List[int]) -> pa.Table:
+    ids = sorted(set(stat_ids) | set(STAT_NAMES))
+    return pa.table({
+        "stat_id": pa.array(ids, pa.int32()),
+        "column": [stat_column(s) for s in ids],
+        "name": [STAT_NAMES.get(s) for s in ids],
+        "is_ratio": [s in RATIO_STATS for s in ids],
+        "is_additive": [s not in NON_ADDITIVE_STATS for s in ids],
+        "nine_cat_direction": pa.array([NINE_CAT.get(s) for s in ids], pa.int8()),
+    })
+
+
+def dim_date(first: date, last: date) -> pa.Table:
+    days = pd.date_range(first, last, freq="D")
+    iso = days.isocalendar()
+    return pa.table({
+        "date": pa.array(days.date, pa.date32()),
+        "year": pa.array(days.year, pa.int16()),
+        "month": pa.array(days.month, pa.int8()),
+        "month_key": [d.strftime("%Y-%m") for d in days],
+        "iso_week": pa.array(iso["week"].to_numpy(), pa.int8()),
+        "week_start": pa.array((days - pd.to_timedelta(days.weekday, unit="D")).date, pa.date32()),
+        "day_of_week": pa.array(days.weekday, pa.int8()),
+        "season": [season_of(d.date()) for d in days],
+    })
+
+
+# ---------------- Export ----------------
+def export(out: str = BI_DIR, full: bool = False) -> Dict:
+    """Rebuild the changed partitions and the dimensions; returns what was rebuilt."""
+    os.makedirs(out, exist_ok=True)
+    manifest = {"months": {}} if full else load_manifest(out)
+    stat_ids = set(manifest.get("stat_ids", []))
+    fingerprints = month_fingerprints(build_index(), cdc_days())
+
+    changed = sorted(m for m, fp in fingerprints.items() if manifest["months"].get(m) != fp)
+    for month in changed:
+        t, ids = daily_month(month)
+        stat_ids.update(ids)
+        path = _partition(out, DAILY, "month", month)
+        if t.num_rows:
+            _write(t, path)
+            logging.info("Rebuilt %s: %d rows", path, t.num_rows)
+        manifest["months"][month] = fingerprints[month]
+
+    # Seasons whose months changed get their weekly rollups rebuilt
+    seasons = sorted({season_of(date.fromisoformat(f"{m}-01")) for m in changed})
+    for season in seasons:
+        months = [m for m in fingerprints if season_of(date.fromisoformat(f"{m}-01")) == season]
+        parts = [pq.read_table(_partition(out, DAILY, "month", m)).to_pandas()
+                 for m in sorted(months) if os.path.exists(_partition(out, DAILY, "month", m))]
+        if not parts:
+            continue
+        weekly = weekly_season(pd.concat(parts, ignore_index=True))
+        _write(pa.Table.from_pandas(weekly, preserve_index=False), _partition(out, WEEKLY, "season", season))
+        teams = team_weekly(weekly)
+        if teams is not None:
+            _write(pa.Table.from_pandas(teams, preserve_index=False), _partition(out, TEAM_WEEKLY, "season", season))
+        logging.info("Rebuilt weekly rollups for %s: %d player-weeks", season, len(weekly))
+
+    # Dimensions
+    manifest["stat_ids"] = sorted(stat_ids)
+    _write(dim_stat(manifest["stat_ids"]), os.path.join(out, "dim_stat.parquet"))
+    months = sorted(fingerprints)
+    if months:
+        first = date.fromisoformat(f"{months[0]}-01")
+        last = (date.fromisoformat(f"{months[-1]}-01") + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        _write(dim_date(first, last), os.path.join(out, "dim_date.parquet"))
+    if os.path.exists(DIM_PATH) or os.path.exists(PLAYERS_CSV):
+        _write(dim_player(), os.path.join(out, "dim_player.parquet"))
+    _write(dim_team(), os.path.join(out, "dim_team.parquet"))
+
+    save_manifest(manifest, out)
+    return {"months": changed, "seasons": seasons}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Export the Power BI star schema")
+    ap.add_argument("--out", default=BI_DIR)
+    ap.add_argument("--full", action="store_true", help="rebuild every partition")
+    args = ap.parse_args(argv)
+    result = export(args.out, full=args.full)
+    logging.info("BI export: %d month partitions, %d seasons rebuilt",
+                 len(result["months"]), len(result["seasons"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# check_ttls.py
+"""
+Check the response-cache TTL of every request the fetch scripts make.
+
+    python check_ttls.py                         # EXPECTED; exit 1 on a mismatch
+    python check_ttls.py --archive-dir data/raw [--from DATE] [--to DATE]
+
+EXPECTED holds one URL of each shape the fetch scripts issue, built the
+way the scripts build them, with the TTL it must resolve to under
+http_helpers.DEFAULT_TTLS / FILTER_TTLS. With --archive-dir it also lists the URLs
+recorded in raw archives (raw_archive.py), i.e. what the scripts really
+requested, grouped by job and shape with the TTL each resolves to.
+"""
+
+import sys
+import argparse
+import tempfile
+import logging
+from collections import defaultdict
+
+from http_helpers import API_ROOT, ResponseCache, url_resource
+from raw_archive import find_archives, read_index
+from fetch_full_player_stats import stats_url
+from backfill import daily_url
+from fetch_players import INCREMENTAL_QUERIES
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+LEAGUE = "466.l.165651"
+TEAM = "466.l.165651.t.1"
+KEYS = ["466.p.3704", "466.p.6014"]
+DAY = "2026-01-17"
+HOUR = 3600
+DAY_S = 24 * HOUR
+
+# (script, url, expected TTL)
+EXPECTED = [
+    ("fetch_players.py (full refresh)",
+     f"{API_ROOT}/league/{LEAGUE}/players;start=0;count=25?format=json", DAY_S),
+    ("fetch_players_and_stats.py (full refresh)",
+     f"{API_ROOT}/league/{LEAGUE}/players;status=ALL;start=0;count=25?format=json", DAY_S),
+] + [
+    ("fetch_players.py (incremental)",
+     f"{API_ROOT}/league/{LEAGUE}/players{query};start=0;count=25?format=json", 0)
+    for query, _ in INCREMENTAL_QUERIES
+] + [
+    ("fetch_player_season_snapshot.py",
+     f"{API_ROOT}/players;player_keys={','.join(KEYS)};out=stats?format=json", 0),
+    ("fetch_full_player_stats.py", stats_url(KEYS[0], DAY), 0),
+    ("backfill.py", daily_url(KEYS, DAY), 0),
+    ("league_rosters.py", f"{API_ROOT}/league/{LEAGUE}/teams;out=roster,standings?format=json", 300),
+    ("league_rosters.py (per-team fallback)", f"{API_ROOT}/league/{LEAGUE}/teams?format=json", HOUR),
+    ("league_rosters.py (per-team fallback)", f"{API_ROOT}/team/{TEAM}/roster?format=json", 300),
+]
+
+
+def shape(url: str) -> str:
+    """A URL's resource with its param names; filter values are kept, keys and dates aren't."""
+    resource, params = url_resource(url)
+    kept = ("status", "sort", "sort_type", "out", "type")
+    return ";".join([resource] + sorted(k if k not in kept else f"{k}={v}" for k, v in params.items() if k != "format"))
+
+
+def check(cache: ResponseCache) -> int:
+    failed = 0
+    for script, url, want in EXPECTED:
+        got = cache.ttl_for(url)
+        ok = got == want
+        failed += not ok
+        print(f"{'ok ' if ok else 'BAD'} {got:>6} {want:>6}  {script:<42} {url[len(API_ROOT):]}")
+    return failed
+
+
+def list_archives(cache: ResponseCache, root: str, date_from=None, date_to=None):
+    seen = defaultdict(lambda: [0, None])
+    for archive in find_archives(root, date_from=date_from, date_to=date_to):
+        header, entries = read_index(archive)
+        for e in entries:
+            row = seen[(header.get("job", "?"), shape(e["url"]))]
+            row[0] += 1
+            row[1] = row[1] or e["url"]
+    for (job, s), (n, url) in sorted(seen.items()):
+        print(f"{cache.ttl_for(url):>6}  {job:<30} {n:>6}  {s}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Check the HTTP cache TTL of the fetch scripts' requests")
+    ap.add_argument("--archive-dir", help="also list the URLs recorded in these raw archives")
+    ap.add_argument("--from", dest="date_from")
+    ap.add_argument("--to", dest="date_to")
+    args = ap.parse_args(argv)
+
+    # TTLs only; a scratch root keeps the real cache's index untouched
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(tmp)
+        print("result   ttl   want  script")
+        failed = check(cache)
+        if args.archive_dir:
+            print("\n   ttl  job                             count  shape")
+            list_archives(cache, args.archive_dir, args.date_from, args.date_to)
+    if failed:
+        logging.error("%d URL(s) resolve to the wrong TTL", failed)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
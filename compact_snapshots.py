@@ -0,0 +1,139 @@
+# compact_snapshots.py
+"""
+Merge cold daily snapshot files into the partitioned snapshot dataset.
+
+    python compact_snapshots.py [--hot-days 7] [--prune]
+
+Days newer than --hot-days (relative to the newest daily file) stay hot
+and are left alone. Each affected season/month partition is rewritten as
+one v2-schema file (see snapshot_schema.py; v1 daily files are converted
+on the way in) sorted by (player_key, stat_id, snapshot_date) so row-group
+min/max statistics prune player and stat filters. Re-running is cheap:
+a daily file is only re-merged when its content hash changes.
+"""
+
+import os
+import sys
+import hashlib
+import argparse
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from snapshot_store import (
+    SNAPSHOT_DIR, DATASET_DIR, daily_files, partition_of, load_manifest, save_manifest,
+)
+from snapshot_schema import read_snapshot, write_snapshot
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+HOT_DAYS = 7
+# ~20k rows per day -> a month partition is ~600k rows, i.e. ~19 row groups
+# each covering a narrow player_key range (a one-player read decodes ~32k rows)
+ROW_GROUP_ROWS = 32 * 1024
+PART_FILE = "part-0.parquet"
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_partition(dataset_dir, partition, tables, row_group_size=ROW_GROUP_ROWS):
+    """Sort and atomically (re)write one partition file (v2 schema); returns its manifest entry."""
+    table = pa.concat_tables(tables)
+    out_dir = os.path.join(dataset_dir, partition)
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, PART_FILE)
+    write_snapshot(table, path, row_group_size=row_group_size)
+
+    dates = sorted(d.isoformat() for d in pc.unique(table.column("snapshot_date")).to_pylist())
+    return {
+        "file": f"{partition}/{PART_FILE}",
+        "rows": table.num_rows,
+        "row_groups": pq.ParquetFile(path).num_row_groups,
+        "min_date": dates[0],
+        "max_date": dates[-1],
+        "dates": dates,
+    }
+
+
+def compact(snapshot_dir=SNAPSHOT_DIR, dataset_dir=DATASET_DIR, hot_days=HOT_DAYS,
+            prune=False, row_group_size=ROW_GROUP_ROWS):
+    """Compact cold daily files; returns the list of partitions rewritten."""
+    files = daily_files(snapshot_dir)
+    if not files:
+        logging.info("No daily snapshots in %s", snapshot_dir)
+        return []
+
+    cutoff = date.fromisoformat(max(files)) - timedelta(days=hot_days)
+    manifest = load_manifest(dataset_dir)
+    sources = manifest["sources"]
+
+    dirty = defaultdict(dict)
+    for d, path in files.items():
+        if date.fromisoformat(d) > cutoff:
+            continue
+        digest = file_sha1(path)
+        if sources.get(d, {}).get("sha1") != digest:
+            dirty[partition_of(d)][d] = (path, digest)
+
+    for partition, new_days in sorted(dirty.items()):
+        tables = []
+        existing = os.path.join(dataset_dir, partition, PART_FILE)
+        if os.path.exists(existing):
+            # Keep days already compacted (their daily files may be pruned)
+            old = read_snapshot(existing)
+            replaced = pa.array([date.fromisoformat(d) for d in sorted(new_days)], pa.date32())
+            keep = pc.invert(pc.is_in(old.column("snapshot_date"), value_set=replaced))
+            tables.append(old.filter(keep))
+
+        for d, (path, _) in sorted(new_days.items()):
+            tables.append(read_snapshot(path))
+
+        entry = write_partition(dataset_dir, partition, tables, row_group_size)
+        manifest["partitions"][partition] = entry
+        for d, (path, digest) in new_days.items():
+            sources[d] = {"file": os.path.basename(path), "sha1": digest, "partition": partition}
+        logging.info(
+            "Compacted %s: +%d days -> %d rows, %d row groups",
+            partition, len(new_days), entry["rows"], entry["row_groups"],
+        )
+
+    if dirty:
+        manifest["row_group_size"] = row_group_size
+        save_manifest(manifest, dataset_dir)
+    else:
+        logging.info("Nothing to compact (hot window: %d days)", hot_days)
+
+    if prune:
+        for d, path in files.items():
+            if d in sources and os.path.exists(path) and sources[d]["sha1"] == file_sha1(path):
+                os.remove(path)
+                logging.info("Pruned %s", path)
+
+    return sorted(dirty)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    ap.add_argument("--dataset-dir", default=DATASET_DIR)
+    ap.add_argument("--hot-days", type=int, default=HOT_DAYS)
+    ap.add_argument("--row-group-size", type=int, default=ROW_GROUP_ROWS)
+    ap.add_argument("--prune", action="store_true",
+                    help="delete daily files once they are safely compacted")
+    args = ap.parse_args(argv)
+    compact(args.snapshot_dir, args.dataset_dir, args.hot_days, args.prune, args.row_group_size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
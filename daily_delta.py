@@ -0,0 +1,244 @@
+# daily_delta.py
+"""
+Daily stat increments derived from the cumulative season snapshots.
+
+    python daily_delta.py [--rebuild]
+
+Season snapshots hold running totals, so a player's line for a day is
+the difference between that day's snapshot and the previous one. This
+module materialises it incrementally under data/daily_delta:
+
+    fact_player_daily_delta_YYYY-MM-DD.parquet   nonzero increments for the day
+    fact_player_rolling.parquet                  7/14/30-day sums as of the newest day
+    _state.parquet                               last known totals per (player_key, stat_id)
+
+Each run only processes snapshot days newer than the state. A day is
+joined against the state on (player_key, stat_id), not against the
+previous file, so a missing day or a player who drops out of a snapshot
+and comes back later simply yields one increment spanning the gap (see
+prev_date). Players who disappear keep their last totals in the state.
+The first day ever processed only seeds the state. Rolling sums are
+rebuilt from the last 30 daily files, never the full history; an
+increment spanning a gap counts on the day it was observed.
+
+Percentages and A/T (NON_ADDITIVE_STATS) are not additive and are left
+out; rebuild them from the made/attempted increments.
+"""
+
+import os
+import sys
+import argparse
+import logging
+import shutil
+from datetime import date, timedelta
+from typing import List
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from snapshot_store import SNAPSHOT_DIR, DATASET_DIR, daily_files, load_manifest
+from snapshot_schema import read_snapshot
+from snapshot_query import load_series
+from snapshot_delta import DELTA_DIR, checkpoints, deltas, rebuild_day
+from scoring import RATIO_STATS
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+DAILY_DELTA_DIR = "data/daily_delta"
+STATE_NAME = "_state.parquet"
+ROLLING_NAME = "fact_player_rolling.parquet"
+WINDOWS = (7, 14, 30)
+
+NON_ADDITIVE_STATS = sorted(set(RATIO_STATS) | {20})   # FG%, FT%, 3PT%, A/T
+
+KEY = ["player_key", "stat_id"]
+VALUE_COLUMNS = ["stat_value", "stat_made", "stat_attempted"]
+DELTA_COLUMNS = ["delta_value", "delta_made", "delta_attempted"]
+
+STATE_SCHEMA = pa.schema([
+    ("player_key", pa.string()),
+    ("stat_id", pa.int32()),
+    ("last_date", pa.date32()),
+    ("stat_value", pa.float32()),
+    ("stat_made", pa.int32()),
+    ("stat_attempted", pa.int32()),
+])
+
+DELTA_SCHEMA = pa.schema([
+    ("snapshot_date", pa.date32()),
+    ("prev_date", pa.date32()),         # null when the key is new
+    ("player_key", pa.dictionary(pa.int32(), pa.string())),
+    ("stat_id", pa.int32()),
+    ("delta_value", pa.float32()),
+    ("delta_made", pa.int32()),
+    ("delta_attempted", pa.int32()),
+])
+
+
+def delta_path(d: str, out_dir: str = DAILY_DELTA_DIR) -> str:
+    return os.path.join(out_dir, f"fact_player_daily_delta_{d}.parquet")
+
+
+def snapshot_dates(snapshot_dir: str = SNAPSHOT_DIR, dataset_dir: str = DATASET_DIR,
+                   delta_dir: str = DELTA_DIR) -> List[str]:
+    """Every day with snapshot data: hot files, compacted days and the CDC store."""
+    days = set(daily_files(snapshot_dir))
+    days |= set(load_manifest(dataset_dir)["sources"])
+    days |= set(checkpoints(delta_dir)) | set(deltas(delta_dir))
+    return sorted(days)
+
+
+def day_totals(d: str, snapshot_dir: str = SNAPSHOT_DIR, dataset_dir: str = DATASET_DIR,
+               delta_dir: str = DELTA_DIR) -> pa.Table:
+    """(player_key, stat_id, values) totals as of day d, additive stats with a value only."""
+    files = daily_files(snapshot_dir)
+    if d in files:
+        t = read_snapshot(files[d])
+    elif d in checkpoints(delta_dir) or d in deltas(delta_dir):
+        t = rebuild_day(d, delta_dir)
+    else:
+        t = load_series(date_from=d, date_to=d, snapshot_dir=snapshot_dir, dataset_dir=dataset_dir)
+    if t is None or t.num_rows == 0:
+        return STATE_SCHEMA.empty_table().drop_columns(["last_date"])
+
+    keys = t["player_key"]
+    if pa.types.is_dictionary(keys.type):
+        keys = keys.cast(keys.type.value_type)
+    t = pa.table({"player_key": keys, **{c: t[c] for c in ["stat_id"] + VALUE_COLUMNS}})
+
+    keep = pc.and_(
+        pc.invert(pc.is_in(t["stat_id"], value_set=pa.array(NON_ADDITIVE_STATS, pa.int32()))),
+        pc.or_(pc.is_valid(t["stat_value"]), pc.is_valid(t["stat_made"])),
+    )
+    return t.filter(keep)
+
+
+def _as_state(totals: pa.Table, day: date) -> pa.Table:
+    dates = pa.array([day] * totals.num_rows, pa.date32())
+    return totals.append_column("last_date", dates).select(STATE_SCHEMA.names).cast(STATE_SCHEMA)
+
+
+def diff_day(state: pa.Table, totals: pa.Table, d: str):
+    """
+    Increments of `totals` (day d) over `state`, and the new state.
+    Returns (delta table in DELTA_SCHEMA, nonzero rows only; new state).
+    """
+    day = date.fromisoformat(d)
+    j = totals.join(state, keys=KEY, join_type="left outer", right_suffix="_prev")
+
+    is_new = pc.is_null(j["last_date"])
+    cols = {}
+    changed = None
+    for v, out in zip(VALUE_COLUMNS, DELTA_COLUMNS):
+        # A key seen for the first time counts from zero
+        prev = pc.if_else(is_new, pa.scalar(0, j[v].type), j[v + "_prev"])
+        delta = pc.subtract(j[v], prev)
+        cols[out] = delta
+        nz = pc.fill_null(pc.not_equal(delta, pa.scalar(0, delta.type)), False)
+        changed = nz if changed is None else pc.or_(changed, nz)
+
+    delta = pa.table({
+        "snapshot_date": pa.array([day] * j.num_rows, pa.date32()),
+        "prev_date": j["last_date"],
+        "player_key": j["player_key"].dictionary_encode(),
+        "stat_id": j["stat_id"],
+        **cols,
+    }).filter(changed)
+
+    # Keys missing today carry their last totals forward
+    carried = state.join(totals.select(KEY), keys=KEY, join_type="left anti")
+    new_state = pa.concat_tables([carried, _as_state(totals, day)])
+    return delta.cast(DELTA_SCHEMA), new_state
+
+
+def load_state(out_dir: str = DAILY_DELTA_DIR):
+    """(state table, last processed date) or (None, None)."""
+    path = os.path.join(out_dir, STATE_NAME)
+    if not os.path.exists(path):
+        return None, None
+    t = pq.read_table(path)
+    last = (t.schema.metadata or {}).get(b"last_date")
+    return t.cast(STATE_SCHEMA), last.decode() if last else None
+
+
+def save_state(state: pa.Table, last: str, out_dir: str = DAILY_DELTA_DIR):
+    path = os.path.join(out_dir, STATE_NAME)
+    tmp = path + ".tmp"
+    pq.write_table(state.replace_schema_metadata({"last_date": last}), tmp, compression="snappy")
+    os.replace(tmp, path)
+
+
+def rolling_windows(as_of: str, out_dir: str = DAILY_DELTA_DIR, windows=WINDOWS) -> pa.Table:
+    """Per (player_key, stat_id) sums of the increments over the last N days, for each N in windows."""
+    end = date.fromisoformat(as_of)
+    parts = []
+    for i in range(max(windows)):
+        path = delta_path((end - timedelta(days=i)).isoformat(), out_dir)
+        if os.path.exists(path):
+            parts.append(pq.read_table(path))
+    if not parts:
+        return pa.table({"as_of": pa.array([], pa.date32())})
+
+    t = pa.concat_tables(parts, promote_options="permissive") if len(parts) > 1 else parts[0]
+    keys = t["player_key"].cast(pa.string())
+    age = pc.subtract(pa.scalar(end, pa.date32()).cast(pa.int32()), t["snapshot_date"].cast(pa.int32()))
+    value = pc.fill_null(t["delta_value"], 0)
+    cols = {"player_key": keys, "stat_id": t["stat_id"]}
+    for n in windows:
+        cols[f"sum_{n}d"] = pc.if_else(pc.less(age, n), value, pa.scalar(0, value.type))
+
+    g = pa.table(cols).group_by(KEY).aggregate([(f"sum_{n}d", "sum") for n in windows])
+    g = g.rename_columns([c.removesuffix("_sum") for c in g.column_names])
+    g = g.sort_by([(k, "ascending") for k in KEY])
+    return g.append_column("as_of", pa.array([end] * g.num_rows, pa.date32()))
+
+
+def update(out_dir: str = DAILY_DELTA_DIR, snapshot_dir: str = SNAPSHOT_DIR,
+           dataset_dir: str = DATASET_DIR, delta_dir: str = DELTA_DIR) -> int:
+    """Process every snapshot day newer than the state; returns the number of days processed."""
+    os.makedirs(out_dir, exist_ok=True)
+    state, last = load_state(out_dir)
+    todo = [d for d in snapshot_dates(snapshot_dir, dataset_dir, delta_dir) if last is None or d > last]
+    if not todo:
+        logging.info("Daily deltas up to date (last %s)", last)
+
+    for d in todo:
+        totals = day_totals(d, snapshot_dir, dataset_dir, delta_dir)
+        if totals.num_rows == 0:
+            logging.warning("No snapshot rows for %s — skipping", d)
+            continue
+        if state is None:
+            state = _as_state(totals, date.fromisoformat(d))
+            logging.info("Seeded daily delta state from %s (%d keys)", d, state.num_rows)
+        else:
+            delta, state = diff_day(state, totals, d)
+            tmp = delta_path(d, out_dir) + ".tmp"
+            pq.write_table(delta, tmp, compression="snappy")
+            os.replace(tmp, delta_path(d, out_dir))
+            yesterday = pa.scalar(date.fromisoformat(d) - timedelta(days=1), pa.date32())
+            gap = pc.sum(pc.fill_null(pc.not_equal(delta["prev_date"], yesterday), True)).as_py() or 0
+            logging.info("%s: %d nonzero increments (%d spanning a gap or new)", d, delta.num_rows, gap)
+        last = d
+        save_state(state, last, out_dir)
+
+    if last is None:
+        return 0
+    rolling = rolling_windows(last, out_dir)
+    pq.write_table(rolling, os.path.join(out_dir, ROLLING_NAME), compression="snappy")
+    logging.info("Wrote %s: %d rows as of %s", ROLLING_NAME, rolling.num_rows, last)
+    return len(todo)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Materialise daily stat increments from season snapshots")
+    ap.add_argument("--rebuild", action="store_true", help="discard the state and recompute all days")
+    args = ap.parse_args(argv)
+    if args.rebuild:
+        shutil.rmtree(DAILY_DELTA_DIR, ignore_errors=True)
+    update()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# fetch_engine.py
+"""Concurrent fetching on top of http_helpers.safe_get with one shared rate limit."""
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, Iterator, List, NamedTuple, Optional
+
+from http_helpers import safe_get, configure_pool
+
+# Defaults can be tuned per workflow without code changes
+DEFAULT_WORKERS = int(os.environ.get("FETCH_WORKERS", "4"))
+DEFAULT_RPS = float(os.environ.get("FETCH_RPS", "8"))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Every worker calls acquire() before a request,
+    so the combined request rate never exceeds `rate` per second (after an
+    initial burst of up to `burst` requests). rate <= 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    TokenBucket whose rate follows AIMD: each success adds roughly
+    `increase` requests/second per second of traffic (up to max_rate),
+    each 429 halves the rate (down to min_rate). Decreases are spaced at
+    least one second apart so a burst of 429s from concurrent workers
+    counts as one signal.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, min_rate: float = 0.5,
+                 max_rate: Optional[float] = None, increase: float = 0.5, decrease: float = 0.5):
+        super().__init__(rate, burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate if max_rate is not None else self.rate
+        self.increase = increase
+        self.decrease = decrease
+        self._last_decrease = 0.0
+
+    def on_success(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < 1.0:
+                return
+            self._last_decrease = now
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            logging.warning("Throttled: request rate lowered to %.2f/s", self.rate)
+
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+def shared_limiter() -> AdaptiveTokenBucket:
+    """The process-wide limiter used when fetch_all gets neither limiter nor rps."""
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            _shared_limiter = AdaptiveTokenBucket(DEFAULT_RPS)
+        return _shared_limiter
+
+
+class FetchResult(NamedTuple):
+    url: str
+    status: Optional[int]
+    data: Any
+    error: Optional[BaseException]
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def iter_fetch(session, urls: Iterable[str], workers: Optional[int] = None,
+               rps: Optional[float] = None, limiter: Optional[TokenBucket] = None,
+               keys: Optional[Iterable[str]] = None, window: Optional[int] = None,
+               **get_kwargs) -> Iterator[FetchResult]:
+    """
+    Like fetch_all, but yields results in order as they complete with at
+    most `window` requests (default 2 x workers) in flight or waiting to be
+    consumed, so memory doesn't grow with the number of urls.
+    """
+    workers = max(1, workers or DEFAULT_WORKERS)
+    configure_pool(session, workers)
+    if limiter is None:
+        limiter = shared_limiter() if rps is None else AdaptiveTokenBucket(rps)
+    urls = list(urls)
+    keys = list(keys) if keys is not None else urls
+
+    def one(job):
+        url, key = job
+        try:
+            status, data = safe_get(session, url, limiter=limiter, key=key, **get_kwargs)
+            return FetchResult(url, status, data, None)
+        except Exception as e:
+            logging.warning("Giving up on %s: %s", key, e)
+            return FetchResult(url, None, None, e)
+
+    jobs = iter(zip(urls, keys))
+    if workers == 1 or len(urls) <= 1:
+        for job in jobs:
+            yield one(job)
+        return
+
+    window = max(1, window or 2 * workers)
+    pool = ThreadPoolExecutor(max_workers=min(workers, len(urls)))
+    try:
+        pending = deque(pool.submit(one, job) for job in islice(jobs, window))
+        while pending:
+            res = pending.popleft().result()
+            job = next(jobs, None)
+            if job is not None:
+                pending.append(pool.submit(one, job))
+            yield res
+    finally:
+        # A consumer that stops early shouldn't wait for queued requests
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def fetch_all(session, urls: List[str], workers: Optional[int] = None,
+              rps: Optional[float] = None, limiter: Optional[TokenBucket] = None,
+              keys: Optional[List[str]] = None, **get_kwargs) -> List[FetchResult]:
+    """
+    GET every url with a bounded thread pool. All workers share one token
+    bucket: the process-wide shared_limiter() unless `limiter` or `rps` is
+    given. `keys` (parallel to urls) labels each request in
+    http_helpers.RUN_STATS retried/dropped counts, e.g. a player key.
+    Results come back in the same order as `urls`; failures are returned
+    as FetchResult.error instead of raised.
+    """
+    return list(iter_fetch(session, urls, workers=workers, rps=rps, limiter=limiter,
+                           keys=keys, window=len(urls), **get_kwargs))
@@ -1,57 +1,115 @@
 import os
+import sys
 import pandas as pd
-from yahoo_oauth import OAuth2
-from datetime import datetime
+import pyarrow as pa
+from typing import Dict, Iterable, List, Optional
+from yahoo_helpers import PlayerKeyIndex, game_id_from_league_key
+from yahoo_utils import player_stat_pairs
+from fetch_engine import iter_fetch
+from http_helpers import RUN_STATS, API_ROOT, yahoo_session
+from metrics import timed, instrumented
+from raw_archive import run_time
+from stream_writer import CheckpointedParquetWriter
 
-oauth = OAuth2(None, None, from_file="oauth2.json")
+OUT = "player_stats_full.parquet"
+SCHEMA = pa.schema([
+    ("player_key", pa.string()),
+    ("player_name", pa.string()),
+    ("timestamp", pa.string()),
+    ("stat_id", pa.string()),
+    ("stat_value", pa.string()),
+])
 
-lp = pd.read_csv("league_players.csv", dtype=str)
-keys = set(lp["player_key"].dropna())
 
-if os.path.exists("team_rosters.csv"):
-    r = pd.read_csv("team_rosters.csv", dtype=str)
-    keys |= set(r["player_key"].dropna())
+def player_keys_to_fetch(game_id: str, players: Optional[Iterable[Dict]] = None,
+                         roster_rows: Optional[Iterable[Dict]] = None) -> List[str]:
+    """
+    League players plus rostered players (rows from league_players.csv and
+    team_rosters.csv unless passed in), resolved to one canonical
+    "{game_id}.p.{id}" key each so no player is requested twice.
+    """
+    if players is None:
+        players = pd.read_csv("league_players.csv", dtype=str).fillna("").to_dict("records")
+    if roster_rows is None:
+        roster_rows = []
+        if os.path.exists("team_rosters.csv"):
+            roster_rows = pd.read_csv("team_rosters.csv", dtype=str).fillna("").to_dict("records")
 
-expanded = set()
-for k in keys:
-    expanded.add(k)
-    if k.isdigit():
-        expanded.add(f"466.p.{k}")
+    index = PlayerKeyIndex(game_id)
+    candidates = []
+    for p in players:
+        index.add(p.get("player_key"), p.get("player_id"), p.get("editorial_player_key"))
+        candidates.append(p.get("player_key") or p.get("player_id") or p.get("editorial_player_key"))
+    candidates.extend(r.get("player_key") for r in roster_rows)
+    candidates = [k for k in candidates if k]
 
-player_keys = sorted(expanded)
-print("Total player keys to fetch:", len(player_keys))
+    keys, _, unresolved = index.dedupe(candidates)
+    if unresolved:
+        print(f"Skipping {len(unresolved)} unrecognised player keys, e.g. {unresolved[:3]}")
+    # Exact repeats were never fetched twice; count the other key forms
+    avoided = len(set(candidates)) - len(set(unresolved)) - len(keys)
+    print(f"Player keys: {len(set(candidates))} distinct keys -> {len(keys)} players "
+          f"({avoided} duplicate requests avoided)")
+    return sorted(keys)
 
-today = datetime.utcnow().date().isoformat()
-rows = []
 
+def stats_url(pk, today):
+    return f"{API_ROOT}/player/{pk}/stats;date={today}?format=json"
 
-def fetch(pk):
-    url = f"https://fantasysports.yahooapis.com/fantasy/v2/player/{pk}/stats;date={today}?format=json"
-    r = oauth.session.get(url)
-    if r.status_code != 200:
-        return []
+
+@timed("parse")
+def parse(pk, j, today):
     try:
-        j = r.json()
         player = j["fantasy_content"]["player"]
-        name = next(i["name"]["full"] for i in player[0] if "name" in i)
-        stats = player[1]["player_stats"]["stats"]["stat"]
+        name = next(i["name"]["full"] for i in player[0] if isinstance(i, dict) and "name" in i)
+        # stats is a list of {"stat": {...}} wrappers, as in every stats response
         out = []
-        for s in stats:
+        for stat_id, value in player_stat_pairs(player):
             out.append({
                 "player_key": pk,
                 "player_name": name,
                 "timestamp": today,
-                "stat_id": s["stat_id"],
-                "stat_value": s["value"]
+                "stat_id": str(stat_id),
+                "stat_value": None if value is None else str(value)
             })
         return out
     except Exception:
         return []
 
 
-for i, pk in enumerate(player_keys, 1):
-    print(f"[{i}/{len(player_keys)}] {pk}")
-    rows.extend(fetch(pk))
+def fetch_full_stats(session, player_keys: List[str], out: str = OUT) -> int:
+    """Fetch today's stats for every key into `out`; returns the row count."""
+    print("Total player keys to fetch:", len(player_keys))
+    today = run_time().date().isoformat()
+
+    # One row group per STREAM_FLUSH_EVERY players; a rerun on the same day
+    # resumes after the last flushed player instead of refetching everyone
+    stream = CheckpointedParquetWriter("full_player_stats", SCHEMA, run_id=today)
+
+    pending = [pk for pk in player_keys if not stream.is_done(pk)]
+    print("Already done:", len(player_keys) - len(pending))
+
+    results = iter_fetch(session, [stats_url(pk, today) for pk in pending], keys=pending)
+    for i, (pk, res) in enumerate(zip(pending, results), 1):
+        print(f"[{i}/{len(pending)}] {pk}")
+        if res.ok:
+            stream.add(pk, parse(pk, res.data, today))
+
+    n = stream.finish(out)
+    print(f"Saved {out} rows:", n)
+    return n
+
+
+@instrumented("fetch_full_player_stats")
+def main():
+    league_key = os.environ.get("LEAGUE_KEY")
+    if not league_key:
+        print("ERROR: LEAGUE_KEY not set")
+        return 2
+    fetch_full_stats(yahoo_session(), player_keys_to_fetch(game_id_from_league_key(league_key)))
+    print("Run stats:", RUN_STATS.summary())
+    return 0
+
 
-pd.DataFrame(rows).to_parquet("player_stats_full.parquet", index=False)
-print("Saved player_stats_full.parquet rows:", len(rows))
+if __name__ == "__main__":
+    sys.exit(main())
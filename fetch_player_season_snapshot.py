@@ -1,138 +1,165 @@
 import os
 import sys
-import time
 import csv
 import logging
-from datetime import datetime, timezone
-
-import pandas as pd
-from yahoo_oauth import OAuth2
-from yahoo_utils import as_list, first_dict, find_all
-from http_helpers import safe_get
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from yahoo_utils import player_stat_pairs, players_by_key
+from fetch_engine import iter_fetch
+from http_helpers import RUN_STATS, API_ROOT, yahoo_session
+from metrics import instrumented
+from raw_archive import run_time
+from snapshot_schema import DAILY_SCHEMA, SCHEMA_V2, to_v2, read_snapshot, write_daily
+from snapshot_delta import write_delta
+from snapshot_upsert import upsert_tables, upsert_file
+from stream_writer import CheckpointedParquetWriter
+from latest_state import publish
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-LEAGUE_KEY = os.environ.get("LEAGUE_KEY")
-if not LEAGUE_KEY:
-    logging.error("LEAGUE_KEY env var not set")
-    sys.exit(2)
-
 PLAYERS_CSV = "league_players.csv"
 
-SNAPSHOT_TS = datetime.now(timezone.utc)
-SNAPSHOT_DATE = SNAPSHOT_TS.date().isoformat()
-
-OUT_DIR = "data/snapshots"
-OUT_FILE = os.path.join(
-    OUT_DIR,
-    f"fact_player_season_snapshot_{SNAPSHOT_DATE}.parquet"
-)
-
-os.makedirs(OUT_DIR, exist_ok=True)
-
-oauth = OAuth2(None, None, from_file="oauth2.json")
-session = oauth.session
-
-# ---------------- Load players ----------------
-if not os.path.exists(PLAYERS_CSV):
-    logging.error("%s not found, run fetch_players.py first", PLAYERS_CSV)
-    sys.exit(1)
-
-players = []
-with open(PLAYERS_CSV, newline="", encoding="utf-8") as f:
-    for r in csv.DictReader(f):
-        if r.get("player_key"):
-            players.append(r)
+# Keys per players;player_keys=... request (Yahoo caps collections at 25)
+BATCH_SIZE = max(1, min(25, int(os.environ.get("SNAPSHOT_BATCH_SIZE", "25"))))
 
-if not players:
-    logging.info("No players found — exiting")
-    sys.exit(0)
+# "full" rewrites the day file under data/snapshots; "delta" records only
+# changed values in data/snapshot_deltas (see snapshot_delta.py)
+SNAPSHOT_MODE = os.environ.get("SNAPSHOT_MODE", "full")
 
-rows = []
-
-# ---------------- Fetch stats ----------------
-for idx, p in enumerate(players, start=1):
-    pk = p["player_key"]
-    logging.info("[%d/%d] Fetching stats for %s", idx, len(players), pk)
-
-    url = f"https://fantasysports.yahooapis.com/fantasy/v2/player/{pk}/stats?format=json"
-
-    try:
-        _, data = safe_get(session, url)
-    except Exception:
-        logging.exception("Failed to fetch stats for %s", pk)
-        continue
-
-    player_nodes = as_list(data.get("fantasy_content", {}).get("player"))
-    if len(player_nodes) < 2:
-        continue
-
-    stats_frag = first_dict(player_nodes[1]).get("player_stats")
-    stat_lists = find_all(stats_frag, "stat")
+OUT_DIR = "data/snapshots"
 
-    for sl in stat_lists:
-        for stat_item in (sl if isinstance(sl, list) else [sl]):
-            s = first_dict(stat_item)
-            if s.get("stat_id") is None:
-                continue
 
-            rows.append({
-                "snapshot_ts": SNAPSHOT_TS,
-                "snapshot_date": SNAPSHOT_DATE,
+def load_players(path: str = PLAYERS_CSV) -> Optional[List[Dict]]:
+    """Players from fetch_players.py's CSV, or None if it doesn't exist."""
+    if not os.path.exists(path):
+        return None
+    players = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            if r.get("player_key"):
+                players.append(r)
+    return players
+
+
+def snapshot_players(session, players: List[Dict], snapshot_ts: Optional[datetime] = None) -> Dict:
+    """
+    Fetch season stats for `players` (dicts with a player_key, in the order
+    rows should be emitted) and merge them into today's snapshot.
+    Returns {"rows", "inserted", "updated", "unchanged"} (delta mode: "changed").
+    """
+    snapshot_ts = snapshot_ts or run_time()
+    snapshot_date = snapshot_ts.date().isoformat()
+    out_file = os.path.join(OUT_DIR, f"fact_player_season_snapshot_{snapshot_date}.parquet")
+    os.makedirs(OUT_DIR, exist_ok=True)
+
+    # Rows stream to a checkpointed part file every STREAM_FLUSH_EVERY players;
+    # a rerun on the same day skips players an interrupted run already finished
+    stream = CheckpointedParquetWriter(
+        "player_season_snapshot", SCHEMA_V2, run_id=snapshot_date, convert=to_v2
+    )
+
+    def player_rows(pk, player_nodes):
+        for stat_id, value in player_stat_pairs(player_nodes):
+            yield {
+                "snapshot_ts": snapshot_ts,
+                "snapshot_date": snapshot_date,
                 "player_key": pk,
-                "stat_id": int(s["stat_id"]),
-                "stat_value": s.get("value")
-            })
-
-    time.sleep(0.12)
-
-if not rows:
-    logging.info("No stats collected")
-    sys.exit(0)
-
-new_df = pd.DataFrame(rows)
-
-# ---------------- Enforce schema ----------------
-new_df["snapshot_ts"] = pd.to_datetime(new_df["snapshot_ts"], utc=True)
-new_df["snapshot_date"] = new_df["snapshot_date"].astype("string")
-new_df["player_key"] = new_df["player_key"].astype("string")
-new_df["stat_id"] = new_df["stat_id"].astype("int32")
-new_df["stat_value"] = new_df["stat_value"].astype("string")
-
-# ---------------- Load existing Parquet (if any) ----------------
-if os.path.exists(OUT_FILE):
-    logging.info("Existing snapshot found — merging and deduping")
-    existing_df = pd.read_parquet(OUT_FILE)
-
-    df = pd.concat([existing_df, new_df], ignore_index=True)
-else:
-    df = new_df
-
-# ---------------- DEDUPE ----------------
-# Keep the latest snapshot per (date, player, stat)
-before = len(df)
-
-df = (
-    df.sort_values("snapshot_ts")
-      .drop_duplicates(
-          subset=["snapshot_date", "player_key", "stat_id"],
-          keep="last"
-      )
-)
-
-after = len(df)
-
-logging.info(
-    "Deduped snapshot: %d → %d rows (removed %d)",
-    before, after, before - after
-)
-
-# ---------------- Write Parquet ----------------
-df.to_parquet(
-    OUT_FILE,
-    engine="pyarrow",
-    compression="snappy",
-    index=False
-)
-
-logging.info("Wrote %d rows → %s", len(df), OUT_FILE)
+                "stat_id": stat_id,
+                "stat_value": value
+            }
+
+    # ---------------- Fetch stats ----------------
+    # Yahoo's players collection accepts up to 25 keys per request, so one
+    # call replaces 25 player/{key}/stats round-trips.
+    player_keys = [p["player_key"] for p in players if not stream.is_done(p["player_key"])]
+    batches = [
+        player_keys[i:i + BATCH_SIZE]
+        for i in range(0, len(player_keys), BATCH_SIZE)
+    ]
+
+    urls = [
+        f"{API_ROOT}/players;"
+        f"player_keys={','.join(batch)};out=stats?format=json"
+        for batch in batches
+    ]
+    logging.info("Fetching stats for %d players in %d requests", len(player_keys), len(urls))
+
+    for idx, (batch, res) in enumerate(zip(batches, iter_fetch(session, urls, keys=batches)), start=1):
+        if not res.ok:
+            # Not checkpointed, so a rerun retries this batch
+            logging.error("Failed to fetch stats for batch %d (%s..)", idx, batch[0])
+            continue
+
+        found = players_by_key(res.data.get("fantasy_content", {}).get("players"))
+
+        # Emit in league_players.csv order, same as the per-player loop did
+        for pk in batch:
+            if pk not in found:
+                logging.warning("No stats returned for %s", pk)
+                RUN_STATS.record_drop(pk)
+                stream.add(pk, [])
+                continue
+            stream.add(pk, player_rows(pk, found[pk]))
+
+    new_table = stream.read()
+    if new_table.num_rows == 0:
+        logging.info("No stats collected")
+        stream.discard()
+        return {"rows": 0}
+
+    # ---------------- Delta mode ----------------
+    if SNAPSHOT_MODE == "delta":
+        result = write_delta(new_table, snapshot_date, snapshot_dir=OUT_DIR,
+                             players=[p["player_key"] for p in players])
+        stream.discard()
+        return {"rows": new_table.num_rows, "changed": result["changed"]}
+
+    # ---------------- Upsert into the day file ----------------
+    # Keyed on (snapshot_date, player_key, stat_id): changed values replace the
+    # old row in place, new keys are appended, unchanged rows are left alone
+    # The day file stays in the folder's layout (DAILY_SCHEMA, v1 by default)
+    if DAILY_SCHEMA == "1":
+        # read_snapshot upgrades the v1 file written earlier in the day
+        existing = read_snapshot(out_file) if os.path.exists(out_file) else None
+        table, counts = upsert_tables(existing, new_table)
+        if counts["inserted"] or counts["updated"]:
+            write_daily(table, out_file)
+    else:
+        counts = upsert_file(out_file, new_table)
+
+    if not (counts["inserted"] or counts["updated"]):
+        logging.info("No stat changes since the last run today — nothing written")
+    else:
+        logging.info(
+            "Wrote %s: %d inserted, %d updated, %d unchanged",
+            out_file, counts["inserted"], counts["updated"], counts["unchanged"],
+        )
+
+    stream.discard()
+    return {"rows": new_table.num_rows, **counts}
+
+
+@instrumented("fetch_player_season_snapshot")
+def main():
+    if not os.environ.get("LEAGUE_KEY"):
+        logging.error("LEAGUE_KEY env var not set")
+        return 2
+
+    # ---------------- Load players ----------------
+    players = load_players()
+    if players is None:
+        logging.error("%s not found, run fetch_players.py first", PLAYERS_CSV)
+        return 1
+    if not players:
+        logging.info("No players found — exiting")
+        return 0
+
+    snapshot_players(yahoo_session(), players)
+    publish()
+    RUN_STATS.log_summary()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
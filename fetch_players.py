@@ -1,39 +1,55 @@
 # fetch_players.py
-import os, sys, logging, time
-from yahoo_oauth import OAuth2
+import os, sys, logging
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+import pyarrow as pa
+import pyarrow.parquet as pq
 from yahoo_utils import as_list, first_dict, find_all
 from safe_io import safe_write_csv, debug_dump
-from http_helpers import safe_get
+from fetch_engine import fetch_all, DEFAULT_WORKERS
+from http_helpers import RUN_STATS, API_ROOT, yahoo_session
+from metrics import timed, instrumented
+from raw_archive import run_time
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-LEAGUE_KEY = os.environ.get("LEAGUE_KEY")
-if not LEAGUE_KEY:
-    logging.error("LEAGUE_KEY env var not set")
-    sys.exit(2)
-
 OUT = "league_players.csv"
-oauth = OAuth2(None, None, from_file="oauth2.json")
-session = oauth.session
+PARQUET_OUT = "league_players.parquet"
+FIELDNAMES = ["player_key", "player_id", "editorial_player_key", "player_name"]
+PAGE_SIZE = 25
 
-rows = []
-start = 0
-count = 25
+PLAYERS_SCHEMA = pa.schema([(f, pa.string()) for f in FIELDNAMES])
 
-DEBUG_DUMP = os.environ.get("DEBUG_DUMP") == "1"
+# Persisted player dimension: FIELDNAMES + first_seen/last_seen dates, with
+# the date of the last full re-page in the file's schema metadata
+DIM_PATH = "data/dim_player.parquet"
+DIM_SCHEMA = PLAYERS_SCHEMA.append(pa.field("first_seen", pa.date32())).append(
+    pa.field("last_seen", pa.date32())
+)
+
+# "auto" re-pages the whole league every PLAYERS_FULL_REFRESH_DAYS days and
+# otherwise only fetches INCREMENTAL_QUERIES; "full" / "incremental" force one
+PLAYERS_MODE = os.environ.get("PLAYERS_MODE", "auto")
+FULL_REFRESH_DAYS = int(os.environ.get("PLAYERS_FULL_REFRESH_DAYS", "7"))
+
+# (filter, max pages) pairs that surface new or changed players cheaply:
+# everyone on a roster, everyone on waivers (recent drops), and the most
+# active players over the last week (call-ups and signings)
+INCREMENTAL_QUERIES = [
+    (";status=T", None),
+    (";status=W", None),
+    (";sort=AR;sort_type=lastweek", 2),
+]
 
-while True:
-    url = f"https://fantasysports.yahooapis.com/fantasy/v2/league/{LEAGUE_KEY}/players;start={start};count={count}?format=json"
-    logging.info("GET %s", url)
-    status, data = safe_get(session, url)
-    if DEBUG_DUMP and start == 0:
-        debug_dump(data, "debug_players_page0.json")
+DEBUG_DUMP = os.environ.get("DEBUG_DUMP") == "1"
 
+@timed("parse")
+def parse_page(data):
+    """Return player rows on one players page, or None if the league block is missing."""
     # league is list: index 1 typically contains containers
     league_list = as_list(data.get("fantasy_content", {}).get("league"))
     if len(league_list) < 2:
-        logging.warning("Unexpected league structure, stopping pagination")
-        break
+        return None
 
     # Collect any 'player' entries found anywhere under league_list[1]
     players_found = []
@@ -46,15 +62,12 @@ while True:
         else:
             players_found.append(cand)
 
-    if not players_found:
-        # If no players found for this page, stop
-        logging.info("No players found on page start=%d; stopping", start)
-        break
-
+    page_rows = []
     # Each wrapper may be a list of fragments OR a dict (safe)
     for wrapper in players_found:
         frag_list = wrapper if isinstance(wrapper, list) else [wrapper]
-        # Search fragments to gather canonical fields
+        # Search fragments to gather canonical fields; Yahoo puts player_key,
+        # player_id and editorial_player_key in fragments of their own
         player_key = None
         editorial_player_key = None
         player_id = None
@@ -63,32 +76,203 @@ while True:
         for frag in frag_list:
             if not isinstance(frag, dict):
                 continue
-            if "player_key" in frag:
-                player_key = frag.get("player_key")
-                editorial_player_key = frag.get("editorial_player_key")
-                player_id = frag.get("player_id")
+            player_key = frag.get("player_key") or player_key
+            editorial_player_key = frag.get("editorial_player_key") or editorial_player_key
+            player_id = frag.get("player_id") or player_id
             if "name" in frag:
                 name_frag = first_dict(frag.get("name"))
                 player_name = name_frag.get("full") or player_name
 
         if player_key:
-            rows.append({
+            page_rows.append({
                 "player_key": player_key,
                 "player_id": player_id,
                 "editorial_player_key": editorial_player_key,
                 "player_name": player_name,
             })
+    return page_rows
+
+
+def fetch_players(session, league_key: str, dump: bool = DEBUG_DUMP,
+                  filters: str = "", max_pages: Optional[int] = None) -> List[Dict]:
+    """
+    Every player in the league, in Yahoo's order. `filters` is appended to
+    the players collection (e.g. ";status=T"); `max_pages` stops early.
+    """
+    rows = []
+    start = 0
+    count = PAGE_SIZE
+    workers = DEFAULT_WORKERS if max_pages is None else max(1, min(DEFAULT_WORKERS, max_pages))
+
+    # The page count isn't known up front, so fetch FETCH_WORKERS pages at a
+    # time and stop at the first empty page. Pages are consumed in order.
+    done = False
+    while not done:
+        starts = [start + i * count for i in range(workers)]
+        if max_pages is not None:
+            starts = [s for s in starts if s < max_pages * count]
+            if not starts:
+                break
+        urls = [
+            f"{API_ROOT}/league/{league_key}/players{filters};start={s};count={count}?format=json"
+            for s in starts
+        ]
+        logging.info("GET players%s pages start=%d..%d", filters, starts[0], starts[-1])
+
+        for page_start, res in zip(starts, fetch_all(session, urls)):
+            if not res.ok:
+                raise res.error
+            if dump and page_start == 0 and not filters:
+                debug_dump(res.data, "debug_players_page0.json")
+
+            page_rows = parse_page(res.data)
+            if page_rows is None:
+                logging.warning("Unexpected league structure, stopping pagination")
+                done = True
+                break
+            if not page_rows:
+                # If no players found for this page, stop
+                logging.info("No players found on page start=%d; stopping", page_start)
+                done = True
+                break
+            rows.extend(page_rows)
+
+        # Pagination advance
+        start += count * len(starts)
+    return rows
+
+
+# ---------------- Player dimension ----------------
+def load_dim(path: str = DIM_PATH) -> Tuple[List[Dict], Optional[date]]:
+    """Dimension rows and the date of the last full refresh ([], None if absent)."""
+    if not os.path.exists(path):
+        return [], None
+    table = pq.read_table(path)
+    meta = table.schema.metadata or {}
+    last_full = meta.get(b"last_full_refresh")
+    return table.to_pylist(), date.fromisoformat(last_full.decode()) if last_full else None
+
+
+@timed("write")
+def save_dim(rows: List[Dict], last_full: Optional[date], path: str = DIM_PATH):
+    meta = {"last_full_refresh": last_full.isoformat()} if last_full else None
+    table = pa.Table.from_pylist(rows, schema=DIM_SCHEMA.with_metadata(meta))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression="snappy")
+    os.replace(tmp, path)
+
+
+def merge_dim(dim: List[Dict], fetched: List[Dict], today: date,
+              full: bool = False) -> Tuple[List[Dict], int, int]:
+    """
+    Fold fetched player rows into the dimension: new keys get first_seen,
+    every fetched key gets last_seen=today and its latest ids/name. A full
+    refresh reorders the dimension to Yahoo's order (players no longer
+    listed keep their old last_seen and go last). Returns (rows, new, changed).
+    """
+    by_key = {r["player_key"]: r for r in dim}
+    new = changed = 0
+    seen = {}
+    for p in fetched:
+        pk = p["player_key"]
+        if pk in seen:
+            continue
+        old = by_key.get(pk)
+        if old is None:
+            new += 1
+            row = {**{f: p.get(f) for f in FIELDNAMES}, "first_seen": today, "last_seen": today}
+        else:
+            row = dict(old, last_seen=today)
+            updates = {f: p[f] for f in FIELDNAMES[1:] if p.get(f) and p[f] != old.get(f)}
+            if updates:
+                changed += 1
+                row.update(updates)
+        seen[pk] = row
+
+    if full:
+        rows = list(seen.values()) + [r for r in dim if r["player_key"] not in seen]
+    else:
+        rows = [seen.pop(r["player_key"], r) for r in dim] + list(seen.values())
+    return rows, new, changed
+
+
+def current_players(dim: List[Dict], last_full: Optional[date]) -> List[Dict]:
+    """Dimension rows still in the league universe (seen since the last full refresh)."""
+    return [
+        {f: r[f] for f in FIELDNAMES}
+        for r in dim
+        if last_full is None or r["last_seen"] >= last_full
+    ]
+
+
+def refresh_players(session, league_key: str, mode: str = PLAYERS_MODE,
+                    dump: bool = DEBUG_DUMP, today: Optional[date] = None,
+                    filters: str = "", path: str = DIM_PATH) -> List[Dict]:
+    """
+    Update the player dimension at `path` and return the current league
+    players. Fully re-pages the league (players`filters`, e.g. ";status=ALL")
+    when `mode` is "full", when there is no dimension yet, or (mode "auto")
+    every FULL_REFRESH_DAYS days; otherwise only the INCREMENTAL_QUERIES are
+    fetched.
+    """
+    today = today or run_time().date()
+    dim, last_full = load_dim(path)
+    full = (
+        mode == "full"
+        or not dim
+        or last_full is None
+        or (mode == "auto" and (today - last_full).days >= FULL_REFRESH_DAYS)
+    )
+
+    if full:
+        fetched = fetch_players(session, league_key, dump=dump, filters=filters)
+        if not fetched:
+            # Keep the old dimension rather than emptying it
+            logging.warning("Full refresh returned no players — dimension unchanged")
+            return current_players(dim, last_full)
+        last_full = today
+    else:
+        fetched = []
+        for query, max_pages in INCREMENTAL_QUERIES:
+            fetched.extend(fetch_players(session, league_key, dump=dump,
+                                         filters=query, max_pages=max_pages))
+
+    dim, new, changed = merge_dim(dim, fetched, today, full=full)
+    save_dim(dim, last_full, path)
+    logging.info(
+        "%s player refresh: %d fetched, %d new, %d changed, %d in dimension",
+        "Full" if full else "Incremental", len(fetched), new, changed, len(dim),
+    )
+    return current_players(dim, last_full)
+
+
+@timed("write")
+def write_players(rows: List[Dict], out: str = OUT, parquet_out: Optional[str] = PARQUET_OUT) -> int:
+    # Safety guard: write only if rows exist
+    if not rows:
+        logging.warning("No players parsed — skipping write")
+        return 0
+    n = safe_write_csv(out, rows, FIELDNAMES, mode="w")
+    logging.info("Wrote %d rows to %s", n, out)
+    if parquet_out:
+        table = pa.Table.from_pylist(rows, schema=PLAYERS_SCHEMA)
+        pq.write_table(table, parquet_out, compression="snappy")
+        logging.info("Wrote %d rows to %s", n, parquet_out)
+    return n
+
 
-    # Pagination advance
-    start += count
-    # small delay to be friendly to API
-    time.sleep(0.12)
+@instrumented("fetch_players")
+def main():
+    league_key = os.environ.get("LEAGUE_KEY")
+    if not league_key:
+        logging.error("LEAGUE_KEY env var not set")
+        return 2
+    rows = refresh_players(yahoo_session(), league_key)
+    RUN_STATS.log_summary()
+    write_players(rows)
+    return 0
 
-# Safety guard: write only if rows exist
-if not rows:
-    logging.warning("No players parsed — skipping write")
-    sys.exit(0)
 
-fieldnames = ["player_key", "player_id", "editorial_player_key", "player_name"]
-n = safe_write_csv(OUT, rows, fieldnames, mode="w")
-logging.info("Wrote %d rows to %s", n, OUT)
+if __name__ == "__main__":
+    sys.exit(main())
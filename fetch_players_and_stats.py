@@ -1,109 +1,40 @@
+# fetch_players_and_stats.py
+"""
+Every league player, whatever their status, -> league_players.csv.
+
+Same refresh as fetch_players.py, over the players;status=ALL universe and
+with its own dimension (data/dim_player_all.parquet): the full list is
+re-paged every PLAYERS_FULL_REFRESH_DAYS days (or with PLAYERS_MODE=full)
+and in between only fetch_players.INCREMENTAL_QUERIES are fetched. Pages
+go through fetch_engine.fetch_all, so they share the rate limiter, retries,
+429 handling and the HTTP cache (HTTP_CACHE_DIR).
+"""
+
 import os
 import sys
-import csv
-import time
-from yahoo_oauth import OAuth2
-from yahoo_helpers import flatten_list, extract_name
-
-LEAGUE_KEY = os.environ.get("LEAGUE_KEY")
-if not LEAGUE_KEY:
-    sys.exit("ERROR: LEAGUE_KEY not set")
-
-oauth = OAuth2(None, None, from_file="oauth2.json")
-ROOT = "https://fantasysports.yahooapis.com/fantasy/v2"
-
-
-def get(url):
-    r = oauth.session.get(url)
-    print("GET", r.status_code, url)
-    if r.status_code != 200:
-        return None
-    try:
-        return r.json()
-    except Exception:
-        return None
-
-
-def find(node, key):
-    if isinstance(node, dict):
-        if key in node:
-            return node[key]
-        for v in node.values():
-            r = find(v, key)
-            if r is not None:
-                return r
-    elif isinstance(node, list):
-        for i in node:
-            r = find(i, key)
-            if r is not None:
-                return r
-    return None
-
-
-players = []
-start = 0
-count = 25
-
-while True:
-    url = (
-        f"{ROOT}/league/{LEAGUE_KEY}"
-        f"/players;status=ALL;start={start};count={count}?format=json"
-    )
-    j = get(url)
-    if not j:
-        break
-
-    players_node = find(j, "players")
-    if not isinstance(players_node, dict):
-        break
-
-    for k, entry in players_node.items():
-        if k == "count":
-            continue
-        if not isinstance(entry, dict):
-            continue
-
-        wrapper = entry.get("player")
-        if not wrapper:
-            continue
-
-        wrapper = flatten_list(wrapper)
+import logging
 
-        pk = pid = epk = name = None
-        for item in wrapper:
-            if not isinstance(item, dict):
-                continue
-            pk = pk or item.get("player_key")
-            pid = pid or item.get("player_id")
-            epk = epk or item.get("editorial_player_key")
-            name = name or extract_name(item)
+from fetch_players import refresh_players, write_players
+from http_helpers import RUN_STATS, yahoo_session
+from metrics import instrumented
 
-        players.append({
-            "player_key": pk,
-            "player_id": pid,
-            "editorial_player_key": epk,
-            "player_name": name,
-        })
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
-    if len(players) < start + count:
-        break
+STATUS_FILTER = ";status=ALL"
+DIM_PATH = "data/dim_player_all.parquet"
 
-    start += count
-    time.sleep(0.25)
 
+@instrumented("fetch_players_and_stats")
+def main():
+    league_key = os.environ.get("LEAGUE_KEY")
+    if not league_key:
+        logging.error("LEAGUE_KEY env var not set")
+        return 2
+    rows = refresh_players(yahoo_session(), league_key, filters=STATUS_FILTER, path=DIM_PATH)
+    RUN_STATS.log_summary()
+    write_players(rows, parquet_out=None)
+    return 0
 
-# ✅ CORRECT CSV WRITE (THIS FIXES YOUR CRASH)
-with open("league_players.csv", "w", newline="", encoding="utf-8") as f:
-    writer = csv.DictWriter(
-        f,
-        fieldnames=[
-            "player_key",
-            "player_id",
-            "editorial_player_key",
-            "player_name",
-        ],
-    )
-    writer.writeheader()
-    writer.writerows(players)
 
-print("Wrote league_players.csv rows:", len(players))
+if __name__ == "__main__":
+    sys.exit(main())
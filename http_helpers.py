@@ -1,27 +1,497 @@
 # http_helpers.py
+import os
+import json
 import time
+import atexit
+import random
+import hashlib
 import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit, parse_qsl
 
-def safe_get(session, url, max_retries=3, backoff=0.5, timeout=30):
+from metrics import METRICS
+from raw_archive import recorder, replay_source
+
+# Base URL for every Yahoo Fantasy request; point it at a local stand-in
+# (yahoo_stub.py) together with YAHOO_OFFLINE=1 to run without credentials
+API_ROOT = os.environ.get("YAHOO_API_ROOT", "https://fantasysports.yahooapis.com/fantasy/v2").rstrip("/")
+
+
+def yahoo_session(token_file="oauth2.json"):
+    """
+    Session for API_ROOT: the OAuth2 session from token_file, or a plain
+    requests.Session when YAHOO_OFFLINE=1 or when replaying a raw archive.
+    """
+    if os.environ.get("YAHOO_OFFLINE") == "1" or replay_source() is not None:
+        import requests
+        return requests.Session()
+    from yahoo_oauth import OAuth2
+    return OAuth2(None, None, from_file=token_file).session
+
+
+# Per-resource freshness (seconds). Within the TTL a cached body is
+# returned without touching the network; after it the request is sent
+# with If-None-Match / If-Modified-Since. A URL gets the smallest TTL of
+# the resource it names (see url_resource) and every out= subresource it
+# pulls in, so teams;out=roster is as fresh as a roster. Resources not
+# listed always revalidate. check_ttls.py lists what each fetch URL gets.
+DEFAULT_TTLS = {
+    "stats": 0,                  # stats move constantly: always revalidate
+    "roster": 300,
+    "standings": 300,
+    "teams": 3600,
+    "players": 24 * 3600,        # player metadata rarely changes
+}
+
+# Filtered listings whose content moves faster than the resource itself:
+# (resource, param, value or None for any value, ttl). The first rule a
+# URL matches replaces its resource's TTL. The status / sort listings
+# fetch_players.refresh_players polls between full refreshes are what
+# surface roster moves, so they always revalidate; only the full
+# status=ALL listing keeps the players TTL.
+FILTER_TTLS = [
+    ("players", "status", "ALL", 24 * 3600),
+    ("players", "status", None, 0),
+    ("players", "sort", None, 0),
+]
+
+
+def url_resource(url):
+    """
+    (resource, params) of a Yahoo API url: the resource is the last path
+    segment's name ("players" in league/K/players;start=0, "stats" in
+    player/K/stats;date=D), params its ;key=value pairs plus the query string.
+    """
+    parts = urlsplit(url)
+    name, *pairs = parts.path.rstrip("/").rsplit("/", 1)[-1].split(";")
+    params = dict(p.split("=", 1) if "=" in p else (p, "") for p in pairs)
+    params.update(parse_qsl(parts.query))
+    return name, params
+
+
+class ResponseCache:
+    """
+    On-disk cache of JSON response bodies keyed by URL, with ETag /
+    Last-Modified validators, per-endpoint TTLs and size-bounded LRU eviction.
+    Layout: <root>/index.json plus one <sha1>.json body file per URL.
+    Index changes (stores, 304s, last_used on hits) are written every
+    `flush_every` changes and at exit, not on every request.
+    """
+
+    def __init__(self, root, max_bytes=200 * 1024 * 1024, ttls=None, default_ttl=0, flush_every=50,
+                 filter_ttls=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.filter_ttls = list(FILTER_TTLS if filter_ttls is None else filter_ttls)
+        self.default_ttl = default_ttl
+        self.flush_every = max(1, flush_every)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = 0
+        os.makedirs(root, exist_ok=True)
+        self._index_path = os.path.join(root, "index.json")
+        try:
+            with open(self._index_path, encoding="utf-8") as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+        atexit.register(self.flush)
+
+    def ttl_for(self, url):
+        resource, params = url_resource(url)
+        ttls = [next((
+            t for res, key, value, t in self.filter_ttls
+            if res == resource and key in params and value in (None, params[key])
+        ), self.ttls.get(resource, self.default_ttl))]
+        ttls += [self.ttls.get(r, self.default_ttl) for r in params.get("out", "").split(",") if r]
+        return min(ttls)
+
+    def _body_path(self, url):
+        return os.path.join(self.root, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+    def lookup(self, url):
+        """Return the index entry for url (a copy) or None."""
+        with self._lock:
+            entry = self._index.get(url)
+            return dict(entry) if entry else None
+
+    def is_fresh(self, url, entry):
+        return time.time() - entry["stored_at"] < self.ttl_for(url)
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def raw(self, url):
+        """Return the cached body bytes, or None if the body file is gone."""
+        try:
+            with open(self._body_path(url), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def load(self, url):
+        """Return the cached JSON body, or None if the body file is gone."""
+        raw = self.raw(url)
+        if raw is None:
+            return None
+        try:
+            with METRICS.phase("parse"):
+                data = json.loads(raw)
+        except ValueError:
+            return None
+        with self._lock:
+            if url in self._index:
+                self._index[url]["last_used"] = time.time()
+                self._dirty += 1
+        self._maybe_flush()
+        return data
+
+    def revalidated(self, url):
+        """Record a 304: the cached body is current as of now."""
+        with self._lock:
+            if url in self._index:
+                self._index[url]["stored_at"] = time.time()
+                self._dirty += 1
+        self._maybe_flush()
+
+    def store(self, url, body, headers):
+        path = self._body_path(url)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+
+        now = time.time()
+        with self._lock:
+            self._index[url] = {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "stored_at": now,
+                "last_used": now,
+                "size": len(body),
+            }
+            self._evict()
+            self._dirty += 1
+        self._maybe_flush()
+
+    def _evict(self):
+        total = sum(e["size"] for e in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for url, entry in sorted(self._index.items(), key=lambda kv: kv[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._body_path(url))
+            except OSError:
+                pass
+            total -= entry["size"]
+            del self._index[url]
+
+    def _maybe_flush(self):
+        if self._dirty >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write the index if it changed since the last write."""
+        # Saves run one at a time and in order; the index lock is only held
+        # while serialising, not during the file write
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                text = json.dumps(self._index)
+                self._dirty = 0
+            tmp = self._index_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, self._index_path)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """
+    Process-wide cache enabled by HTTP_CACHE_DIR (size via HTTP_CACHE_MAX_MB).
+    Returns None when caching is not configured.
+    """
+    global _default_cache
+    root = os.environ.get("HTTP_CACHE_DIR")
+    if not root:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None or _default_cache.root != root:
+            max_mb = float(os.environ.get("HTTP_CACHE_MAX_MB", "200"))
+            _default_cache = ResponseCache(root, max_bytes=int(max_mb * 1024 * 1024))
+        return _default_cache
+
+
+def configure_pool(session, pool_size):
+    """
+    Make sure `session` keeps at least pool_size keep-alive connections per
+    host, so concurrent workers reuse connections instead of reconnecting.
+    """
+    try:
+        from requests.adapters import HTTPAdapter
+    except ImportError:
+        return
+    if not hasattr(session, "mount"):
+        return
+    current = session.get_adapter("https://")
+    if getattr(current, "_pool_maxsize", 0) >= pool_size:
+        return
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
+class CircuitBreaker:
+    """
+    Process-wide pause switch. A 429 (or a run of consecutive failures)
+    opens the breaker for a cooldown and every worker blocks in wait()
+    until it closes, so a throttled run backs off together instead of
+    each thread hammering the API on its own schedule.
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._open_until = 0.0
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self._lock:
+                delay = self._open_until - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def trip(self, delay):
+        with self._lock:
+            until = time.monotonic() + delay
+            if until > self._open_until:
+                logging.warning("Circuit open: pausing all requests for %.1fs", delay)
+                self._open_until = until
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            tripped = self._failures >= self.failure_threshold
+            if tripped:
+                self._failures = 0
+        if tripped:
+            self.trip(self.cooldown)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+
+class RunStats:
+    """Thread-safe per-run request counters, reported at the end of a script."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.status_counts = {}
+        self.retried = set()
+        self.dropped = set()
+
+    def record_response(self, url, status):
+        with self._lock:
+            self.requests += 1
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            if status == 429:
+                self.throttled += 1
+
+    @staticmethod
+    def _keys(key):
+        # A batched request is labelled with all the keys it covers
+        return key if isinstance(key, (list, tuple)) else [key]
+
+    def record_retry(self, key):
+        with self._lock:
+            self.retried.update(self._keys(key))
+
+    def record_drop(self, key):
+        with self._lock:
+            self.dropped.update(self._keys(key))
+
+    def summary(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "status_counts": dict(self.status_counts),
+                "retried_keys": len(self.retried),
+                "dropped_keys": len(self.dropped),
+            }
+
+    def log_summary(self):
+        s = self.summary()
+        logging.info(
+            "Run stats: %d requests, %d throttled, %d keys retried, %d keys dropped",
+            s["requests"], s["throttled"], s["retried_keys"], s["dropped_keys"],
+        )
+        if self.dropped:
+            logging.warning("Dropped keys: %s", ", ".join(sorted(self.dropped)))
+
+
+BREAKER = CircuitBreaker()
+RUN_STATS = RunStats()
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_BACKOFF = 60.0
+
+
+def retry_after_seconds(r):
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds, or None."""
+    value = getattr(r, "headers", {}).get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(backoff, attempt):
+    """Exponential backoff with full jitter, capped at MAX_BACKOFF."""
+    return random.uniform(0, min(MAX_BACKOFF, backoff * 2 ** (attempt - 1)))
+
+
+def safe_get(session, url, max_retries=5, backoff=0.5, timeout=30, limiter=None, cache=None,
+             breaker=None, stats=None, key=None):
     """
     session: requests-like session (oauth.session)
+    limiter: optional shared rate limiter (fetch_engine.TokenBucket);
+             acquire() is called before every attempt, and on_throttle() /
+             on_success() are called when it supports AIMD.
+    cache:   ResponseCache; defaults to default_cache(), pass False to bypass.
+    breaker: CircuitBreaker shared by all workers (default BREAKER).
+    stats:   RunStats to count requests, retries and drops (default RUN_STATS);
+             `key` (a key or list of keys) labels this call in the
+             retried/dropped sets (default url).
+    429/5xx and network errors are retried with exponential backoff and
+    jitter; a 429 honours Retry-After and pauses every worker via the breaker.
+    Every response, retry and cache hit is reported to metrics.METRICS, with
+    JSON decoding timed as "parse" and all waiting as "sleep".
+    With RAW_ARCHIVE_DIR set every body returned is kept in the run's raw
+    archive; with RAW_REPLAY the body comes from the archive instead (see
+    raw_archive.py).
     Returns (status_code, json) or raises.
     """
+    replay = replay_source()
+    if replay is not None:
+        t0 = time.perf_counter()
+        body = replay.body(url)
+        METRICS.observe_request(url, 200, time.perf_counter() - t0, len(body))
+        with METRICS.phase("parse"):
+            return 200, json.loads(body)
+
+    archive = recorder()
+    if cache is None:
+        cache = default_cache()
+    breaker = BREAKER if breaker is None else breaker
+    stats = RUN_STATS if stats is None else stats
+    key = key or url
+
+    entry = cache.lookup(url) if cache else None
+    if entry and cache.is_fresh(url, entry):
+        data = cache.load(url)
+        if data is not None:
+            METRICS.record_cache_hit(url)
+            if archive:
+                archive.record(url, cache.raw(url) or json.dumps(data).encode("utf-8"))
+            return 200, data
+        entry = None
+
+    headers = ResponseCache.conditional_headers(entry)
+    on_success = getattr(limiter, "on_success", None)
+    on_throttle = getattr(limiter, "on_throttle", None)
     last_exc = None
     for attempt in range(1, max_retries + 1):
+        if attempt > 1:
+            stats.record_retry(key)
+            METRICS.record_retry(url)
+        delay = backoff_delay(backoff, attempt)
         try:
-            r = session.get(url, timeout=timeout)
-            if r.status_code == 200:
+            with METRICS.phase("sleep"):
+                breaker.wait()
+                if limiter is not None:
+                    limiter.acquire()
+            t0 = time.perf_counter()
+            if headers:
+                r = session.get(url, timeout=timeout, headers=headers)
+            else:
+                r = session.get(url, timeout=timeout)
+            METRICS.observe_request(url, r.status_code, time.perf_counter() - t0, len(r.content or b""))
+            stats.record_response(url, r.status_code)
+            if r.status_code == 304 and entry:
+                data = cache.load(url)
+                if data is not None:
+                    cache.revalidated(url)
+                    if archive:
+                        archive.record(url, cache.raw(url) or json.dumps(data).encode("utf-8"))
+                    breaker.record_success()
+                    if on_success:
+                        on_success()
+                    return 200, data
+                headers = {}
+                last_exc = RuntimeError("HTTP 304 without cached body")
+            elif r.status_code == 200:
                 try:
-                    return 200, r.json()
+                    with METRICS.phase("parse"):
+                        data = r.json()
                 except Exception as e:
                     logging.exception("Failed to decode JSON")
                     raise
+                if cache:
+                    cache.store(url, r.content, r.headers)
+                if archive:
+                    archive.record(url, r.content)
+                breaker.record_success()
+                if on_success:
+                    on_success()
+                return 200, data
             else:
                 logging.warning("HTTP %s %s (attempt %d/%d)", r.status_code, url, attempt, max_retries)
                 last_exc = RuntimeError(f"HTTP {r.status_code}")
+                if r.status_code not in RETRY_STATUSES:
+                    break
+                if r.status_code == 429:
+                    if on_throttle:
+                        on_throttle()
+                    # A missing, zero or past Retry-After still waits out the backoff
+                    retry_after = retry_after_seconds(r) or 0.0
+                    breaker.trip(max(retry_after, delay, backoff))
+                    continue
+                breaker.record_failure()
         except Exception as e:
             last_exc = e
+            breaker.record_failure()
             logging.warning("Request error %s (attempt %d/%d) %s", e, attempt, max_retries, url)
-        time.sleep(backoff * attempt)
+        if attempt < max_retries:
+            with METRICS.phase("sleep"):
+                time.sleep(delay)
+    stats.record_drop(key)
     raise last_exc
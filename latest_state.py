@@ -0,0 +1,131 @@
+# latest_state.py
+"""
+Latest player x stat state as a memory-mapped Arrow IPC file.
+
+    python latest_state.py publish      # after a snapshot run
+    python latest_state.py info
+
+    from latest_state import load_latest, LatestState
+    t = load_latest()                   # zero-copy pa.Table
+    cache = LatestState(); t = cache.get()   # re-maps only when republished
+
+publish() takes the newest season state (newest daily snapshot, or the
+CDC store when that is newer), sorts it by (player_key, stat_id) and
+writes it uncompressed to data/latest_state.arrow through a temp file
+and os.replace, so readers never see a partial file. Uncompressed IPC
+can be memory-mapped: load_latest() decodes nothing, and every process
+mapping the file shares the same page-cache pages. A reader that mapped
+the previous version keeps a valid view of it until it reloads.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+import pyarrow as pa
+
+from snapshot_store import SNAPSHOT_DIR, daily_files
+from snapshot_schema import read_snapshot, sort_snapshot
+from snapshot_delta import DELTA_DIR, checkpoints, deltas, rebuild_day
+from metrics import timed
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+LATEST_PATH = os.environ.get("LATEST_STATE_PATH", "data/latest_state.arrow")
+
+
+def newest_state(snapshot_dir: str = SNAPSHOT_DIR, delta_dir: str = DELTA_DIR):
+    """(snapshot_date, v2 table) for the newest day in either store, or (None, None)."""
+    files = daily_files(snapshot_dir)
+    newest_daily = max(files) if files else None
+    cdc = [*checkpoints(delta_dir), *deltas(delta_dir)]
+    newest_cdc = max(cdc) if cdc else None
+
+    if newest_cdc and (newest_daily is None or newest_cdc > newest_daily):
+        return newest_cdc, rebuild_day(newest_cdc, delta_dir)
+    if newest_daily:
+        return newest_daily, read_snapshot(files[newest_daily])
+    return None, None
+
+
+@timed("write")
+def publish(table: Optional[pa.Table] = None, snapshot_date: Optional[str] = None,
+            path: str = LATEST_PATH) -> Optional[str]:
+    """Write the latest state (newest_state() unless given) and swap it in; returns the path."""
+    if table is None:
+        snapshot_date, table = newest_state()
+        if table is None:
+            logging.warning("No snapshot state to publish")
+            return None
+
+    table = sort_snapshot(table).combine_chunks()
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        b"snapshot_date": (snapshot_date or "").encode(),
+        b"published_at": datetime.now(timezone.utc).isoformat().encode(),
+    })
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+    logging.info("Published %s: %d rows (snapshot %s)", path, table.num_rows, snapshot_date)
+    return path
+
+
+def load_latest(path: str = LATEST_PATH) -> pa.Table:
+    """Memory-map the published state; no copy or decode."""
+    with pa.memory_map(path, "r") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+class LatestState:
+    """Polling-friendly loader: re-maps the file only after a new publish."""
+
+    def __init__(self, path: str = LATEST_PATH):
+        self.path = path
+        self._stamp = None
+        self._table = None
+
+    def get(self) -> pa.Table:
+        st = os.stat(self.path)
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stamp != self._stamp:
+            self._table = load_latest(self.path)
+            self._stamp = stamp
+        return self._table
+
+    @property
+    def snapshot_date(self) -> Optional[str]:
+        meta = self.get().schema.metadata or {}
+        return meta.get(b"snapshot_date", b"").decode() or None
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Publish / inspect the latest-state Arrow file")
+    ap.add_argument("cmd", choices=["publish", "info"])
+    ap.add_argument("--path", default=LATEST_PATH)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "publish":
+        return 0 if publish(path=args.path) else 1
+
+    if not os.path.exists(args.path):
+        print(f"{args.path} not published yet")
+        return 1
+    t0 = time.perf_counter()
+    t = load_latest(args.path)
+    ms = (time.perf_counter() - t0) * 1e3
+    meta = t.schema.metadata or {}
+    print(f"{args.path}: {t.num_rows} rows, snapshot {meta.get(b'snapshot_date', b'').decode()}, "
+          f"published {meta.get(b'published_at', b'').decode()}, mapped in {ms:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
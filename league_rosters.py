@@ -0,0 +1,129 @@
+# league_rosters.py
+"""Fetch and parse team rosters (and standings) for a whole league."""
+
+import logging
+from typing import Any, Dict, List, Optional
+
+from yahoo_utils import as_list, first_dict, find_all, merge_fragments
+from http_helpers import safe_get, API_ROOT
+from safe_io import debug_dump
+from fetch_engine import fetch_all
+from metrics import timed
+
+ROOT = API_ROOT
+
+
+@timed("parse")
+def parse_team(team_nodes: Any) -> Dict:
+    """
+    Parse a team node list ([meta fragments], {"roster": ..}, {"team_standings": ..})
+    as returned by team/{key}/roster and league/{key}/teams;out=... alike.
+    """
+    team_nodes = as_list(team_nodes)
+    meta = merge_fragments(team_nodes[:1])
+    subresources = merge_fragments(team_nodes[1:])
+
+    players = []
+    for p in find_all(subresources.get("roster"), "player"):
+        frags = merge_fragments(p)
+        if not frags.get("player_key"):
+            continue
+        players.append({
+            "player_key": frags.get("player_key"),
+            "player_id": frags.get("player_id"),
+            "editorial_player_key": frags.get("editorial_player_key"),
+            "player_name": first_dict(frags.get("name")).get("full"),
+            "position": frags.get("display_position"),
+        })
+
+    name = meta.get("name")
+    return {
+        "team_key": meta.get("team_key"),
+        "team_name": name if isinstance(name, str) else first_dict(name).get("full"),
+        "players": players,
+        "has_roster": "roster" in subresources,
+        "standings": first_dict(subresources.get("team_standings")),
+    }
+
+
+@timed("parse")
+def parse_league_teams(data: Dict) -> List[Dict]:
+    """Parse every team under fantasy_content.league[1].teams."""
+    league_list = as_list(data.get("fantasy_content", {}).get("league"))
+    if len(league_list) < 2:
+        return []
+    teams = [parse_team(t) for t in find_all(league_list[1], "team")]
+    return [t for t in teams if t["team_key"]]
+
+
+def standings_row(team: Dict) -> Dict:
+    st = team["standings"]
+    totals = first_dict(st.get("outcome_totals"))
+    return {
+        "team_key": team["team_key"],
+        "team_name": team["team_name"],
+        "rank": st.get("rank"),
+        "wins": totals.get("wins"),
+        "losses": totals.get("losses"),
+        "ties": totals.get("ties"),
+        "percentage": totals.get("percentage"),
+        "games_back": st.get("games_back"),
+    }
+
+
+def fetch_league_teams(session, league_key: str, dump: bool = False) -> Optional[List[Dict]]:
+    """
+    All rosters and standings in a single request. Returns None if the
+    combined call fails or comes back without rosters, so callers can fall
+    back to fetch_teams_per_team.
+    """
+    url = f"{ROOT}/league/{league_key}/teams;out=roster,standings?format=json"
+    logging.info("GET teams+rosters+standings %s", url)
+    try:
+        _, data = safe_get(session, url)
+    except Exception:
+        logging.exception("League-wide roster fetch failed")
+        return None
+    if dump:
+        debug_dump(data, "debug_league_teams.json")
+
+    teams = parse_league_teams(data)
+    if not teams or not all(t["has_roster"] for t in teams):
+        logging.warning("League-wide roster response incomplete")
+        return None
+    return teams
+
+
+def fetch_teams_per_team(session, league_key: str, dump: bool = False) -> List[Dict]:
+    """Slow path: list teams, then one team/{key}/roster call per team."""
+    url = f"{ROOT}/league/{league_key}/teams?format=json"
+    logging.info("GET teams %s", url)
+    _, data = safe_get(session, url)
+    if dump:
+        debug_dump(data, "debug_teams.json")
+    team_keys = [t["team_key"] for t in parse_league_teams(data)]
+
+    roster_urls = [f"{ROOT}/team/{k}/roster?format=json" for k in team_keys]
+    logging.info("GET %d rosters", len(roster_urls))
+
+    teams = []
+    for team_key, res in zip(team_keys, fetch_all(session, roster_urls, keys=team_keys)):
+        if not res.ok:
+            logging.error("Failed to fetch roster for %s", team_key)
+            continue
+        if dump:
+            debug_dump(res.data, f"debug_roster_{team_key.replace('/', '_')}.json")
+        team = parse_team(res.data.get("fantasy_content", {}).get("team"))
+        if not team["team_key"]:
+            logging.warning("Unexpected team block for %s", team_key)
+            continue
+        teams.append(team)
+    return teams
+
+
+def fetch_teams(session, league_key: str, dump: bool = False) -> List[Dict]:
+    """Rosters for every team: one request when possible, N+1 otherwise."""
+    teams = fetch_league_teams(session, league_key, dump)
+    if teams is None:
+        teams = fetch_teams_per_team(session, league_key, dump)
+    return teams
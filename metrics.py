@@ -0,0 +1,378 @@
+# metrics.py
+"""
+Per-run instrumentation: request latency histograms, phase timings and
+a metrics file at the end of every run.
+
+    from metrics import METRICS, timed, instrumented
+
+    @instrumented("fetch_players")      # on a script's main()
+    def main(): ...
+
+    @timed("parse")                     # on parse / write helpers
+    def parse_page(data): ...
+
+http_helpers.safe_get reports every request (endpoint, status, latency,
+bytes), retries and cache hits, and times JSON decoding as "parse" and
+backoff / circuit-breaker / rate-limit waits as "sleep". Writers time
+themselves as "write". Phase times are summed over threads, so with
+concurrent workers they are thread-seconds and can exceed the run's wall
+time; a phase nested in the same phase on one thread is counted once.
+
+When a run finishes, instrumented() writes two files to METRICS_DIR
+(default "metrics"; empty disables them):
+
+    <job>.json   everything below, with p50/p90/p99 estimated from the buckets
+    <job>.prom   the same in Prometheus text format for node_exporter's
+                 textfile collector
+
+RUN_PROFILE=cprofile and/or tracemalloc (comma-separated) also captures
+<job>.pstats (all threads) and <job>.tracemalloc.txt (top allocation sites
+and the traced peak) next to them.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List, Optional
+
+METRICS_DIR = os.environ.get("METRICS_DIR", "metrics")
+RUN_PROFILE = {p.strip() for p in os.environ.get("RUN_PROFILE", "").split(",") if p.strip()}
+
+# Request latency buckets (seconds), Prometheus-style upper bounds
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PHASES = ("parse", "sleep", "write")
+TRACEMALLOC_TOP = 25
+
+
+def endpoint_of(url: str) -> str:
+    """
+    Low-cardinality label for a Yahoo URL: keys become {key}, matrix
+    params are dropped except out=..., e.g.
+    .../league/466.l.1/players;start=25;count=25 -> league/{key}/players
+    """
+    path = re.sub(r"^[a-z]+://[^/]+", "", url.split("?", 1)[0])
+    path = re.sub(r"^/fantasy/v2", "", path).strip("/")
+    parts = []
+    for segment in path.split("/"):
+        name, *params = segment.split(";")
+        if re.search(r"\.(l|p|t)\.", name) or name.isdigit():
+            name = "{key}"
+        out = [p for p in params if p.startswith("out=")]
+        parts.append(";".join([name] + out))
+    return "/".join(parts) or "/"
+
+
+class Histogram:
+    """Fixed-bucket histogram (not thread-safe; RunMetrics holds the lock)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)       # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for upper, n in zip(list(self.buckets) + [self.max], self.counts):
+            upper = min(upper, self.max)
+            if n and seen + n >= rank:
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = upper
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            **{f"p{int(q * 100)}": None if self.quantile(q) is None else round(self.quantile(q), 6)
+               for q in (0.5, 0.9, 0.99)},
+            "buckets": {str(b): c for b, c in zip(list(self.buckets) + ["+Inf"], self._cumulative())},
+        }
+
+    def _cumulative(self) -> List[int]:
+        out, total = [], 0
+        for c in self.counts:
+            total += c
+            out.append(total)
+        return out
+
+
+def peak_rss_bytes() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class RunMetrics:
+    """Thread-safe per-run instrumentation; one process-wide instance (METRICS)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._t0 = time.perf_counter()
+            self.latency: Dict[str, Histogram] = defaultdict(Histogram)
+            self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+            self.retries: Dict[str, int] = defaultdict(int)
+            self.cache_hits: Dict[str, int] = defaultdict(int)
+            self.bytes: Dict[str, int] = defaultdict(int)
+            self.phases: Dict[str, float] = {p: 0.0 for p in PHASES}
+            self.stages: Dict[str, Dict] = {}
+
+    # ---------------- recording ----------------
+    def observe_request(self, url: str, status: int, seconds: float, nbytes: int = 0):
+        ep = endpoint_of(url)
+        with self._lock:
+            self.latency[ep].observe(seconds)
+            self.statuses[ep][status] += 1
+            self.bytes[ep] += nbytes
+
+    def record_retry(self, url: str):
+        with self._lock:
+            self.retries[endpoint_of(url)] += 1
+
+    def record_cache_hit(self, url: str):
+        with self._lock:
+            self.cache_hits[endpoint_of(url)] += 1
+
+    def add_time(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the block as `name`, unless this thread is already inside `name`."""
+        active = self._local.__dict__.setdefault("active", set())
+        if name in active:
+            yield
+            return
+        active.add(name)
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            active.discard(name)
+            self.add_time(name, time.perf_counter() - t0)
+
+    def record_stage(self, name: str, seconds: float, status: str):
+        with self._lock:
+            self.stages[name] = {"seconds": round(seconds, 3), "status": status}
+
+    # ---------------- output ----------------
+    def to_dict(self, job: str) -> Dict:
+        with self._lock:
+            endpoints = sorted(set(self.latency) | set(self.cache_hits))
+            return {
+                "job": job,
+                "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+                "duration_s": round(time.perf_counter() - self._t0, 3),
+                "peak_rss_bytes": peak_rss_bytes(),
+                "requests": sum(h.count for h in self.latency.values()),
+                "bytes_downloaded": sum(self.bytes.values()),
+                "phases_s": {p: round(v, 3) for p, v in self.phases.items()},
+                "stages": dict(self.stages),
+                "endpoints": {
+                    ep: {
+                        "latency_s": self.latency[ep].to_dict() if ep in self.latency else None,
+                        "status_counts": {str(s): n for s, n in sorted(self.statuses[ep].items())},
+                        "retries": self.retries.get(ep, 0),
+                        "cache_hits": self.cache_hits.get(ep, 0),
+                        "bytes": self.bytes.get(ep, 0),
+                    }
+                    for ep in endpoints
+                },
+            }
+
+    def to_prometheus(self, job: str) -> str:
+        d = self.to_dict(job)
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def sample(name, labels, value):
+            labels = {"job": job, **labels}
+            body = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{body}}} {value}")
+
+        metric("yahoo_request_duration_seconds", "histogram", "Yahoo API request latency by endpoint.")
+        for ep, e in d["endpoints"].items():
+            h = e["latency_s"]
+            if not h:
+                continue
+            for le, n in h["buckets"].items():
+                sample("yahoo_request_duration_seconds_bucket", {"endpoint": ep, "le": le}, n)
+            sample("yahoo_request_duration_seconds_sum", {"endpoint": ep}, h["sum"])
+            sample("yahoo_request_duration_seconds_count", {"endpoint": ep}, h["count"])
+        metric("yahoo_requests_total", "counter", "Yahoo API responses by endpoint and status.")
+        for ep, e in d["endpoints"].items():
+            for status, n in e["status_counts"].items():
+                sample("yahoo_requests_total", {"endpoint": ep, "status": status}, n)
+        for name, key, help_text in (
+            ("yahoo_request_retries_total", "retries", "Retried Yahoo API requests by endpoint."),
+            ("yahoo_cache_hits_total", "cache_hits", "Requests answered from the local response cache."),
+            ("yahoo_response_bytes_total", "bytes", "Response bytes downloaded by endpoint."),
+        ):
+            metric(name, "counter", help_text)
+            for ep, e in d["endpoints"].items():
+                sample(name, {"endpoint": ep}, e[key])
+        metric("yahoo_run_phase_seconds", "gauge", "Thread-seconds spent parsing, sleeping and writing.")
+        for p, v in d["phases_s"].items():
+            sample("yahoo_run_phase_seconds", {"phase": p}, v)
+        if d["stages"]:
+            metric("yahoo_run_stage_seconds", "gauge", "Wall time of each pipeline stage.")
+            for s, st in d["stages"].items():
+                sample("yahoo_run_stage_seconds", {"stage": s, "status": st["status"]}, st["seconds"])
+        metric("yahoo_run_duration_seconds", "gauge", "Wall time of the run.")
+        sample("yahoo_run_duration_seconds", {}, d["duration_s"])
+        if d["peak_rss_bytes"] is not None:
+            metric("yahoo_run_peak_rss_bytes", "gauge", "Peak resident set size of the run.")
+            sample("yahoo_run_peak_rss_bytes", {}, d["peak_rss_bytes"])
+        metric("yahoo_run_finished_timestamp_seconds", "gauge", "Unix time the run finished.")
+        sample("yahoo_run_finished_timestamp_seconds", {}, round(time.time(), 3))
+        return "\n".join(lines) + "\n"
+
+    def write(self, job: str, out_dir: str = METRICS_DIR) -> List[str]:
+        """Write <job>.json and <job>.prom atomically; returns the paths."""
+        if not out_dir:
+            return []
+        os.makedirs(out_dir, exist_ok=True)
+        paths = []
+        for ext, text in ((".json", json.dumps(self.to_dict(job), indent=2)), (".prom", self.to_prometheus(job))):
+            path = os.path.join(out_dir, job + ext)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+            paths.append(path)
+        return paths
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = RunMetrics()
+
+
+def timed(phase: str):
+    """Decorator: time every call of the function as `phase` in METRICS."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with METRICS.phase(phase):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ---------------- Optional profiling ----------------
+class _Capture:
+    """cProfile (every thread) and/or tracemalloc, per RUN_PROFILE."""
+
+    def __init__(self, modes):
+        self.modes = set(modes)
+        self.profiles = []
+        self._lock = threading.Lock()
+        self._main = None
+
+    def start(self):
+        if "tracemalloc" in self.modes:
+            import tracemalloc
+            tracemalloc.start(10)
+        if "cprofile" in self.modes:
+            import cProfile
+
+            def start_thread_profile(*_):
+                # Runs once in each new thread, then hands over to the C profiler
+                prof = cProfile.Profile()
+                with self._lock:
+                    self.profiles.append(prof)
+                prof.enable()
+
+            threading.setprofile(start_thread_profile)
+            self._main = cProfile.Profile()
+            self._main.enable()
+
+    def stop(self, job: str, out_dir: str) -> List[str]:
+        os.makedirs(out_dir or ".", exist_ok=True)
+        paths = []
+        if self._main is not None:
+            import pstats
+            self._main.disable()
+            threading.setprofile(None)
+            stats = pstats.Stats(self._main)
+            for prof in self.profiles:
+                stats.add(prof)
+            path = os.path.join(out_dir, f"{job}.pstats")
+            stats.dump_stats(path)
+            paths.append(path)
+        if "tracemalloc" in self.modes:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            path = os.path.join(out_dir, f"{job}.tracemalloc.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"traced current {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB\n\n")
+                for stat in snapshot.statistics("traceback")[:TRACEMALLOC_TOP]:
+                    f.write(f"{stat.size / 2**20:8.2f} MiB {stat.count:8d} blocks\n")
+                    f.write("\n".join(f"    {line}" for line in stat.traceback.format()) + "\n")
+            paths.append(path)
+        return paths
+
+
+def instrumented(job: str):
+    """
+    Decorator for a script's main(): resets METRICS, starts the RUN_PROFILE
+    capture, and writes the metrics (and captures) when main returns or raises.
+    """
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            METRICS.reset()
+            capture = _Capture(RUN_PROFILE) if RUN_PROFILE else None
+            if capture:
+                capture.start()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                paths = capture.stop(job, METRICS_DIR) if capture else []
+                paths += METRICS.write(job)
+                if paths:
+                    logging.info("Run metrics: %s", ", ".join(paths))
+        return wrapper
+    return decorate
@@ -0,0 +1,221 @@
+# pipeline.py
+"""
+Run the fetch scripts as stages of one in-process DAG.
+
+    python pipeline.py                                   # DEFAULT_STAGES
+    python pipeline.py --stages players,season_snapshot
+    python pipeline.py --list
+
+All stages share one OAuth2 session (so one connection pool and the
+process-wide rate limiter in fetch_engine) and hand their results to each
+other in memory: the player list goes straight from `players` to
+`season_snapshot`, and `rosters` and `standings` share one
+league_rosters.fetch_teams call. Stages whose dependencies are done run
+in parallel threads. A selected stage whose dependency is not selected
+reads that dependency's file output instead, like the standalone script.
+A failed stage skips everything that depends on it and the exit code is 1.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from http_helpers import RUN_STATS, yahoo_session
+from metrics import METRICS, instrumented
+from yahoo_helpers import game_id_from_league_key
+from league_rosters import fetch_teams
+from fetch_players import refresh_players, write_players
+from fetch_team_roster_snapshot import snapshot_rosters
+from fetch_player_season_snapshot import load_players, snapshot_players, PLAYERS_CSV
+from fetch_rosters_and_standings import write_rosters_and_standings
+from fetch_full_player_stats import player_keys_to_fetch, fetch_full_stats
+from compact_snapshots import compact
+import daily_delta
+import bi_export
+import latest_state
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+DEBUG_DUMP = os.environ.get("DEBUG_DUMP") == "1"
+
+
+class Context:
+    """State shared by the stages of one run."""
+
+    def __init__(self, session, league_key: str, dump: bool = DEBUG_DUMP):
+        self.session = session
+        self.league_key = league_key
+        self.dump = dump
+        self.results: Dict[str, object] = {}
+        self._teams = None
+        self._teams_lock = threading.Lock()
+
+    def teams(self) -> List[Dict]:
+        """league_rosters.fetch_teams, fetched once per run."""
+        with self._teams_lock:
+            if self._teams is None:
+                self._teams = fetch_teams(self.session, self.league_key, dump=self.dump)
+            return self._teams
+
+
+# ---------------- Stages ----------------
+def stage_players(ctx: Context):
+    rows = refresh_players(ctx.session, ctx.league_key, dump=ctx.dump)
+    write_players(rows)
+    return rows
+
+
+def stage_rosters(ctx: Context):
+    return snapshot_rosters(ctx.session, ctx.league_key, teams=ctx.teams())
+
+
+def stage_standings(ctx: Context):
+    return write_rosters_and_standings(ctx.teams())
+
+
+def stage_season_snapshot(ctx: Context):
+    players = ctx.results.get("players")
+    if players is None:
+        players = load_players()
+        if players is None:
+            raise RuntimeError(f"{PLAYERS_CSV} not found; run the players stage first")
+    if not players:
+        logging.info("No players found — skipping season snapshot")
+        return None
+    return snapshot_players(ctx.session, players)
+
+
+def stage_full_stats(ctx: Context):
+    keys = player_keys_to_fetch(
+        game_id_from_league_key(ctx.league_key),
+        players=ctx.results.get("players"),
+        roster_rows=ctx.results.get("standings"),
+    )
+    return fetch_full_stats(ctx.session, keys)
+
+
+def stage_latest_state(ctx: Context):
+    return latest_state.publish()
+
+
+def stage_daily_delta(ctx: Context):
+    return daily_delta.update()
+
+
+def stage_compact(ctx: Context):
+    return compact()
+
+
+def stage_bi_export(ctx: Context):
+    return bi_export.export()
+
+
+class Stage(NamedTuple):
+    func: Callable[[Context], object]
+    deps: Tuple[str, ...]
+    help: str
+
+
+STAGES: Dict[str, Stage] = {
+    "players": Stage(stage_players, (), "refresh dim_player -> league_players.csv/.parquet"),
+    "rosters": Stage(stage_rosters, (), "roster changes -> data/roster_history (SCD2)"),
+    "standings": Stage(stage_standings, (), "team_rosters.csv + team_standings.csv"),
+    "season_snapshot": Stage(stage_season_snapshot, ("players",), "season stats -> data/snapshots"),
+    "full_stats": Stage(stage_full_stats, ("players", "standings"), "daily stats -> player_stats_full.parquet"),
+    "latest_state": Stage(stage_latest_state, ("season_snapshot",), "mmap-able latest state -> data/latest_state.arrow"),
+    "daily_delta": Stage(stage_daily_delta, ("season_snapshot",), "daily increments + rolling windows -> data/daily_delta"),
+    "compact": Stage(stage_compact, ("season_snapshot", "daily_delta"), "compact cold snapshot days"),
+    "bi_export": Stage(stage_bi_export, ("players", "rosters", "season_snapshot", "compact"),
+                       "Power BI star schema -> data/bi"),
+}
+
+DEFAULT_STAGES = ["players", "rosters", "season_snapshot", "latest_state", "daily_delta", "compact", "bi_export"]
+
+
+def _run_stage(name: str, ctx: Context) -> Tuple[bool, float]:
+    t0 = time.perf_counter()
+    logging.info("Stage %s: start", name)
+    try:
+        ctx.results[name] = STAGES[name].func(ctx)
+        ok = True
+    except Exception:
+        logging.exception("Stage %s failed", name)
+        ok = False
+    elapsed = time.perf_counter() - t0
+    logging.info("Stage %s: %s in %.1fs", name, "done" if ok else "FAILED", elapsed)
+    METRICS.record_stage(name, elapsed, "ok" if ok else "failed")
+    return ok, elapsed
+
+
+def run(stages: List[str], ctx: Context) -> Dict[str, str]:
+    """
+    Run the selected stages, each as soon as its selected dependencies
+    have succeeded. Returns {stage: "ok" | "failed" | "skipped"}.
+    """
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(unknown)}")
+    deps = {s: [d for d in STAGES[s].deps if d in stages] for s in stages}
+
+    status: Dict[str, str] = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(stages) or 1) as pool:
+        while len(status) < len(stages):
+            for s in stages:
+                if s in status or s in running.values():
+                    continue
+                if any(status.get(d) in ("failed", "skipped") for d in deps[s]):
+                    logging.warning("Stage %s: skipped (dependency failed)", s)
+                    status[s] = "skipped"
+                    METRICS.record_stage(s, 0.0, "skipped")
+                elif all(status.get(d) == "ok" for d in deps[s]):
+                    running[pool.submit(_run_stage, s, ctx)] = s
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                s = running.pop(fut)
+                ok, _ = fut.result()
+                status[s] = "ok" if ok else "failed"
+    return {s: status[s] for s in stages}
+
+
+@instrumented("pipeline")
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run fetch stages in one process")
+    ap.add_argument("--stages", default=",".join(DEFAULT_STAGES),
+                    help="comma-separated stages (default: %(default)s)")
+    ap.add_argument("--list", action="store_true", help="list stages and exit")
+    args = ap.parse_args(argv)
+
+    if args.list:
+        for name, st in STAGES.items():
+            after = f" (after {', '.join(st.deps)})" if st.deps else ""
+            print(f"{name:16s} {st.help}{after}")
+        return 0
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        logging.error("Unknown stage(s): %s (see --list)", ", ".join(unknown))
+        return 2
+    league_key = os.environ.get("LEAGUE_KEY")
+    if not league_key:
+        logging.error("LEAGUE_KEY env var not set")
+        return 2
+
+    t0 = time.perf_counter()
+    status = run(stages, Context(yahoo_session(), league_key))
+    RUN_STATS.log_summary()
+    logging.info("Pipeline finished in %.1fs: %s", time.perf_counter() - t0,
+                 ", ".join(f"{s}={v}" for s, v in status.items()))
+    return 0 if all(v == "ok" for v in status.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
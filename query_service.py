@@ -0,0 +1,362 @@
+# query_service.py
+"""
+Local read-only HTTP query service over the snapshot history and rosters.
+
+    python query_service.py [--host 127.0.0.1] [--port 8765]
+
+    GET /health
+    GET /leaderboard?stat=12[&date=YYYY-MM-DD][&limit=20][&per_game=1]
+    GET /players/<player_key>/trend?stat=12[,15...][&from=DATE][&to=DATE]
+    GET /teams/totals[?date=YYYY-MM-DD]
+    GET /teams/<team_key>/totals[?date=YYYY-MM-DD]
+    GET /free-agents?stat=12[&date=YYYY-MM-DD][&limit=20][&per_game=1]
+
+The whole history is held in memory as a scoring.StatCube (a dense
+[date, player, stat] float32 array, ~17 MB for a season), so every
+request is a few NumPy slices. A watcher thread polls data/snapshots
+every QUERY_RELOAD_SECONDS and merges new or rewritten daily files (and
+days rebuilt from the SNAPSHOT_MODE=delta store, data/snapshot_deltas)
+into a fresh cube, which then replaces the old one in a single assignment;
+team_rosters.csv and league_players.csv are re-read when their mtime
+changes. Requests in flight keep the cube they started with, so the
+service never needs a restart. bench_query_service.py load-tests it.
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import time
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pyarrow as pa
+
+from snapshot_store import SNAPSHOT_DIR, daily_files
+from snapshot_schema import read_snapshot
+from snapshot_query import cdc_days, load_series
+from snapshot_delta import DELTA_DIR, rebuild_day
+from scoring import StatCube, STAT_NAMES, RATIO_STATS, GP, build_cube, category_values
+from daily_delta import NON_ADDITIVE_STATS
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+RELOAD_SECONDS = float(os.environ.get("QUERY_RELOAD_SECONDS", "10"))
+ROSTERS_CSV = "team_rosters.csv"
+PLAYERS_CSV = "league_players.csv"
+
+
+def merge_cubes(a: StatCube, b: StatCube) -> StatCube:
+    """Union of both cubes' axes; values from b win where both have a (date, player, stat)."""
+    if not a.players:
+        return b
+    dates = np.union1d(a.dates, b.dates)
+    players = sorted(set(a.players) | set(b.players))
+    stat_ids = np.union1d(a.stat_ids, b.stat_ids).astype(np.int32)
+
+    values = np.full((len(dates), len(players), len(stat_ids)), np.nan, dtype=np.float32)
+    pos = {k: i for i, k in enumerate(players)}
+    for cube in (a, b):
+        # b goes second: a rewritten day replaces everything it has, NaNs included
+        di = np.searchsorted(dates, cube.dates)
+        pi = np.array([pos[k] for k in cube.players])
+        si = np.searchsorted(stat_ids, cube.stat_ids)
+        values[np.ix_(di, pi, si)] = cube.values
+    return StatCube(dates, players, stat_ids, values)
+
+
+def _read_csv(path: str) -> List[Dict]:
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+class SnapshotCache:
+    """In-memory history cube plus rosters, refreshed from disk by a watcher thread."""
+
+    def __init__(self, snapshot_dir: str = SNAPSHOT_DIR, rosters_csv: str = ROSTERS_CSV,
+                 players_csv: str = PLAYERS_CSV, delta_dir: str = DELTA_DIR):
+        self.snapshot_dir = snapshot_dir
+        self.delta_dir = delta_dir
+        self.rosters_csv = rosters_csv
+        self.players_csv = players_csv
+        self.cube = StatCube(np.array([], "datetime64[D]"), [], np.array([], np.int32),
+                             np.empty((0, 0, 0), np.float32))
+        self.rosters: List[Dict] = []
+        self.names: Dict[str, str] = {}
+        self.reloads = 0
+        self._file_stamps: Dict[str, Tuple] = {}
+        self._csv_stamps: Dict[str, Optional[int]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    # ---------------- loading ----------------
+    def load(self):
+        """Initial load: all history (compacted + hot + CDC) in one pass."""
+        t0 = time.perf_counter()
+        stamps = self._stamps()
+        self.cube = build_cube(load_series(snapshot_dir=self.snapshot_dir, sort=False, delta_dir=self.delta_dir))
+        self._file_stamps = stamps
+        self._refresh_csvs()
+        logging.info("Loaded %d dates x %d players x %d stats in %.1fs",
+                     *self.cube.shape, time.perf_counter() - t0)
+
+    def _stamps(self) -> Dict[str, Tuple]:
+        """day -> (size, mtime_ns) of its daily file, or of every CDC file rebuilding it."""
+        days = {d: [path] for d, path in daily_files(self.snapshot_dir).items()}
+        days.update(cdc_days(self.snapshot_dir, delta_dir=self.delta_dir))
+        out = {}
+        for d, paths in days.items():
+            try:
+                stamp = tuple((st.st_size, st.st_mtime_ns) for st in map(os.stat, paths))
+            except OSError:
+                continue
+            out[d] = stamp
+        return out
+
+    def _refresh_csvs(self):
+        for path in (self.rosters_csv, self.players_csv):
+            mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+            if self._csv_stamps.get(path, -1) == mtime:
+                continue
+            self._csv_stamps[path] = mtime
+            rows = _read_csv(path)
+            if path == self.rosters_csv:
+                self.rosters = rows
+            else:
+                self.names = {r["player_key"]: r.get("player_name") for r in rows}
+            logging.info("Reloaded %s: %d rows", path, len(rows))
+
+    def refresh(self) -> int:
+        """Merge new or changed days (daily files or CDC rebuilds); returns how many were merged."""
+        with self._lock:
+            self._refresh_csvs()
+            stamps = self._stamps()
+            changed = [d for d, s in stamps.items() if self._file_stamps.get(d) != s]
+            if not changed:
+                return 0
+            files = daily_files(self.snapshot_dir)
+            new = pa.concat_tables([read_snapshot(files[d]) if d in files else rebuild_day(d, self.delta_dir)
+                                    for d in changed], promote_options="permissive")
+            self.cube = merge_cubes(self.cube, build_cube(new))     # single reference swap
+            self._file_stamps = stamps
+            self.reloads += 1
+            logging.info("Merged %d snapshot day(s): %s", len(changed), ", ".join(sorted(changed)))
+            return len(changed)
+
+    def watch(self, interval: float = RELOAD_SECONDS):
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception:
+                    logging.exception("Snapshot reload failed")
+        threading.Thread(target=loop, name="snapshot-watcher", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+# ---------------- queries ----------------
+def _num(x) -> Optional[float]:
+    return None if x is None or np.isnan(x) else round(float(x), 4)
+
+
+def _nums(x: np.ndarray) -> List[Optional[float]]:
+    out = np.round(x.astype(np.float64), 4)
+    return [None if v != v else v for v in out.tolist()]
+
+
+def _date_index(cube: StatCube, day: Optional[str]) -> int:
+    if not day:
+        return len(cube.dates) - 1
+    i = int(np.searchsorted(cube.dates, np.datetime64(day)))
+    if i >= len(cube.dates) or cube.dates[i] != np.datetime64(day):
+        raise LookupError(f"no snapshot for {day}")
+    return i
+
+
+def _stat_name(stat_id: int) -> str:
+    return STAT_NAMES.get(int(stat_id), str(int(stat_id)))
+
+
+def _view(cube: StatCube, dates: slice, players: slice) -> StatCube:
+    """Sub-cube over a date/player range; a NumPy view, nothing is copied."""
+    return StatCube(cube.dates[dates], cube.players[players], cube.stat_ids, cube.values[dates, players])
+
+
+def leaderboard(cache: SnapshotCache, stat: int, day: Optional[str] = None, limit: int = 20,
+                per_game: bool = False, only: Optional[set] = None) -> Dict:
+    cube = cache.cube
+    di = _date_index(cube, day)
+    values = category_values(_view(cube, slice(di, di + 1), slice(None)), stat, per_game)[0]
+    order = np.argsort(-np.nan_to_num(values, nan=-np.inf), kind="stable")
+    rows = []
+    for pi in order:
+        if np.isnan(values[pi]):
+            break
+        key = cube.players[pi]
+        if only is not None and key not in only:
+            continue
+        rows.append({"player_key": key, "player_name": cache.names.get(key), "value": _num(values[pi])})
+        if len(rows) >= limit:
+            break
+    return {"date": str(cube.dates[di]), "stat": _stat_name(stat), "rows": rows}
+
+
+def player_trend(cache: SnapshotCache, player_key: str, stats: List[int],
+                 date_from: Optional[str] = None, date_to: Optional[str] = None) -> Dict:
+    cube = cache.cube
+    try:
+        pi = cube.players.index(player_key)
+    except ValueError:
+        raise LookupError(f"unknown player {player_key}")
+    lo = np.searchsorted(cube.dates, np.datetime64(date_from)) if date_from else 0
+    hi = np.searchsorted(cube.dates, np.datetime64(date_to), side="right") if date_to else len(cube.dates)
+    view = _view(cube, slice(lo, hi), slice(pi, pi + 1))
+    series = {_stat_name(s): _nums(category_values(view, s)[:, 0]) for s in stats}
+    return {"player_key": player_key, "player_name": cache.names.get(player_key),
+            "dates": [str(d) for d in cube.dates[lo:hi]], "series": series}
+
+
+def team_totals(cache: SnapshotCache, day: Optional[str] = None, team_key: Optional[str] = None) -> Dict:
+    cube = cache.cube
+    di = _date_index(cube, day)
+    pos = {k: i for i, k in enumerate(cube.players)}
+    by_team: Dict[str, Dict] = {}
+    for r in cache.rosters:
+        if team_key and r["team_key"] != team_key:
+            continue
+        t = by_team.setdefault(r["team_key"], {"team_name": r.get("team_name"), "idx": []})
+        if r["player_key"] in pos:
+            t["idx"].append(pos[r["player_key"]])
+    if team_key and team_key not in by_team:
+        raise LookupError(f"unknown team {team_key}")
+
+    day_values = cube.values[di]
+    additive = [s for s in range(len(cube.stat_ids)) if int(cube.stat_ids[s]) not in NON_ADDITIVE_STATS]
+    teams = []
+    for key, t in sorted(by_team.items()):
+        sums = np.nansum(day_values[t["idx"]][:, additive], axis=0) if t["idx"] else np.zeros(len(additive))
+        totals = dict(zip((_stat_name(cube.stat_ids[s]) for s in additive), _nums(sums)))
+        for pct, (made, att) in RATIO_STATS.items():
+            m, a = totals.get(_stat_name(made)), totals.get(_stat_name(att))
+            totals[_stat_name(pct)] = _num(m / a) if m is not None and a else None
+        teams.append({"team_key": key, "team_name": t["team_name"], "players": len(t["idx"]), "totals": totals})
+    return {"date": str(cube.dates[di]), "teams": teams}
+
+
+def free_agents(cache: SnapshotCache, stat: int, day: Optional[str] = None, limit: int = 20,
+                per_game: bool = False) -> Dict:
+    rostered = {r["player_key"] for r in cache.rosters}
+    pool = set(cache.names or cache.cube.players) - rostered
+    return leaderboard(cache, stat, day, limit, per_game, only=pool)
+
+
+# ---------------- HTTP ----------------
+ROUTES = [
+    (re.compile(r"^/health$"), "health"),
+    (re.compile(r"^/leaderboard$"), "leaderboard"),
+    (re.compile(r"^/players/(?P<player_key>[^/]+)/trend$"), "trend"),
+    (re.compile(r"^/teams/totals$"), "teams"),
+    (re.compile(r"^/teams/(?P<team_key>[^/]+)/totals$"), "team"),
+    (re.compile(r"^/free-agents$"), "free_agents"),
+]
+
+
+def handle(cache: SnapshotCache, path: str, query: Dict[str, str]) -> Dict:
+    """Dispatch one request; raises LookupError (404) or ValueError (400)."""
+    for pattern, name in ROUTES:
+        m = pattern.match(path)
+        if m:
+            break
+    else:
+        raise LookupError(f"no route {path}")
+    args = m.groupdict()
+    limit = int(query.get("limit", 20))
+    per_game = query.get("per_game") in ("1", "true")
+
+    if name == "health":
+        cube = cache.cube
+        return {"dates": len(cube.dates), "players": len(cube.players), "stats": len(cube.stat_ids),
+                "latest": str(cube.dates[-1]) if len(cube.dates) else None, "reloads": cache.reloads,
+                "roster_rows": len(cache.rosters)}
+    if name in ("leaderboard", "free_agents"):
+        if "stat" not in query:
+            raise ValueError("stat is required")
+        fn = leaderboard if name == "leaderboard" else free_agents
+        return fn(cache, int(query["stat"]), query.get("date"), limit, per_game)
+    if name == "trend":
+        stats = [int(s) for s in query.get("stat", str(GP)).split(",") if s]
+        return player_trend(cache, args["player_key"], stats, query.get("from"), query.get("to"))
+    return team_totals(cache, query.get("date"), args.get("team_key"))
+
+
+def make_handler(cache: SnapshotCache):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are separate writes; don't let Nagle hold the body back
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                status, body = 200, handle(cache, url.path, query)
+            except LookupError as e:
+                status, body = 404, {"error": str(e)}
+            except ValueError as e:
+                status, body = 400, {"error": str(e)}
+            except Exception as e:
+                logging.exception("Error serving %s", self.path)
+                status, body = 500, {"error": str(e)}
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, fmt, *args):
+            logging.debug("%s " + fmt, self.address_string(), *args)
+
+    return Handler
+
+
+def serve(cache: SnapshotCache, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(cache))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Local read-only snapshot query service")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--reload-seconds", type=float, default=RELOAD_SECONDS)
+    args = ap.parse_args(argv)
+
+    cache = SnapshotCache()
+    cache.load()
+    cache.watch(args.reload_seconds)
+    server = serve(cache, args.host, args.port)
+    logging.info("Serving on http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cache.stop()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+# raw_archive.py
+"""
+Raw API response archive, so history can be re-parsed without refetching.
+
+    RAW_ARCHIVE_DIR=data/raw python fetch_player_season_snapshot.py     # record
+    RAW_REPLAY=data/raw/2026-01-17/fetch_player_season_snapshot_101500Z_4242.zst \\
+        python fetch_player_season_snapshot.py                          # replay one run
+
+    python raw_archive.py list [--job JOB] [--from DATE] [--to DATE]
+    python raw_archive.py replay [--job JOB] [--from DATE] [--to DATE] [--last-per-day] [ARCHIVE ...]
+
+With RAW_ARCHIVE_DIR set, every 200 body that http_helpers.safe_get hands
+to a script (fetched, revalidated or served from the response cache) is
+kept for the run in <dir>/<YYYY-MM-DD>/<job>_<HHMMSS>Z_<pid>:
+
+    .zst            one zstd frame per distinct body, appended as they arrive
+    .index.jsonl    a run header line, then one line per response:
+                    url, sha256, the file/offset/length of its frame, size
+
+Bodies are deduplicated by sha256 within the run and against earlier
+runs of the same job on the same day (the index then points into the
+earlier run's .zst), so hourly runs only store what changed. References
+never leave the day directory; delete whole days when pruning.
+
+With RAW_REPLAY pointing at an archive (its .zst or .index.jsonl),
+safe_get answers from it instead of the network: no rate limit, no
+retries, no credentials. A URL the run didn't fetch raises LookupError,
+as a failed request would. The fetch scripts take their timestamps from
+run_time(), which is the archive's start both while recording and while
+replaying, so snapshot dates and timestamps come out as they did originally.
+
+`replay` runs the archived scripts again in this process, oldest first,
+with checkpoints in a scratch directory and metrics files off, so a
+season of archives is re-parsed and re-written at local-disk speed.
+"""
+
+import os
+import re
+import sys
+import json
+import runpy
+import hashlib
+import argparse
+import logging
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+RAW_ARCHIVE_DIR = os.environ.get("RAW_ARCHIVE_DIR", "")
+RAW_REPLAY = os.environ.get("RAW_REPLAY", "")
+ZSTD_LEVEL = int(os.environ.get("RAW_ARCHIVE_LEVEL", "9"))
+
+INDEX_SUFFIX = ".index.jsonl"
+ARCHIVE_RE = re.compile(r"^(?P<job>.+)_(?P<time>\d{6})Z_(?P<pid>\d+)\.zst$")
+
+# Environment a replay needs to re-run the script the same way
+RUN_ENV = ("LEAGUE_KEY", "PLAYERS_MODE", "SNAPSHOT_SCHEMA", "SNAPSHOT_MODE", "SNAPSHOT_BATCH_SIZE")
+
+
+def job_name() -> str:
+    """The running script's name, e.g. "fetch_players"."""
+    return os.path.splitext(os.path.basename(sys.argv[0] or ""))[0] or "python"
+
+
+def index_path(archive: str) -> str:
+    return archive[:-len(".zst")] + INDEX_SUFFIX if archive.endswith(".zst") else archive
+
+
+def zst_path(archive: str) -> str:
+    return archive[:-len(INDEX_SUFFIX)] + ".zst" if archive.endswith(INDEX_SUFFIX) else archive
+
+
+def url_key(url: str) -> str:
+    """A URL without scheme and host, so an archive replays against any API_ROOT."""
+    return re.sub(r"^[a-z]+://[^/]+", "", url)
+
+
+def read_index(archive: str):
+    """(run header, [entries]) of an archive; a truncated last line is ignored."""
+    header, entries = {}, []
+    with open(index_path(archive), encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                break
+            if "run" in rec:
+                header = rec["run"]
+            else:
+                entries.append(rec)
+    return header, entries
+
+
+class RawArchive:
+    """Append-only archive for one run; thread-safe, files are created on the first record()."""
+
+    def __init__(self, root: str, job: str, started: Optional[datetime] = None):
+        self.started = started or datetime.now(timezone.utc)
+        self.job = job
+        self.dir = os.path.join(root, self.started.strftime("%Y-%m-%d"))
+        self.path = os.path.join(self.dir, f"{job}_{self.started:%H%M%S}Z_{os.getpid()}.zst")
+        self.codec = pa.Codec("zstd", compression_level=ZSTD_LEVEL)
+        self._lock = threading.Lock()
+        self._zst = None
+        self._index = None
+        self._known: Dict[str, Dict] = {}
+        self.responses = 0
+        self.stored = 0
+
+    def _open(self):
+        os.makedirs(self.dir, exist_ok=True)
+        # Bodies stored by earlier runs of this job today are referenced, not stored again
+        for name in sorted(os.listdir(self.dir)):
+            m = ARCHIVE_RE.match(name)
+            if m and m.group("job") == self.job and name != os.path.basename(self.path):
+                try:
+                    for e in read_index(os.path.join(self.dir, name))[1]:
+                        self._known[e["sha256"]] = {k: e[k] for k in ("file", "offset", "length", "size")}
+                except OSError:
+                    continue
+        self._zst = open(self.path, "ab")
+        self._index = open(index_path(self.path), "a", encoding="utf-8")
+        header = {
+            "job": self.job,
+            "script": os.path.abspath(sys.argv[0]) if sys.argv[0] else None,
+            "started": self.started.isoformat(),
+            "env": {k: os.environ[k] for k in RUN_ENV if k in os.environ},
+        }
+        self._index.write(json.dumps({"run": header}) + "\n")
+
+    def record(self, url: str, body: bytes):
+        sha = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            if self._zst is None:
+                self._open()
+            ref = self._known.get(sha)
+            if ref is None:
+                frame = self.codec.compress(body, asbytes=True)
+                ref = {"file": os.path.basename(self.path), "offset": self._zst.tell(),
+                       "length": len(frame), "size": len(body)}
+                self._zst.write(frame)
+                self._zst.flush()
+                self._known[sha] = ref
+                self.stored += 1
+            self.responses += 1
+            self._index.write(json.dumps({"url": url, "sha256": sha, **ref}) + "\n")
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            if self._zst is not None:
+                self._zst.close()
+                self._index.close()
+                logging.info("Raw archive %s: %d responses, %d bodies stored", self.path,
+                             self.responses, self.stored)
+                self._zst = self._index = None
+
+
+class ArchiveReader:
+    """Serves an archived run's bodies by URL; a URL fetched n times is answered in the same order."""
+
+    def __init__(self, archive: str):
+        self.path = zst_path(archive)
+        self.header, entries = read_index(archive)
+        self.started = datetime.fromisoformat(self.header["started"])
+        self.codec = pa.Codec("zstd")
+        self._by_url: Dict[str, List[Dict]] = defaultdict(list)
+        for e in entries:
+            self._by_url[url_key(e["url"])].append(e)
+        self._served: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __contains__(self, url: str) -> bool:
+        return url_key(url) in self._by_url
+
+    def body(self, url: str) -> bytes:
+        key = url_key(url)
+        with self._lock:
+            entries = self._by_url.get(key)
+            if not entries:
+                raise LookupError(f"not in archive {self.path}: {url}")
+            # Repeats of the last response once the recorded ones are used up
+            e = entries[min(self._served[key], len(entries) - 1)]
+            self._served[key] += 1
+        with open(os.path.join(os.path.dirname(self.path), e["file"]), "rb") as f:
+            f.seek(e["offset"])
+            frame = f.read(e["length"])
+        return self.codec.decompress(frame, decompressed_size=e["size"], asbytes=True)
+
+
+_lock = threading.Lock()
+_recorder: Optional[RawArchive] = None
+_replay: Optional[ArchiveReader] = None
+_replay_path = RAW_REPLAY
+
+
+def recorder() -> Optional[RawArchive]:
+    """This run's archive when RAW_ARCHIVE_DIR is set (never while replaying)."""
+    global _recorder
+    if not RAW_ARCHIVE_DIR or _replay_path:
+        return None
+    with _lock:
+        if _recorder is None:
+            import atexit
+            _recorder = RawArchive(RAW_ARCHIVE_DIR, job_name())
+            atexit.register(_recorder.close)
+        return _recorder
+
+
+def replay_source() -> Optional[ArchiveReader]:
+    """The archive being replayed (RAW_REPLAY or replay_from()), else None."""
+    global _replay
+    if not _replay_path:
+        return None
+    with _lock:
+        if _replay is None or _replay.path != zst_path(_replay_path):
+            _replay = ArchiveReader(_replay_path)
+        return _replay
+
+
+def replay_from(archive: Optional[str]):
+    """Switch replay to another archive in-process (None turns it off)."""
+    global _replay_path
+    with _lock:
+        _replay_path = archive or ""
+
+
+def run_time() -> datetime:
+    """
+    When this run happened (UTC): the archived run's start while replaying,
+    this run's archive start while recording (so a replay reproduces it
+    exactly), else now.
+    """
+    source = replay_source()
+    if source is not None:
+        return source.started
+    archive = recorder()
+    return archive.started if archive is not None else datetime.now(timezone.utc)
+
+
+# ---------------- CLI ----------------
+def find_archives(root: str, job: Optional[str] = None, date_from: Optional[str] = None,
+                  date_to: Optional[str] = None) -> List[str]:
+    """Archive .zst paths under root, oldest first."""
+    found = []
+    if not os.path.isdir(root):
+        return found
+    for day in sorted(os.listdir(root)):
+        if (date_from and day < date_from) or (date_to and day > date_to):
+            continue
+        day_dir = os.path.join(root, day)
+        if not os.path.isdir(day_dir):
+            continue
+        for name in os.listdir(day_dir):
+            m = ARCHIVE_RE.match(name)
+            if m and (job is None or m.group("job") == job) and os.path.exists(index_path(os.path.join(day_dir, name))):
+                found.append((day, m.group("time"), name, os.path.join(day_dir, name)))
+    return [path for *_, path in sorted(found)]
+
+
+def replay_run(archive: str) -> int:
+    """Re-run an archived script in this process against its archive; returns its exit code."""
+    header, _ = read_index(archive)
+    script = header.get("script")
+    if not script or not os.path.exists(script):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), header["job"] + ".py")
+    os.environ.update(header.get("env", {}))
+    # The scripts reach this module as "raw_archive", which isn't __main__
+    import raw_archive
+    raw_archive.replay_from(archive)
+    argv = sys.argv
+    sys.argv = [script]
+    try:
+        runpy.run_path(script, run_name="__main__")
+        return 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        sys.argv = argv
+        raw_archive.replay_from(None)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="List or replay raw API response archives")
+    ap.add_argument("cmd", choices=["list", "replay"])
+    ap.add_argument("archives", nargs="*", help="archive files (default: everything matching the filters)")
+    ap.add_argument("--dir", default=RAW_ARCHIVE_DIR or "data/raw")
+    ap.add_argument("--job", help="only this script, e.g. fetch_player_season_snapshot")
+    ap.add_argument("--from", dest="date_from")
+    ap.add_argument("--to", dest="date_to")
+    ap.add_argument("--last-per-day", action="store_true", help="replay only each job's last run of a day")
+    args = ap.parse_args(argv)
+
+    archives = args.archives or find_archives(args.dir, args.job, args.date_from, args.date_to)
+    if args.last_per_day:
+        last = {}
+        for a in archives:
+            m = ARCHIVE_RE.match(os.path.basename(zst_path(a)))
+            last[(os.path.basename(os.path.dirname(os.path.abspath(a))), m.group("job") if m else a)] = a
+        archives = [a for a in archives if a in set(last.values())]
+
+    if args.cmd == "list":
+        for a in archives:
+            header, entries = read_index(a)
+            size = os.path.getsize(zst_path(a)) if os.path.exists(zst_path(a)) else 0
+            print(f"{a}  {header.get('started', '?')}  {len(entries)} responses  {size / 1024:.0f} KiB")
+        return 0
+
+    # Checkpoints from a live run of the same day must not make the replay skip keys
+    os.environ["CHECKPOINT_DIR"] = tempfile.mkdtemp(prefix="raw_replay_")
+    os.environ["METRICS_DIR"] = ""
+    os.environ["RAW_ARCHIVE_DIR"] = ""
+    os.environ["YAHOO_OFFLINE"] = "1"
+    failed = 0
+    for a in archives:
+        logging.info("Replaying %s", a)
+        code = replay_run(a)
+        if code:
+            logging.error("%s exited with %s", a, code)
+            failed += 1
+    logging.info("Replayed %d archives, %d failed", len(archives), failed)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
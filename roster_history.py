@@ -0,0 +1,251 @@
+# roster_history.py
+"""
+Team roster history as a type-2 slowly changing dimension.
+
+    data/roster_history/current.parquet                          open intervals
+    data/roster_history/intervals/season=YYYY-YY/part-0.parquet  closed intervals
+    data/roster_history/transactions/season=YYYY-YY/part-0.parquet
+
+Every (team_key, player_key) stint is one row with valid_from/valid_to
+(valid_to null while the player is still on the team). A run only
+touches what changed since the last one: stints that ended are closed
+and moved to their season's partition, new stints are opened, and a
+position change closes one row and opens another. Players moving
+between teams are also written to the transactions table as adds,
+drops or trades. Teams missing from a fetch are left as they were.
+
+    python roster_history.py as-of 2026-01-15T12:00:00Z
+    python roster_history.py import-csv fact_team_roster_snapshot.csv
+
+import-csv replays the old append-only snapshot CSV into the history.
+"""
+
+import os
+import sys
+import csv
+import argparse
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from snapshot_store import season_of
+from metrics import timed
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+HISTORY_DIR = "data/roster_history"
+CURRENT_NAME = "current.parquet"
+PART_FILE = "part-0.parquet"
+
+TS = pa.timestamp("us", tz="UTC")
+
+INTERVAL_SCHEMA = pa.schema([
+    ("team_key", pa.string()),
+    ("team_name", pa.string()),
+    ("player_key", pa.string()),
+    ("player_name", pa.string()),
+    ("position", pa.string()),
+    ("valid_from", TS),
+    ("valid_to", TS),
+])
+
+TRANSACTION_SCHEMA = pa.schema([
+    ("ts", TS),
+    ("type", pa.string()),              # add | drop | trade
+    ("player_key", pa.string()),
+    ("player_name", pa.string()),
+    ("from_team_key", pa.string()),
+    ("to_team_key", pa.string()),
+])
+
+
+# ---------------- Diff ----------------
+def apply_snapshot(current: List[Dict], rows: List[Dict], ts: datetime
+                   ) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """
+    Fold one roster snapshot (team_key, team_name, player_key, player_name,
+    position rows) into the open intervals.
+    Returns (new open intervals, intervals closed at ts, transactions).
+    """
+    fetched_teams = {r["team_key"] for r in rows}
+    new_by_key = {(r["team_key"], r["player_key"]): r for r in rows}
+    cur_by_key = {(c["team_key"], c["player_key"]): c for c in current}
+
+    def opened_row(r):
+        return {**{f: r.get(f) for f in INTERVAL_SCHEMA.names[:5]}, "valid_from": ts, "valid_to": None}
+
+    keep, closed, opened = [], [], []
+    for key, c in cur_by_key.items():
+        r = new_by_key.get(key)
+        if c["team_key"] not in fetched_teams:
+            keep.append(c)
+        elif r is None:
+            closed.append({**c, "valid_to": ts})
+        elif r["position"] != c["position"]:
+            closed.append({**c, "valid_to": ts})
+            opened.append(opened_row(r))
+        else:
+            # Names aren't tracked; refresh them in place
+            keep.append({**c, "team_name": r["team_name"], "player_name": r["player_name"]})
+    opened += [opened_row(r) for key, r in new_by_key.items() if key not in cur_by_key]
+
+    # Transactions: players leaving or joining a team (not position changes)
+    left = {c["player_key"]: c for c in closed if (c["team_key"], c["player_key"]) not in new_by_key}
+    joined = {r["player_key"]: r for r in opened if (r["team_key"], r["player_key"]) not in cur_by_key}
+    transactions = []
+    for pk in list(left) + [pk for pk in joined if pk not in left]:
+        frm, to = left.get(pk), joined.get(pk)
+        transactions.append({
+            "ts": ts,
+            "type": "trade" if frm and to else ("drop" if frm else "add"),
+            "player_key": pk,
+            "player_name": (to or frm)["player_name"],
+            "from_team_key": frm["team_key"] if frm else None,
+            "to_team_key": to["team_key"] if to else None,
+        })
+    return keep + opened, closed, transactions
+
+
+# ---------------- Storage ----------------
+@timed("write")
+def _write(table: pa.Table, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression="snappy")
+    os.replace(tmp, path)
+
+
+def _append_by_season(rows: List[Dict], schema: pa.Schema, ts_column: str, subdir: str, base: str):
+    """Append rows to season=.../part-0.parquet under base/subdir, by season of ts_column."""
+    by_season = defaultdict(list)
+    for r in rows:
+        by_season[season_of(r[ts_column].date())].append(r)
+    for season, season_rows in by_season.items():
+        path = os.path.join(base, subdir, f"season={season}", PART_FILE)
+        new = pa.Table.from_pylist(season_rows, schema=schema)
+        if os.path.exists(path):
+            new = pa.concat_tables([pq.read_table(path, schema=schema), new])
+        _write(new, path)
+
+
+def load_current(base: str = HISTORY_DIR) -> Tuple[List[Dict], Optional[datetime]]:
+    """Open intervals and the timestamp of the snapshot that last changed them."""
+    path = os.path.join(base, CURRENT_NAME)
+    if not os.path.exists(path):
+        return [], None
+    t = pq.read_table(path)
+    last = (t.schema.metadata or {}).get(b"last_snapshot_ts")
+    return t.cast(INTERVAL_SCHEMA).to_pylist(), datetime.fromisoformat(last.decode()) if last else None
+
+
+def record_snapshot(rows: List[Dict], ts: Optional[datetime] = None, base: str = HISTORY_DIR) -> Dict:
+    """
+    Apply one roster snapshot to the stored history; nothing is written
+    when nothing changed. Returns {"opened", "closed", "transactions", "open"}.
+    """
+    ts = ts or datetime.now(timezone.utc)
+    current, _ = load_current(base)
+    new_current, closed, txns = apply_snapshot(current, rows, ts)
+    if not current:
+        # The first run seeds the open intervals; that isn't a wave of adds
+        txns = []
+    counts = {
+        "opened": len(new_current) - len(current) + len(closed),
+        "closed": len(closed),
+        "transactions": len(txns),
+        "open": len(new_current),
+    }
+    if not closed and new_current == current:
+        return counts
+
+    if closed:
+        _append_by_season(closed, INTERVAL_SCHEMA, "valid_from", "intervals", base)
+    if txns:
+        _append_by_season(txns, TRANSACTION_SCHEMA, "ts", "transactions", base)
+    table = pa.Table.from_pylist(new_current, schema=INTERVAL_SCHEMA)
+    _write(table.replace_schema_metadata({"last_snapshot_ts": ts.isoformat()}),
+           os.path.join(base, CURRENT_NAME))
+    return counts
+
+
+# ---------------- Reads ----------------
+def _partitions(base: str, subdir: str) -> List[str]:
+    root = os.path.join(base, subdir)
+    if not os.path.isdir(root):
+        return []
+    return [os.path.join(root, d, PART_FILE) for d in sorted(os.listdir(root))
+            if os.path.exists(os.path.join(root, d, PART_FILE))]
+
+
+def roster_as_of(when: datetime, base: str = HISTORY_DIR) -> pa.Table:
+    """Every (team, player) interval valid at `when`."""
+    when = pa.scalar(when, TS)
+    filters = [("valid_from", "<=", when)]
+    parts = [pq.read_table(p, schema=INTERVAL_SCHEMA, filters=filters + [("valid_to", ">", when)])
+             for p in _partitions(base, "intervals")]
+    cur = os.path.join(base, CURRENT_NAME)
+    if os.path.exists(cur):
+        parts.append(pq.read_table(cur, schema=INTERVAL_SCHEMA, filters=filters))
+    if not parts:
+        return INTERVAL_SCHEMA.empty_table()
+    t = pa.concat_tables(parts)
+    return t.sort_by([("team_key", "ascending"), ("player_key", "ascending")])
+
+
+def transactions(base: str = HISTORY_DIR) -> pa.Table:
+    parts = [pq.read_table(p, schema=TRANSACTION_SCHEMA) for p in _partitions(base, "transactions")]
+    if not parts:
+        return TRANSACTION_SCHEMA.empty_table()
+    return pa.concat_tables(parts).sort_by([("ts", "ascending")])
+
+
+# ---------------- CSV import ----------------
+def import_csv(path: str, base: str = HISTORY_DIR) -> int:
+    """Replay an append-only fact_team_roster_snapshot.csv; returns snapshots applied."""
+    snapshots = defaultdict(list)
+    with open(path, newline="", encoding="utf-8") as f:
+        for r in csv.DictReader(f):
+            snapshots[r["snapshot_ts"]].append(r)
+    _, last = load_current(base)
+    n = 0
+    for ts_str in sorted(snapshots):
+        ts = datetime.fromisoformat(ts_str)
+        if last is not None and ts <= last:
+            continue
+        record_snapshot(snapshots[ts_str], ts, base)
+        n += 1
+    return n
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Roster history (SCD2) utilities")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("as-of", help="print rosters at an ISO timestamp")
+    p.add_argument("when")
+    p = sub.add_parser("import-csv", help="replay an old snapshot CSV")
+    p.add_argument("path")
+    sub.add_parser("transactions", help="print the transactions table")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "as-of":
+        when = datetime.fromisoformat(args.when.replace("Z", "+00:00"))
+        if when.tzinfo is None:
+            when = when.replace(tzinfo=timezone.utc)
+        for r in roster_as_of(when).to_pylist():
+            print(f"{r['team_key']:22s} {r['player_key']:14s} {r['player_name'] or ''} ({r['position']})")
+    elif args.cmd == "import-csv":
+        n = import_csv(args.path)
+        logging.info("Replayed %d snapshots from %s", n, args.path)
+    else:
+        for r in transactions().to_pylist():
+            print(f"{r['ts']:%Y-%m-%d %H:%M} {r['type']:5s} {r['player_key']:14s} "
+                  f"{r['from_team_key'] or '-'} -> {r['to_team_key'] or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
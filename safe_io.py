@@ -4,6 +4,9 @@ import json
 import os
 from typing import List, Dict
 
+from metrics import timed
+
+@timed("write")
 def safe_write_csv(path: str, rows: List[Dict], fieldnames: List[str], mode: str = "w"):
     """
     Write rows safely. If rows empty, skip and return 0.
@@ -19,6 +22,7 @@ def safe_write_csv(path: str, rows: List[Dict], fieldnames: List[str], mode: str
         writer.writerows(rows)
     return len(rows)
 
+@timed("write")
 def debug_dump(obj, fname: str):
     # Dump compact JSON for CI inspection when DEBUG_DUMP=1
     try:
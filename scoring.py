@@ -0,0 +1,258 @@
+# scoring.py
+"""
+Vectorised fantasy scoring over the season snapshots.
+
+    from scoring import load_cube, zscores, points
+    cube = load_cube(date_from="2026-01-01")
+    z, total = zscores(cube)            # (dates, players, 9) and (dates, players)
+    fp = points(cube)                   # (dates, players)
+
+    python scoring.py [--from DATE] [--to DATE] [--per-game]
+                      [--weights 12=1,15=1.2,...] [--out scores.parquet]
+
+load_cube() pivots the long player_key/stat_id/stat_value rows (via
+snapshot_query.load_series) into one dense float32 array indexed
+[date, player, stat], NaN where a player has no value. Every score is
+computed with whole-array NumPy operations over all dates at once.
+
+Percentages are never averaged: a category like FG% is rebuilt from its
+made/attempted stats (RATIO_STATS) and z-scored on volume-weighted
+impact, attempts * (player% - pool%), so a 10-for-11 night doesn't
+outrank a 300-for-600 season.
+"""
+
+import sys
+import argparse
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from snapshot_query import load_series
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+# Yahoo NBA stat ids
+GP, FGA, FGM, FG_PCT, FTA, FTM, FT_PCT = 0, 3, 4, 5, 6, 7, 8
+TPA, TPM, TP_PCT, PTS, REB, AST, ST, BLK, TO = 9, 10, 11, 12, 15, 16, 17, 18, 19
+
+STAT_NAMES = {
+    GP: "GP", FGA: "FGA", FGM: "FGM", FG_PCT: "FG%", FTA: "FTA", FTM: "FTM", FT_PCT: "FT%",
+    TPA: "3PTA", TPM: "3PTM", TP_PCT: "3PT%", PTS: "PTS", REB: "REB", AST: "AST",
+    ST: "ST", BLK: "BLK", TO: "TO",
+}
+
+# Percentage stat -> (made, attempted) stats it is computed from
+RATIO_STATS = {FG_PCT: (FGM, FGA), FT_PCT: (FTM, FTA), TP_PCT: (TPM, TPA)}
+
+# Standard 9-cat: stat id -> direction (+1 more is better, -1 fewer is better)
+NINE_CAT = {FG_PCT: 1, FT_PCT: 1, TPM: 1, PTS: 1, REB: 1, AST: 1, ST: 1, BLK: 1, TO: -1}
+
+# Yahoo's default points-league weights
+DEFAULT_POINTS = {PTS: 1.0, REB: 1.2, AST: 1.5, ST: 3.0, BLK: 3.0, TO: -1.0}
+
+
+class StatCube:
+    """Dense [date, player, stat] float32 array plus its axis labels."""
+
+    def __init__(self, dates: np.ndarray, players: List[str], stat_ids: np.ndarray, values: np.ndarray):
+        self.dates = dates            # datetime64[D], ascending
+        self.players = players
+        self.stat_ids = stat_ids      # int32, ascending
+        self.values = values
+        self._pos = {int(s): i for i, s in enumerate(stat_ids)}
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.values.shape
+
+    def has(self, stat_id: int) -> bool:
+        return stat_id in self._pos
+
+    def stat(self, stat_id: int) -> np.ndarray:
+        """[date, player] slice for one stat (all-NaN if the stat is absent)."""
+        i = self._pos.get(stat_id)
+        if i is None:
+            return np.full(self.values.shape[:2], np.nan, dtype=np.float32)
+        return self.values[:, :, i]
+
+
+def build_cube(table: pa.Table) -> StatCube:
+    """Pivot v2 snapshot rows (snapshot_date, player_key, stat_id, stat_value, ...) into a StatCube."""
+    if table.num_rows == 0:
+        return StatCube(np.array([], "datetime64[D]"), [], np.array([], np.int32),
+                        np.empty((0, 0, 0), np.float32))
+
+    days = table["snapshot_date"].combine_chunks().cast(pa.int32()).to_numpy()
+    keys = table["player_key"]
+    if pa.types.is_dictionary(keys.type):
+        keys = keys.cast(keys.type.value_type)
+    stat = table["stat_id"].to_numpy()
+
+    # Ratio rows ("made/attempted" strings) carry their value in made/attempted
+    value = table["stat_value"].to_numpy(zero_copy_only=False).astype(np.float32)
+    if "stat_made" in table.column_names:
+        made = table["stat_made"].to_numpy(zero_copy_only=False).astype(np.float32)
+        att = table["stat_attempted"].to_numpy(zero_copy_only=False).astype(np.float32)
+        ratio = np.isnan(value) & ~np.isnan(made) & (att > 0)
+        value[ratio] = made[ratio] / att[ratio]
+
+    uniq_days, d_idx = np.unique(days, return_inverse=True)
+    players = pc.unique(keys).sort()
+    p_idx = pc.index_in(keys, value_set=players).to_numpy()
+    stat_ids, s_idx = np.unique(stat, return_inverse=True)
+
+    values = np.full((len(uniq_days), len(players), len(stat_ids)), np.nan, dtype=np.float32)
+    values[d_idx, p_idx, s_idx] = value
+    return StatCube(uniq_days.astype("datetime64[D]"), players.to_pylist(),
+                    stat_ids.astype(np.int32), values)
+
+
+def load_cube(date_from: Optional[str] = None, date_to: Optional[str] = None,
+              player_keys: Optional[Iterable[str]] = None,
+              stat_ids: Optional[Iterable[int]] = None) -> StatCube:
+    """Snapshots for an inclusive ISO date range (None = all history) as a StatCube."""
+    # The cube is indexed by position, so skip load_series' sort
+    table = load_series(player_keys, stat_ids, date_from, date_to, sort=False)
+    return build_cube(table)
+
+
+# ---------------- Scoring ----------------
+def _per_game(cube: StatCube, x: np.ndarray) -> np.ndarray:
+    gp = cube.stat(GP)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(gp > 0, x / gp, np.nan)
+
+
+def category_values(cube: StatCube, stat_id: int, per_game: bool = False) -> np.ndarray:
+    """[date, player] values of one category, percentages rebuilt from made/attempted."""
+    if stat_id in RATIO_STATS:
+        made_id, att_id = RATIO_STATS[stat_id]
+        if cube.has(made_id) and cube.has(att_id):
+            made, att = cube.stat(made_id), cube.stat(att_id)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.where(att > 0, made / att, np.nan)
+        return cube.stat(stat_id)
+    x = cube.stat(stat_id)
+    return _per_game(cube, x) if per_game else x
+
+
+def player_pool(cube: StatCube) -> np.ndarray:
+    """[date, player] mask of players who have played (GP > 0) on that date."""
+    if not cube.has(GP):
+        return ~np.isnan(cube.values).all(axis=2)
+    return np.nan_to_num(cube.stat(GP)) > 0
+
+
+def _standardise(x: np.ndarray, pool: np.ndarray) -> np.ndarray:
+    """z-score each date's row over the pool; players outside the pool get NaN."""
+    x = np.where(pool, x, np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.nanmean(x, axis=1, keepdims=True)
+        std = np.nanstd(x, axis=1, keepdims=True)
+        z = np.where(std > 0, (x - mean) / std, 0.0)
+    return np.where(pool, z, np.nan).astype(np.float32)
+
+
+def zscores(cube: StatCube, categories: Dict[int, int] = NINE_CAT, per_game: bool = False,
+            pool: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Per-category z-scores, shape [date, player, category] in `categories`
+    order, and their sum (the 9-cat total for NINE_CAT). Negative-direction
+    categories (TO) are flipped so higher is always better. Ratio
+    categories use attempts * (player% - pool%), with pool% taken from the
+    pool's summed made/attempted.
+    """
+    if pool is None:
+        pool = player_pool(cube)
+    z = np.full(cube.shape[:2] + (len(categories),), np.nan, dtype=np.float32)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for c, (stat_id, sign) in enumerate(categories.items()):
+            ratio = RATIO_STATS.get(stat_id)
+            if ratio and cube.has(ratio[0]) and cube.has(ratio[1]):
+                made = np.where(pool, cube.stat(ratio[0]), np.nan)
+                att = np.where(pool, cube.stat(ratio[1]), np.nan)
+                if per_game:
+                    made, att = _per_game(cube, made), _per_game(cube, att)
+                pool_pct = np.nansum(made, axis=1, keepdims=True) / np.nansum(att, axis=1, keepdims=True)
+                x = np.where(att > 0, att * (made / att - pool_pct), 0.0)
+            else:
+                x = category_values(cube, stat_id, per_game)
+            z[:, :, c] = sign * _standardise(x, pool)
+    total = np.where(pool, np.nansum(z, axis=2), np.nan).astype(np.float32)
+    return z, total
+
+
+def points(cube: StatCube, weights: Dict[int, float] = DEFAULT_POINTS, per_game: bool = False) -> np.ndarray:
+    """Points-league score per [date, player]: sum of weight * stat."""
+    total = np.zeros(cube.shape[:2], dtype=np.float32)
+    for stat_id, w in weights.items():
+        if cube.has(stat_id):
+            total += np.float32(w) * np.nan_to_num(cube.stat(stat_id))
+    return _per_game(cube, total) if per_game else total
+
+
+def score_table(cube: StatCube, categories: Dict[int, int] = NINE_CAT,
+                weights: Dict[int, float] = DEFAULT_POINTS, per_game: bool = False) -> pa.Table:
+    """Long table: one row per (date, pooled player) with z_<cat>, z_total and fantasy_points."""
+    z, total = zscores(cube, categories, per_game)
+    fp = points(cube, weights, per_game)
+    d_idx, p_idx = np.nonzero(~np.isnan(total))
+
+    cols = {
+        "snapshot_date": pa.array(cube.dates[d_idx], pa.date32()),
+        "player_key": pa.DictionaryArray.from_arrays(
+            pa.array(p_idx, pa.int32()), pa.array(cube.players, pa.string())
+        ),
+    }
+    for c, stat_id in enumerate(categories):
+        cols[f"z_{STAT_NAMES.get(stat_id, stat_id)}"] = pa.array(z[d_idx, p_idx, c])
+    cols["z_total"] = pa.array(total[d_idx, p_idx])
+    cols["fantasy_points"] = pa.array(fp[d_idx, p_idx].astype(np.float32))
+    return pa.table(cols)
+
+
+def parse_weights(spec: str) -> Dict[int, float]:
+    """'12=1,15=1.2,19=-1' -> {12: 1.0, 15: 1.2, 19: -1.0}"""
+    weights = {}
+    for part in spec.split(","):
+        if part.strip():
+            k, v = part.split("=", 1)
+            weights[int(k)] = float(v)
+    return weights
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Score every snapshot in one vectorised pass")
+    ap.add_argument("--from", dest="date_from")
+    ap.add_argument("--to", dest="date_to")
+    ap.add_argument("--per-game", action="store_true", help="score per-game averages instead of totals")
+    ap.add_argument("--weights", help="points weights as stat_id=weight,... (default: Yahoo's)")
+    ap.add_argument("--out", default="fact_player_scores.parquet")
+    ap.add_argument("--top", type=int, default=10, help="print the top N on the latest date")
+    args = ap.parse_args(argv)
+
+    weights = parse_weights(args.weights) if args.weights else DEFAULT_POINTS
+    cube = load_cube(args.date_from, args.date_to)
+    if not cube.players:
+        logging.warning("No snapshot rows in range — nothing to score")
+        return 1
+    logging.info("Loaded %d dates x %d players x %d stats", *cube.shape)
+
+    table = score_table(cube, weights=weights, per_game=args.per_game)
+    pq.write_table(table, args.out, compression="snappy")
+    logging.info("Wrote %d rows to %s", table.num_rows, args.out)
+
+    if args.top:
+        latest = table.filter(pc.equal(table["snapshot_date"], table["snapshot_date"][-1]))
+        top = latest.sort_by([("z_total", "descending")]).slice(0, args.top)
+        for r in top.select(["player_key", "z_total", "fantasy_points"]).to_pylist():
+            print(f"{r['player_key']:14s} z={r['z_total']:7.2f}  fp={r['fantasy_points']:8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+# snapshot_delta.py
+"""
+Change-data-capture storage for player season snapshots.
+
+Instead of rewriting a full day file every hour, delta mode
+(SNAPSHOT_MODE=delta in fetch_player_season_snapshot.py) keeps:
+
+    data/snapshot_deltas/checkpoint_YYYY-MM-DD.parquet   full state, every CHECKPOINT_DAYS
+    data/snapshot_deltas/delta_YYYY-MM-DD.parquet        rows that changed that day
+
+Both use the v2 schema (snapshot_schema.py); delta files add a `deleted`
+flag. Each run diffs the fetched rows against the last known state and
+appends only new or changed (player_key, stat_id) values, plus a
+tombstone (deleted=True, null values) for every key that disappeared;
+when nothing changed nothing is written. A checkpoint is the state after
+the run, i.e. the fetched rows themselves. rebuild_day() reconstructs a
+day's full state from the nearest checkpoint plus the deltas after it.
+
+A player that was requested but not fetched (a failed batch) keeps its
+last known values; a player no longer requested at all (dropped from
+league_players.csv) is tombstoned.
+"""
+
+import os
+import re
+import logging
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from snapshot_store import HOT_ROW_GROUP_ROWS, daily_files
+from snapshot_schema import SCHEMA_V2, to_v2, read_snapshot, write_snapshot, sort_snapshot
+from metrics import timed
+
+DELTA_DIR = "data/snapshot_deltas"
+CHECKPOINT_DAYS = int(os.environ.get("SNAPSHOT_CHECKPOINT_DAYS", "7"))
+
+KEY = ["player_key", "stat_id"]
+VALUE_COLUMNS = ["stat_value", "stat_made", "stat_attempted"]
+DELETED = "deleted"
+
+_FILE_RE = re.compile(r"^(checkpoint|delta)_(\d{4}-\d{2}-\d{2})\.parquet$")
+
+
+def _files(kind: str, delta_dir: str) -> Dict[str, str]:
+    if not os.path.isdir(delta_dir):
+        return {}
+    out = {}
+    for name in os.listdir(delta_dir):
+        m = _FILE_RE.match(name)
+        if m and m.group(1) == kind:
+            out[m.group(2)] = os.path.join(delta_dir, name)
+    return dict(sorted(out.items()))
+
+
+def checkpoints(delta_dir: str = DELTA_DIR) -> Dict[str, str]:
+    return _files("checkpoint", delta_dir)
+
+
+def deltas(delta_dir: str = DELTA_DIR) -> Dict[str, str]:
+    return _files("delta", delta_dir)
+
+
+def flagged(table: pa.Table, deleted: bool = False) -> pa.Table:
+    """A v2 table with a constant `deleted` column."""
+    table = to_v2(table)
+    return table.append_column(DELETED, pa.array([deleted] * table.num_rows, pa.bool_()))
+
+
+def read_delta(path: str) -> pa.Table:
+    """A delta file as v2 plus its `deleted` flag (all False in files written before tombstones)."""
+    raw = pq.read_table(path)
+    if DELETED not in raw.schema.names:
+        return flagged(raw)
+    return to_v2(raw).append_column(DELETED, raw.column(DELETED).fill_null(False))
+
+
+@timed("write")
+def write_delta_file(table: pa.Table, path: str):
+    """Atomically write flagged delta rows, sorted like a snapshot."""
+    tmp = path + ".tmp"
+    pq.write_table(sort_snapshot(table), tmp, compression="snappy", row_group_size=HOT_ROW_GROUP_ROWS)
+    os.replace(tmp, path)
+
+
+def latest_values(table: pa.Table) -> pa.Table:
+    """
+    Last write (by snapshot_ts) wins per (player_key, stat_id); keys whose
+    last write is a tombstone are dropped. Returns v2.
+    """
+    if table.num_rows == 0:
+        return to_v2(table)
+    df = table.to_pandas()
+    df = df.sort_values("snapshot_ts", kind="stable").drop_duplicates(KEY, keep="last")
+    if DELETED in df.columns:
+        df = df[~df[DELETED].astype(bool)]
+    return to_v2(df)
+
+
+def rebuild_day(snapshot_date: str, delta_dir: str = DELTA_DIR) -> Optional[pa.Table]:
+    """
+    Full (player_key, stat_id) state as of the end of snapshot_date, or None
+    if no checkpoint precedes it. snapshot_ts on each row is the run that
+    last changed that value; snapshot_date is set to the requested day.
+    """
+    base = [d for d in checkpoints(delta_dir) if d <= snapshot_date]
+    if not base:
+        return None
+    cp_date = base[-1]
+    cp = read_snapshot(checkpoints(delta_dir)[cp_date])
+
+    parts = [flagged(cp)]
+    for d, path in deltas(delta_dir).items():
+        if cp_date <= d <= snapshot_date:
+            parts.append(read_delta(path))
+
+    state = latest_values(pa.concat_tables(parts))
+    day = pa.array([date.fromisoformat(snapshot_date)] * state.num_rows, pa.date32())
+    return state.set_column(state.schema.get_field_index("snapshot_date"), "snapshot_date", day)
+
+
+def last_known_state(delta_dir: str = DELTA_DIR, snapshot_dir: Optional[str] = None) -> Optional[pa.Table]:
+    """Latest state from the delta store, else the newest full daily file."""
+    cps, ds = checkpoints(delta_dir), deltas(delta_dir)
+    if cps:
+        newest = max([*cps, *ds])
+        return rebuild_day(newest, delta_dir)
+    files = daily_files(snapshot_dir) if snapshot_dir else {}
+    if files:
+        return read_snapshot(files[max(files)])
+    return None
+
+
+def changed_rows(state: Optional[pa.Table], new: pa.Table) -> pa.Table:
+    """Rows of `new` whose (player_key, stat_id) is unknown or whose value differs."""
+    new = to_v2(new)
+    if state is None or state.num_rows == 0:
+        return new
+
+    cur = state.select(KEY + VALUE_COLUMNS).to_pandas()
+    cur["player_key"] = cur["player_key"].astype(str)
+    df = new.to_pandas()
+    df["player_key"] = df["player_key"].astype(str)
+
+    merged = df.merge(cur, on=KEY, how="left", suffixes=("", "_old"), indicator=True)
+    changed = merged["_merge"] == "left_only"
+    for c in VALUE_COLUMNS:
+        a, b = merged[c], merged[f"{c}_old"]
+        changed |= ~((a == b) | (a.isna() & b.isna()))
+
+    return to_v2(merged.loc[changed.to_numpy(), [f.name for f in SCHEMA_V2]])
+
+
+def removed_rows(state: Optional[pa.Table], new: pa.Table,
+                 players: Optional[Iterable[str]] = None) -> pa.Table:
+    """
+    Tombstones (flagged deleted, null values, stamped with the run's
+    snapshot_ts) for keys of `state` missing from `new`. With `players`, the
+    keys that were requested, a requested player absent from `new` is
+    treated as not fetched and keeps its state; otherwise it's removed.
+    """
+    new = to_v2(new)
+    if state is None or state.num_rows == 0 or new.num_rows == 0:
+        return flagged(SCHEMA_V2.empty_table(), deleted=True)
+
+    cur = state.select(KEY).to_pandas()
+    cur["player_key"] = cur["player_key"].astype(str)
+    got = new.select(KEY).to_pandas()
+    got["player_key"] = got["player_key"].astype(str)
+
+    gone = (cur.merge(got, on=KEY, how="left", indicator=True)["_merge"] == "left_only").to_numpy()
+    if players is not None:
+        requested = set(players)
+        fetched = set(got["player_key"])
+        keep = cur["player_key"].isin(requested) & ~cur["player_key"].isin(fetched)
+        gone = gone & ~keep.to_numpy()
+
+    rows = cur.loc[gone].reset_index(drop=True)
+    n = len(rows)
+    tombstones = pa.table({
+        "snapshot_ts": pa.array([pc.max(new.column("snapshot_ts")).as_py()] * n, SCHEMA_V2.field("snapshot_ts").type),
+        "snapshot_date": pa.array([pc.max(new.column("snapshot_date")).as_py()] * n, pa.date32()),
+        "player_key": pa.array(rows["player_key"].tolist(), pa.string()),
+        "stat_id": pa.array(rows["stat_id"].tolist(), pa.int32()),
+        "stat_value": pa.nulls(n, pa.float32()),
+        "stat_made": pa.nulls(n, pa.int32()),
+        "stat_attempted": pa.nulls(n, pa.int32()),
+    })
+    return flagged(tombstones, deleted=True)
+
+
+def write_delta(new: pa.Table, snapshot_date: str, delta_dir: str = DELTA_DIR,
+                snapshot_dir: Optional[str] = None, checkpoint_days: int = CHECKPOINT_DAYS,
+                players: Optional[Iterable[str]] = None) -> Dict:
+    """
+    Record a run. Writes a checkpoint when the last one is checkpoint_days
+    old (or missing), otherwise appends changed rows and tombstones to the
+    day's delta file. `players` (the requested player keys) is passed to
+    removed_rows(). Returns {"changed": n, "removed": n, "written": path
+    or None, "kind": ...}.
+    """
+    os.makedirs(delta_dir, exist_ok=True)
+    state = last_known_state(delta_dir, snapshot_dir)
+    changed = changed_rows(state, new)
+    removed = removed_rows(state, new, players)
+
+    cps = checkpoints(delta_dir)
+    last_cp = max(cps) if cps else None
+    due = last_cp is None or (
+        date.fromisoformat(snapshot_date) - date.fromisoformat(last_cp)
+    ).days >= checkpoint_days
+
+    if due:
+        # The state after this run: the fetched rows, plus the last known
+        # values of requested players that weren't fetched
+        base = [flagged(state)] if state is not None else []
+        full = latest_values(pa.concat_tables(base + [flagged(changed), removed]))
+        path = os.path.join(delta_dir, f"checkpoint_{snapshot_date}.parquet")
+        write_snapshot(full, path)
+        logging.info("Checkpoint: %d rows (%d changed, %d removed) -> %s",
+                     full.num_rows, changed.num_rows, removed.num_rows, path)
+        return {"changed": changed.num_rows, "removed": removed.num_rows, "written": path, "kind": "checkpoint"}
+
+    if changed.num_rows == 0 and removed.num_rows == 0:
+        logging.info("No stat changes since last snapshot — nothing written")
+        return {"changed": 0, "removed": 0, "written": None, "kind": "delta"}
+
+    rows = pa.concat_tables([flagged(changed), removed])
+    path = os.path.join(delta_dir, f"delta_{snapshot_date}.parquet")
+    if os.path.exists(path):
+        rows = pa.concat_tables([read_delta(path), rows])
+    write_delta_file(rows, path)
+    logging.info("Delta: %d changed, %d removed rows -> %s", changed.num_rows, removed.num_rows, path)
+    return {"changed": changed.num_rows, "removed": removed.num_rows, "written": path, "kind": "delta"}
@@ -0,0 +1,246 @@
+# snapshot_query.py
+"""
+Read-side access to the player season snapshots.
+
+    from snapshot_query import load_series
+    t = load_series(["466.p.3704"], stat_ids=[12], date_from="2026-03-01")
+
+A small persisted index records, for every snapshot file (compacted
+partitions and hot daily files) and each of its row groups, the min/max
+snapshot_date, player_key and stat_id. Queries use it to open only the
+files and row groups that can match, then apply the exact filters in
+pyarrow. The index refreshes itself for files whose size/mtime changed.
+Days held only in the change-data-capture store (SNAPSHOT_MODE=delta,
+snapshot_delta.py) are not in the index; they are rebuilt with
+snapshot_delta.rebuild_day when the date range includes them.
+Results use the v2 schema (snapshot_schema.py) whatever the file version.
+"""
+
+import os
+import json
+import bisect
+import logging
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from snapshot_store import SNAPSHOT_DIR, DATASET_DIR, daily_files, load_manifest
+from snapshot_schema import SCHEMA_V2, to_v2, sort_snapshot
+from snapshot_delta import DELTA_DIR, checkpoints, deltas, rebuild_day
+
+INDEX_PATH = "data/.snapshot_index.json"
+INDEX_VERSION = 1
+STAT_COLUMNS = ("snapshot_date", "player_key", "stat_id")
+DEFAULT_COLUMNS = ["snapshot_date", "player_key", "stat_id", "stat_value", "stat_made", "stat_attempted"]
+
+
+def _minmax(stats):
+    if stats is None or not stats.has_min_max:
+        return None, None
+    lo, hi = stats.min, stats.max
+    if isinstance(lo, bytes):
+        lo, hi = lo.decode("utf-8"), hi.decode("utf-8")
+    elif hasattr(lo, "isoformat"):
+        lo, hi = lo.isoformat(), hi.isoformat()
+    return lo, hi
+
+
+def _file_entry(path: str) -> Dict:
+    """Row-group level min/max for snapshot_date, player_key and stat_id."""
+    st = os.stat(path)
+    meta = pq.ParquetFile(path).metadata
+    names = [meta.schema.column(i).name for i in range(meta.num_columns)]
+    cols = {c: names.index(c) for c in STAT_COLUMNS if c in names}
+
+    row_groups = []
+    for i in range(meta.num_row_groups):
+        rg = meta.row_group(i)
+        entry = {"rows": rg.num_rows}
+        for c, idx in cols.items():
+            entry[c] = list(_minmax(rg.column(idx).statistics))
+        row_groups.append(entry)
+
+    dates = [d for rg in row_groups for d in rg.get("snapshot_date", [None, None]) if d]
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "min_date": min(dates) if dates else None,
+        "max_date": max(dates) if dates else None,
+        "row_groups": row_groups,
+    }
+
+
+def snapshot_sources(snapshot_dir: str = SNAPSHOT_DIR, dataset_dir: str = DATASET_DIR) -> List[str]:
+    """Every file holding snapshot rows: compacted partitions plus not-yet-compacted days."""
+    manifest = load_manifest(dataset_dir)
+    paths = [os.path.join(dataset_dir, p["file"]) for _, p in sorted(manifest["partitions"].items())]
+    compacted = manifest["sources"]
+    paths += [path for d, path in daily_files(snapshot_dir).items() if d not in compacted]
+    return [p for p in paths if os.path.exists(p)]
+
+
+def cdc_days(snapshot_dir: str = SNAPSHOT_DIR, dataset_dir: str = DATASET_DIR,
+             delta_dir: str = DELTA_DIR) -> Dict[str, List[str]]:
+    """
+    Days only the CDC store holds (no hot file, not compacted) -> the
+    checkpoint and delta files rebuild_day reads for them. Days before the
+    first checkpoint cannot be rebuilt and are left out.
+    """
+    covered = set(daily_files(snapshot_dir)) | set(load_manifest(dataset_dir)["sources"])
+    cps, ds = checkpoints(delta_dir), deltas(delta_dir)
+    out = {}
+    for d in sorted(set(cps) | set(ds)):
+        base = [c for c in cps if c <= d]
+        if d in covered or not base:
+            continue
+        out[d] = [cps[base[-1]]] + [p for day, p in ds.items() if base[-1] <= day <= d]
+    return out
+
+
+def build_index(snapshot_dir: str = SNAPSHOT_DIR, dataset_dir: str = DATASET_DIR,
+                index_path: Optional[str] = INDEX_PATH) -> Dict:
+    """
+    Load the persisted index and refresh entries for new or changed files.
+    Pass index_path=None to build in memory only.
+    """
+    index = {"version": INDEX_VERSION, "files": {}}
+    if index_path and os.path.exists(index_path):
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                loaded = json.load(f)
+            if loaded.get("version") == INDEX_VERSION:
+                index = loaded
+        except (OSError, ValueError):
+            pass
+
+    files = {}
+    changed = False
+    for path in snapshot_sources(snapshot_dir, dataset_dir):
+        st = os.stat(path)
+        entry = index["files"].get(path)
+        if not entry or entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+            entry = _file_entry(path)
+            changed = True
+        files[path] = entry
+    changed = changed or set(files) != set(index["files"])
+    index["files"] = files
+
+    if changed and index_path:
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        tmp = index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp, index_path)
+        logging.debug("Snapshot index refreshed: %d files", len(files))
+    return index
+
+
+def _overlaps(lo, hi, wanted_sorted) -> bool:
+    """True if any value of wanted_sorted lies within [lo, hi]."""
+    if lo is None or hi is None:
+        return True
+    i = bisect.bisect_left(wanted_sorted, lo)
+    return i < len(wanted_sorted) and wanted_sorted[i] <= hi
+
+
+def _range_overlaps(lo, hi, date_from, date_to) -> bool:
+    if lo is None or hi is None:
+        return True
+    return (date_to is None or lo <= date_to) and (date_from is None or hi >= date_from)
+
+
+def plan(index: Dict, player_keys=None, stat_ids=None, date_from=None, date_to=None) -> Dict[str, List[int]]:
+    """Map file path -> row groups that may contain matching rows."""
+    keys = sorted(player_keys) if player_keys is not None else None
+    stats = sorted(stat_ids) if stat_ids is not None else None
+    selected = {}
+    for path, entry in index["files"].items():
+        if not _range_overlaps(entry["min_date"], entry["max_date"], date_from, date_to):
+            continue
+        rgs = []
+        for i, rg in enumerate(entry["row_groups"]):
+            if not _range_overlaps(*rg.get("snapshot_date", [None, None]), date_from, date_to):
+                continue
+            if keys is not None and not _overlaps(*rg.get("player_key", [None, None]), keys):
+                continue
+            if stats is not None and not _overlaps(*rg.get("stat_id", [None, None]), stats):
+                continue
+            rgs.append(i)
+        if rgs:
+            selected[path] = rgs
+    return selected
+
+
+def _mask(t: pa.Table, player_keys, stat_ids, date_from, date_to):
+    """Exact row filter; works on both v1 (string) and v2 (typed) columns."""
+    conds = []
+    if player_keys is not None:
+        col = t["player_key"]
+        if pa.types.is_dictionary(col.type):
+            col = col.cast(col.type.value_type)
+        conds.append(pc.is_in(col, value_set=pa.array(player_keys, col.type)))
+    if stat_ids is not None:
+        conds.append(pc.is_in(t["stat_id"], value_set=pa.array(stat_ids, t["stat_id"].type)))
+    if date_from is not None or date_to is not None:
+        col = t["snapshot_date"]
+        as_date = pa.types.is_date(col.type)
+        if date_from is not None:
+            lo = pa.scalar(date.fromisoformat(date_from), col.type) if as_date else date_from
+            conds.append(pc.greater_equal(col, lo))
+        if date_to is not None:
+            hi = pa.scalar(date.fromisoformat(date_to), col.type) if as_date else date_to
+            conds.append(pc.less_equal(col, hi))
+    mask = None
+    for c in conds:
+        mask = c if mask is None else pc.and_(mask, c)
+    return mask
+
+
+def load_series(player_keys: Optional[Iterable[str]] = None,
+                stat_ids: Optional[Iterable[int]] = None,
+                date_from: Optional[str] = None,
+                date_to: Optional[str] = None,
+                columns: Optional[List[str]] = None,
+                snapshot_dir: str = SNAPSHOT_DIR,
+                dataset_dir: str = DATASET_DIR,
+                index_path: Optional[str] = INDEX_PATH,
+                sort: bool = True,
+                delta_dir: str = DELTA_DIR) -> pa.Table:
+    """
+    Snapshot rows for the given players / stats / inclusive ISO date range
+    (None = no filter), sorted by player_key, stat_id, snapshot_date unless
+    sort=False. Includes the days only the CDC store in `delta_dir` holds.
+    """
+    columns = list(columns or DEFAULT_COLUMNS)
+    player_keys = None if player_keys is None else [str(k) for k in player_keys]
+    stat_ids = None if stat_ids is None else [int(s) for s in stat_ids]
+
+    index = build_index(snapshot_dir, dataset_dir, index_path)
+
+    tables = []
+    for path, rgs in plan(index, player_keys, stat_ids, date_from, date_to).items():
+        t = pq.ParquetFile(path).read_row_groups(rgs)
+        mask = _mask(t, player_keys, stat_ids, date_from, date_to)
+        if mask is not None:
+            t = t.filter(mask)
+        if t.num_rows:
+            # Convert after filtering: v1 files only pay for the rows kept
+            tables.append(to_v2(t))
+
+    for d in cdc_days(snapshot_dir, dataset_dir, delta_dir):
+        if not _range_overlaps(d, d, date_from, date_to):
+            continue
+        t = rebuild_day(d, delta_dir)
+        mask = _mask(t, player_keys, stat_ids, None, None)
+        if mask is not None:
+            t = t.filter(mask)
+        if t.num_rows:
+            tables.append(t)
+
+    if not tables:
+        return SCHEMA_V2.empty_table().select(columns)
+    table = pa.concat_tables(tables)
+    return (sort_snapshot(table) if sort else table).select(columns)
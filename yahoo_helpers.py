@@ -45,3 +45,78 @@ def canonical_player_key(player_key, player_id):
     if player_id:
         return str(player_id)
     return None
+
+
+def game_id_from_league_key(league_key):
+    """
+    Game id prefix of a league key ("466.l.12345" -> "466")
+    """
+    if not league_key or ".l." not in str(league_key):
+        raise ValueError(f"Not a league key: {league_key!r}")
+    return str(league_key).split(".l.", 1)[0]
+
+
+class PlayerKeyIndex:
+    """
+    Resolve the key forms seen in our CSVs (player_key "466.p.3704",
+    bare player_id "3704", editorial "nba.p.3704", or a player_key from
+    another season's game) to one canonical "{game_id}.p.{player_id}".
+    """
+
+    def __init__(self, game_id):
+        self.game_id = str(game_id)
+        self._aliases = {}
+
+    def normalize(self, key):
+        """Canonical form of a single key, or None if it isn't recognisable"""
+        if not key:
+            return None
+        key = str(key).strip()
+        if key.isdigit():
+            return f"{self.game_id}.p.{key}"
+        prefix, sep, pid = key.rpartition(".p.")
+        if sep and pid.isdigit() and prefix:
+            return f"{self.game_id}.p.{pid}"
+        return None
+
+    def add(self, player_key=None, player_id=None, editorial_player_key=None):
+        """
+        Register one player's known keys; returns the canonical key
+        """
+        best = canonical_player_key(player_key, player_id) or editorial_player_key
+        canon = self.normalize(best)
+        if canon is None:
+            # Unrecognised form: fall back to any other form we were given
+            for k in (player_key, player_id, editorial_player_key):
+                canon = self.normalize(k)
+                if canon:
+                    break
+        if canon is None:
+            return None
+        for alias in (player_key, player_id, editorial_player_key):
+            if alias:
+                self._aliases[str(alias)] = canon
+        return canon
+
+    def resolve(self, key):
+        if not key:
+            return None
+        return self._aliases.get(str(key)) or self.normalize(key)
+
+    def dedupe(self, keys):
+        """
+        Canonical keys for `keys`, first occurrence order, duplicates and
+        unresolvable keys dropped. Returns (keys, n_duplicates, unresolved)
+        """
+        out, seen, unresolved = [], set(), []
+        dupes = 0
+        for k in keys:
+            canon = self.resolve(k)
+            if canon is None:
+                unresolved.append(k)
+            elif canon in seen:
+                dupes += 1
+            else:
+                seen.add(canon)
+                out.append(canon)
+        return out, dupes, unresolved
@@ -0,0 +1,458 @@
+# yahoo_stub.py
+"""
+Local stand-in for the Yahoo Fantasy API, served from recorded fixtures.
+
+    python yahoo_stub.py serve [--port 8770] [--latency-ms 40] [--rate-429 0.02]
+    python yahoo_stub.py record          # live API -> fixtures (needs oauth2.json, LEAGUE_KEY)
+    python yahoo_stub.py synthesize      # local CSVs + newest snapshot -> fixtures
+
+    YAHOO_API_ROOT=http://127.0.0.1:8770/fantasy/v2 YAHOO_OFFLINE=1 \\
+        LEAGUE_KEY=<fixture league> python fetch_players.py
+
+Fixtures live in fixtures/yahoo/ as gzipped JSON, kept in Yahoo's own
+node shapes so a recording and a synthesized set look the same:
+
+    league.json.gz    {"league_key", "name", "season"}
+    players.json.gz   [player meta fragment list, ...] in league order
+    teams.json.gz     [team node list ([meta], {"roster"}, {"team_standings"}), ...]
+    stats.json.gz     {player_key: {"player_stats": {...}}}
+
+The server rebuilds the envelopes for the endpoints the fetch scripts use
+(league players pages, league teams with or without rosters/standings,
+team roster, batched and single-player stats), enforces Yahoo's 25-item
+page size, and can add latency and random 429s with Retry-After. The
+fixtures hold one snapshot, so player/{key}/stats;date=... gets the
+season stats, while batched stats;type=date requests (backfill.py) get
+a made-up box score: the player's rounded season averages on about half
+of the days and "-" on the rest.
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import hashlib
+import argparse
+import logging
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from http_helpers import API_ROOT, safe_get, yahoo_session
+from yahoo_utils import as_list, find_all, merge_fragments, players_by_key
+from backfill import DERIVED
+from scoring import GP
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+FIXTURE_DIR = "fixtures/yahoo"
+FIXTURE_FILES = ("league", "players", "teams", "stats")
+PAGE_SIZE = 25
+PREFIX = "/fantasy/v2"
+
+
+# ---------------- Fixtures ----------------
+def save_fixtures(fixtures: Dict, out_dir: str = FIXTURE_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    for name in FIXTURE_FILES:
+        path = os.path.join(out_dir, f"{name}.json.gz")
+        # mtime=0 keeps the gzip bytes stable across identical recordings
+        with open(path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            f.write(json.dumps(fixtures[name], separators=(",", ":"), sort_keys=True).encode("utf-8"))
+    logging.info("Saved fixtures to %s: %d players, %d teams, %d stat lines",
+                 out_dir, len(fixtures["players"]), len(fixtures["teams"]), len(fixtures["stats"]))
+
+
+def load_fixtures(fixture_dir: str = FIXTURE_DIR) -> Dict:
+    out = {}
+    for name in FIXTURE_FILES:
+        with gzip.open(os.path.join(fixture_dir, f"{name}.json.gz"), "rb") as f:
+            out[name] = json.loads(f.read())
+    return out
+
+
+def record(session, league_key: str, out_dir: str = FIXTURE_DIR) -> Dict:
+    """Capture fixtures from the live API (serially, through safe_get)."""
+    players = []
+    start = 0
+    while True:
+        _, data = safe_get(session, f"{API_ROOT}/league/{league_key}/players;start={start};count={PAGE_SIZE}?format=json")
+        league = as_list(data.get("fantasy_content", {}).get("league"))
+        page = [as_list(p)[0] for p in find_all(league[1:], "player")]
+        if not page:
+            break
+        players.extend(page)
+        start += PAGE_SIZE
+
+    _, data = safe_get(session, f"{API_ROOT}/league/{league_key}/teams;out=roster,standings?format=json")
+    league = as_list(data["fantasy_content"]["league"])
+    teams = [as_list(t) for t in find_all(league[1], "team")]
+    meta = merge_fragments(league[:1])
+
+    stats = {}
+    keys = [merge_fragments(p).get("player_key") for p in players]
+    for i in range(0, len(keys), PAGE_SIZE):
+        batch = keys[i:i + PAGE_SIZE]
+        _, data = safe_get(session, f"{API_ROOT}/players;player_keys={','.join(batch)};out=stats?format=json")
+        for pk, nodes in players_by_key(data.get("fantasy_content", {}).get("players")).items():
+            if len(nodes) > 1:
+                stats[pk] = nodes[1]
+
+    fixtures = {
+        "league": {"league_key": league_key, "name": meta.get("name"), "season": meta.get("season")},
+        "players": players,
+        "teams": teams,
+        "stats": stats,
+    }
+    save_fixtures(fixtures, out_dir)
+    return fixtures
+
+
+def _stat_text(value) -> str:
+    """Render a float the way Yahoo does: "-" when empty, ".388" for ratios."""
+    if value is None or value != value:
+        return "-"
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:.3f}".lstrip("0") if 0 < value < 1 else f"{value:.3f}"
+
+
+def synthesize(players_csv: str = "league_players.csv", rosters_csv: str = "team_rosters.csv",
+               out_dir: str = FIXTURE_DIR) -> Dict:
+    """Fixtures in Yahoo's shapes from league_players.csv, team_rosters.csv and the newest snapshot."""
+    import csv
+    from snapshot_store import daily_files, season_of
+    from snapshot_schema import read_snapshot
+
+    with open(players_csv, newline="", encoding="utf-8") as f:
+        csv_players = [r for r in csv.DictReader(f) if r.get("player_key")]
+    with open(rosters_csv, newline="", encoding="utf-8") as f:
+        roster_rows = list(csv.DictReader(f))
+    positions = {r["player_key"]: r["position"] for r in roster_rows}
+
+    def player_meta(key, pid, editorial, name):
+        first, _, last = (name or "").partition(" ")
+        frags = [
+            {"player_key": key},
+            {"player_id": pid},
+            {"name": {"full": name, "first": first, "last": last, "ascii_first": first, "ascii_last": last}},
+            {"editorial_player_key": editorial},
+        ]
+        if key in positions:
+            frags.append({"display_position": positions[key]})
+            frags.append({"eligible_positions": [{"position": p} for p in positions[key].split(",")]})
+        return frags + [[]]
+
+    players = [player_meta(p["player_key"], p.get("player_id"), p.get("editorial_player_key"), p.get("player_name"))
+               for p in csv_players]
+
+    by_team: Dict[str, List[Dict]] = {}
+    for r in roster_rows:
+        by_team.setdefault(r["team_key"], []).append(r)
+    teams = []
+    for rank, (team_key, rows) in enumerate(sorted(by_team.items()), start=1):
+        roster_players = {str(i): {"player": [
+            player_meta(r["player_key"], r["player_key"].rpartition(".p.")[2],
+                        "nba.p." + r["player_key"].rpartition(".p.")[2], r["player_name"]),
+            {"selected_position": [{"coverage_type": "date"}, {"position": r["position"].split(",")[0]}]},
+        ]} for i, r in enumerate(rows)}
+        roster_players["count"] = len(rows)
+        wins = 10 * (len(by_team) - rank)
+        teams.append([
+            [{"team_key": team_key}, {"team_id": team_key.rpartition(".t.")[2]}, {"name": rows[0]["team_name"]}],
+            {"roster": {"coverage_type": "date", "0": {"players": roster_players}}},
+            {"team_standings": {"rank": rank, "games_back": "-" if rank == 1 else str(rank * 5),
+                                "outcome_totals": {"wins": wins, "losses": 10 * rank, "ties": 0,
+                                                   "percentage": f"{wins / (wins + 10 * rank):.3f}"}}},
+        ])
+
+    files = daily_files()
+    stats = {}
+    season = None
+    if files:
+        newest = max(files)
+        season = season_of(newest)[:4]    # Yahoo names a season by its first year
+        lines: Dict[str, List] = {}
+        t = read_snapshot(files[newest])
+        for pk, stat_id, value in zip(t["player_key"].to_pylist(), t["stat_id"].to_pylist(),
+                                      t["stat_value"].to_pylist()):
+            lines.setdefault(pk, []).append((stat_id, value))
+        for pk, pairs in lines.items():
+            stats[pk] = {"player_stats": {
+                "0": {"coverage_type": "season", "season": season},
+                "stats": [{"stat": {"stat_id": str(s), "value": _stat_text(v)}} for s, v in sorted(pairs)],
+            }}
+
+    league_key = teams[0][0][0]["team_key"].rpartition(".t.")[0] if teams else "0.l.0"
+    fixtures = {
+        "league": {"league_key": league_key, "name": "Fixture league", "season": season},
+        "players": players,
+        "teams": teams,
+        "stats": stats,
+    }
+    save_fixtures(fixtures, out_dir)
+    return fixtures
+
+
+# ---------------- Stub server ----------------
+class StubStats:
+    """Thread-safe request counters, readable while the server runs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = Counter()
+        self.throttled = 0
+        self.bytes_sent = 0
+
+    def record(self, route: str, status: int, size: int):
+        with self._lock:
+            self.routes[route] += 1
+            self.bytes_sent += size
+            if status == 429:
+                self.throttled += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {"requests": sum(self.routes.values()), "throttled": self.throttled,
+                    "bytes_sent": self.bytes_sent, "routes": dict(self.routes)}
+
+
+def _matrix(params: Optional[str]) -> Dict[str, str]:
+    """';status=T;start=25;count=25' -> {"status": "T", "start": "25", "count": "25"}"""
+    out = {}
+    for part in (params or "").split(";"):
+        k, sep, v = part.partition("=")
+        if sep:
+            out[k] = v
+    return out
+
+
+class YahooStub:
+    """Builds API responses from fixtures; one instance is shared by all handler threads."""
+
+    ROUTES = [
+        (re.compile(r"^/league/(?P<league>[^/;]+)/players(?P<params>;[^/]*)?$"), "league_players"),
+        (re.compile(r"^/league/(?P<league>[^/;]+)/teams(?P<params>;[^/]*)?$"), "league_teams"),
+        (re.compile(r"^/team/(?P<team>[^/;]+)/roster(?P<params>;[^/]*)?$"), "team_roster"),
+        (re.compile(r"^/players;player_keys=(?P<keys>[^;/]+)(?P<params>;[^/]*)?(/stats(?P<stats>;[^/]*)?)?$"),
+         "players_stats"),
+        (re.compile(r"^/player/(?P<player>[^/;]+)/stats(?P<params>;[^/]*)?$"), "player_stats"),
+    ]
+
+    def __init__(self, fixtures: Dict):
+        self.league = fixtures["league"]
+        self.players = fixtures["players"]
+        self.teams = fixtures["teams"]
+        self.stats = fixtures["stats"]
+        self.meta = {merge_fragments(p).get("player_key"): p for p in self.players}
+        self.rostered = {merge_fragments(p).get("player_key")
+                         for t in self.teams for p in find_all(self._sub(t, "roster"), "player")}
+        self.team_by_key = {merge_fragments(t[:1]).get("team_key"): t for t in self.teams}
+
+    @staticmethod
+    def _sub(team: List, *names: str) -> List:
+        """The team's subresource nodes ({"roster": ..}, {"team_standings": ..}) among `names`."""
+        return [n for n in team[1:] if isinstance(n, dict) and set(n) & set(names)]
+
+    def _box_score(self, pk: str, day: str) -> Dict:
+        """A deterministic made-up daily line for a type=date request."""
+        season = {}
+        for item in self.stats.get(pk, {}).get("player_stats", {}).get("stats", []):
+            s = item.get("stat", item)
+            try:
+                season[int(s["stat_id"])] = float(s.get("value"))
+            except (TypeError, ValueError):
+                season[int(s["stat_id"])] = float("nan")
+        gp = season.get(GP, float("nan"))
+        digest = hashlib.blake2b(f"{pk}/{day}".encode("utf-8"), digest_size=8).digest()
+        played = gp > 0 and int.from_bytes(digest, "big") / 2 ** 64 < 0.5
+        line = {sid: round(v / gp) if played and v == v else float("nan") for sid, v in season.items()}
+        for sid, (num, den) in DERIVED.items():
+            if sid in line:
+                n, d = line.get(num, float("nan")), line.get(den, float("nan"))
+                line[sid] = n / d if d > 0 else float("nan")
+        return {"player_stats": {
+            "0": {"coverage_type": "date", "date": day},
+            "stats": [{"stat": {"stat_id": str(sid), "value": _stat_text(v)}} for sid, v in sorted(line.items())],
+        }}
+
+    def _league_meta(self):
+        return [{"league_key": self.league["league_key"], "name": self.league.get("name"),
+                 "season": self.league.get("season")}]
+
+    def _collection(self, name: str, items: List) -> Dict:
+        body = {str(i): {name: item} for i, item in enumerate(items)}
+        body["count"] = len(items)
+        return body
+
+    def respond(self, path: str) -> Dict:
+        """JSON body for an API path (without the /fantasy/v2 prefix); raises LookupError -> 404."""
+        for pattern, route in self.ROUTES:
+            m = pattern.match(path)
+            if m:
+                break
+        else:
+            raise LookupError(f"no route for {path}")
+        args = m.groupdict()
+        params = _matrix(args.get("params"))
+        if args.get("league") and args["league"] != self.league["league_key"]:
+            raise LookupError(f"unknown league {args['league']}")
+
+        if route == "league_players":
+            status = params.get("status", "A")
+            players = self.players
+            if status == "T":
+                players = [p for p in players if merge_fragments(p).get("player_key") in self.rostered]
+            elif status in ("FA", "W"):
+                players = [] if status == "W" else [
+                    p for p in players if merge_fragments(p).get("player_key") not in self.rostered]
+            start = int(params.get("start", 0))
+            count = min(int(params.get("count", PAGE_SIZE)), PAGE_SIZE)
+            page = [[p] for p in players[start:start + count]]
+            # Yahoo sends an empty list, not an empty collection, past the end
+            body = self._collection("player", page) if page else []
+            return {"fantasy_content": {"league": [self._league_meta(), {"players": body}]}}
+
+        if route == "league_teams":
+            out = set(params.get("out", "").split(","))
+            names = ["roster"] * ("roster" in out) + ["team_standings"] * ("standings" in out)
+            teams = [[t[0]] + self._sub(t, *names) for t in self.teams]
+            return {"fantasy_content": {"league": [self._league_meta(), {"teams": self._collection("team", teams)}]}}
+
+        if route == "team_roster":
+            team = self.team_by_key.get(args["team"])
+            if team is None:
+                raise LookupError(f"unknown team {args['team']}")
+            return {"fantasy_content": {"team": [team[0]] + self._sub(team, "roster")}}
+
+        if route == "players_stats":
+            keys = args["keys"].split(",")[:PAGE_SIZE]
+            dated = _matrix(args.get("stats"))
+            if dated.get("type") == "date":
+                nodes = [[self.meta[k], self._box_score(k, dated.get("date", ""))] for k in keys if k in self.meta]
+            else:
+                nodes = [[self.meta[k], self.stats.get(k, {"player_stats": {"stats": []}})]
+                         for k in keys if k in self.meta]
+            return {"fantasy_content": {"players": self._collection("player", nodes)}}
+
+        pk = args["player"]
+        if pk not in self.meta:
+            raise LookupError(f"unknown player {pk}")
+        return {"fantasy_content": {"player": [self.meta[pk], self.stats.get(pk, {"player_stats": {"stats": []}})]}}
+
+
+def make_handler(stub: YahooStub, stats: StubStats, latency: float, jitter: float,
+                 rate_429: float, retry_after: float, seed: int):
+    attempts = Counter()
+    attempts_lock = threading.Lock()
+
+    def draw(*parts) -> float:
+        """Uniform [0, 1) from a hash, so a rerun sees the same delays and 429s whatever the thread order."""
+        digest = hashlib.blake2b(repr((seed,) + parts).encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") / 2 ** 64
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def _send(self, status: int, body: Dict, route: str, headers: Optional[Dict] = None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+            stats.record(route, status, len(data))
+
+        def do_GET(self):
+            url = urlsplit(self.path)    # not urlparse: it strips ";params"
+            path = url.path[len(PREFIX):] if url.path.startswith(PREFIX) else url.path
+            # Dated stats URLs change daily; leave the date out of the draw
+            key = re.sub(r";date=[^;?]*", "", self.path)
+            with attempts_lock:
+                attempts[key] += 1
+                attempt = attempts[key]
+            delay = max(0.0, latency + jitter * (2 * draw("latency", key, attempt) - 1))
+            throttle = draw("429", key, attempt) < rate_429
+            if delay:
+                time.sleep(delay)
+            if throttle:
+                self._send(429, {"error": {"description": "Request denied"}}, "throttled",
+                           {"Retry-After": f"{retry_after:g}"})
+                return
+            route = next((r for p, r in YahooStub.ROUTES if p.match(path)), "unknown")
+            try:
+                self._send(200, stub.respond(path), route)
+            except LookupError as e:
+                self._send(404, {"error": {"description": str(e)}}, route)
+
+        def log_message(self, fmt, *args):
+            logging.debug("%s " + fmt, self.address_string(), *args)
+
+    return Handler
+
+
+def serve(fixtures: Dict, host: str = "127.0.0.1", port: int = 8770, latency: float = 0.0,
+          jitter: float = 0.0, rate_429: float = 0.0, retry_after: float = 1.0,
+          seed: int = 0) -> ThreadingHTTPServer:
+    """A started-but-not-serving stub; `.stats` is its StubStats and `.api_root` its base URL."""
+    stats = StubStats()
+    handler = make_handler(YahooStub(fixtures), stats, latency, jitter, rate_429, retry_after,
+                           seed)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.stats = stats
+    server.api_root = f"http://{host}:{server.server_address[1]}{PREFIX}"
+    return server
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Local Yahoo Fantasy API stand-in")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("serve", help="serve the fixtures")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8770)
+    p.add_argument("--latency-ms", type=float, default=0.0)
+    p.add_argument("--jitter-ms", type=float, default=0.0)
+    p.add_argument("--rate-429", type=float, default=0.0, help="probability of a 429 per request")
+    p.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on a 429")
+    p.add_argument("--seed", type=int, default=0)
+    sub.add_parser("record", help="capture fixtures from the live API")
+    sub.add_parser("synthesize", help="build fixtures from local CSVs and snapshots")
+    for p in sub.choices.values():
+        p.add_argument("--fixtures", default=FIXTURE_DIR)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "record":
+        league_key = os.environ.get("LEAGUE_KEY")
+        if not league_key:
+            logging.error("LEAGUE_KEY env var not set")
+            return 2
+        record(yahoo_session(), league_key, args.fixtures)
+        return 0
+    if args.cmd == "synthesize":
+        synthesize(out_dir=args.fixtures)
+        return 0
+
+    fixtures = load_fixtures(args.fixtures)
+    server = serve(fixtures, args.host, args.port, args.latency_ms / 1e3, args.jitter_ms / 1e3,
+                   args.rate_429, args.retry_after, args.seed)
+    logging.info("Serving %s (league %s) at %s", args.fixtures, fixtures["league"]["league_key"], server.api_root)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info("Stub stats: %s", server.stats.snapshot())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,15 @@
 # yahoo_utils.py
 """Utilities to safely unwrap Yahoo Fantasy JSON shapes (lists of fragments)."""
 
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
+
+from metrics import timed
+from yahoo_extract import Extractor, find_records
+
+# Stat lists and keys of players;out=stats / player/{key}/stats nodes; see
+# bench_extract.py for the comparison with find_all
+_PLAYER_STATS = Extractor({"stats": "player_stats.stats.stat[*]"})
+_PLAYER_KEY = Extractor({"player_key": "player_key"})
 
 
 def as_list(x: Any) -> List[Any]:
@@ -35,3 +43,56 @@ def find_all(obj: Any, key: str) -> List[Any]:
         for item in obj:
             out.extend(find_all(item, key))
     return out
+
+
+@timed("parse")
+def player_stat_pairs(player_nodes: Any) -> List[Tuple[int, Any]]:
+    """
+    Extract (stat_id, value) pairs from a player node list shaped like
+    [ [meta fragments], {"player_stats": {...}} ], as returned by both
+    player/{key}/stats and players;player_keys=...;out=stats.
+    """
+    player_nodes = as_list(player_nodes)
+    if len(player_nodes) < 2:
+        return []
+
+    pairs = []
+    for stat_item in _PLAYER_STATS.extract(first_dict(player_nodes[1]))["stats"]:
+        s = first_dict(stat_item)
+        if s.get("stat_id") is None:
+            continue
+        pairs.append((int(s["stat_id"]), s.get("value")))
+    return pairs
+
+
+@timed("parse")
+def players_by_key(players_node: Any) -> Dict[str, List[Any]]:
+    """
+    Index a players collection ({"0": {"player": [...]}, ..., "count": n})
+    by player_key. Values are the player node lists.
+    """
+    out = {}
+    for player_nodes in find_records(players_node, "player"):
+        player_nodes = as_list(player_nodes)
+        key = _PLAYER_KEY.extract(player_nodes[:1])["player_key"]
+        if key is not None:
+            out[key] = player_nodes
+    return out
+
+
+def merge_fragments(x: Any) -> Dict:
+    """
+    Merge a Yahoo fragment list ([{"team_key": ..}, {"name": ..}, [..], ..])
+    into one dict. Nested lists are merged too; the first value seen for a
+    key wins.
+    """
+    out = {}
+    stack = [x]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for k, v in node.items():
+                out.setdefault(k, v)
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return out